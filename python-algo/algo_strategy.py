@@ -3,7 +3,6 @@ import random
 import math
 import warnings
 from sys import maxsize
-import json
 
 
 """
@@ -44,6 +43,8 @@ class AlgoStrategy(gamelib.AlgoCore):
         # This is a good place to do initial setup
         ENEMY_HEALTH = 30
         self.scored_on_locations = []
+        # Only action frames with breaches are decoded and passed to on_breach
+        self.subscribe_events(self.on_breach, "breach")
 
     def on_turn(self, turn_state):
         """
@@ -54,9 +55,12 @@ class AlgoStrategy(gamelib.AlgoCore):
         game engine.
         """
         game_state = gamelib.GameState(self.config, turn_state)
+        # Reuse the paths and threat maps computed in the background during the last action phase
+        self.warm_start(game_state)
 
         gamelib.debug_write('Performing turn {} of your custom algo strategy'.format(game_state.turn_number))
-        game_state.suppress_warnings(True)  #Comment or remove this line to enable warnings.
+        # Only the first few warnings of each kind are printed every turn, followed by a summary of the rest
+        #game_state.suppress_warnings(True)  #Uncomment this line to disable warnings.
         self.enemy_health_check(game_state)
         self.start_strategy_1(game_state)
         game_state.submit_turn()
@@ -126,8 +130,8 @@ class AlgoStrategy(gamelib.AlgoCore):
         
         
     def is_left_heavy(self, game_state):
-        left_unit_count = self.detect_enemy_unit(game_state, valid_x=[0, 1, 2, 3, 4, 5, 6, 7], valid_y=[14, 15, 16, 17])
-        right_unit_count = self.detect_enemy_unit(game_state, valid_x=[20, 21, 22, 23, 24, 25, 26, 27], valid_y=[14, 15, 16, 17])
+        left_unit_count = game_state.count_units(1, x_range=(0, 7), y_range=(14, 17), stationary=True)
+        right_unit_count = game_state.count_units(1, x_range=(20, 27), y_range=(14, 17), stationary=True)
         return left_unit_count > right_unit_count
           
           
@@ -154,25 +158,37 @@ class AlgoStrategy(gamelib.AlgoCore):
         estimate the path's damage risk.
         """
         damages = []
+        turret_damage = gamelib.GameUnit(TURRET, game_state.config).damage_i
         # Get the damage estimate each path will take
         for location in location_options:
             path = game_state.find_path_to_edge(location)
             damage = 0
             for path_location in path:
                 # Get number of enemy turrets that can attack each location and multiply by turret damage
-                damage += len(game_state.get_attackers(path_location, 0)) * gamelib.GameUnit(TURRET, game_state.config).damage_i
+                damage += len(game_state.get_attackers(path_location, 0)) * turret_damage
             damages.append(damage)
         
         # Now just return the location that takes the least damage
         return location_options[damages.index(min(damages))]
 
     def detect_enemy_unit(self, game_state, unit_type=None, valid_x = None, valid_y = None):
+        ranges = []
+        for values in (valid_x, valid_y):
+            if values is None:
+                ranges.append(None)
+            elif values and len(set(values)) == max(values) - min(values) + 1:
+                ranges.append((min(values), max(values)))
+            else:
+                break
+        else:
+            # Rectangles of the board are answered by the unit index of game_state
+            return game_state.count_units(1, unit_type, ranges[0], ranges[1], stationary=True)
+
         total_units = 0
-        for location in game_state.game_map:
-            if game_state.contains_stationary_unit(location):
-                for unit in game_state.game_map[location]:
-                    if unit.player_index == 1 and (unit_type is None or unit.unit_type == unit_type) and (valid_x is None or location[0] in valid_x) and (valid_y is None or location[1] in valid_y):
-                        total_units += 1
+        # Only visits the tiles holding an enemy structure
+        for location in game_state.game_map.structure_locations(1, unit_type):
+            if (valid_x is None or location[0] in valid_x) and (valid_y is None or location[1] in valid_y):
+                total_units += 1
         return total_units
         
     def filter_blocked_locations(self, locations, game_state):
@@ -182,25 +198,19 @@ class AlgoStrategy(gamelib.AlgoCore):
                 filtered.append(location)
         return filtered
 
-    def on_action_frame(self, turn_string):
+    def on_breach(self, frame):
         """
-        This is the action frame of the game. This function could be called 
-        hundreds of times per turn and could slow the algo down so avoid putting slow code here.
+        This is called for the action frames of the game that have breaches. Action frames 
+        come hundreds of times per turn and could slow the algo down so avoid putting slow code here.
         Processing the action frames is complicated so we only suggest it if you have time and experience.
         Full doc on format of a game frame at in json-docs.html in the root of the Starterkit.
         """
         # Let's record at what position we get scored on
-        state = json.loads(turn_string)
-        events = state["events"]
-        breaches = events["breach"]
-        for breach in breaches:
-            location = breach[0]
-            unit_owner_self = True if breach[4] == 1 else False
-            # When parsing the frame data directly, 
-            # 1 is integer for yourself, 2 is opponent (StarterKit code uses 0, 1 as player_index instead)
-            if not unit_owner_self:
-                gamelib.debug_write("Got scored on at: {}".format(location))
-                self.scored_on_locations.append(location)
+        for breach in frame.breaches:
+            # player_index is 0 for yourself and 1 for the opponent, the raw frame uses 1 and 2
+            if breach.player_index == 1:
+                gamelib.debug_write("Got scored on at: {}".format(breach.location))
+                self.scored_on_locations.append(breach.location)
                 gamelib.debug_write("All locations: {}".format(self.scored_on_locations))
 
 
@@ -16,14 +16,43 @@ Investigating it is useful for advanced players interested in getting data from
 The Navigation class in navigation.py contains functions related to path-finding, which are used by GameState in pathing related functions. 
 Investigating it is useful for advanced player who want to optimize the slow default pathing algorithm we provide. \n 
 
-util.py contains a small handful of functions that help with communication, including the debug-printing function, debug_write().
+The ActionSimulator class in simulation.py predicts the outcome of an action phase for a proposed deploy, 
+including structure damage, unit survival and breaches. 
+Investigating it is useful for players who want to compare attack options before committing to one. \n
+
+The TurnBudget class in scheduler.py keeps track of the time left in a turn and submits a fallback plan before the time limit. 
+AlgoCore gives one to each turn as self.turn_budget, and anytime_search() stops a search in time to submit its best result. \n
+
+geometry.py holds the precomputed geometry of the board (in bounds mask, tile indexes, edges, halves and neighbors) 
+used by GameMap, navigation and the scripts, and the distance and range kernels used by range queries and targeting. \n
+
+The TurnHistory class in history.py keeps the structures of recent turns as the changes between them, 
+and EnemyPredictor forecasts the opponent's next structures and MP spending from it. 
+AlgoCore records every turn in self.history and keeps a predictor in self.enemy_predictor. \n
+
+The ResourceSchedule class in resources.py tabulates the MP and SP income, decay and cap of every turn once per game, 
+and AttackForecaster uses it with the opponent's past spending to estimate when they will attack. \n
+
+The ActionFrame class in action_frame.py decodes a frame of the action phase once and gives typed access to its events. 
+AlgoCore.subscribe_events passes them only the frames with the events they need. \n
+
+The Diagnostics class in diagnostics.py counts the warnings of GameState and GameMap by code, 
+prints only the first few of each code every turn and summarizes the rest. \n
+
+util.py contains a small handful of functions that help with communication, including the debug-printing function, debug_write(), and set_debug_level() to choose how much it prints.
 """
 
 from .algocore import AlgoCore
-from .util import debug_write
+from .util import debug_write, set_debug_level
 from .game_state import GameState
 from .unit import GameUnit
 from .game_map import GameMap
-
-__all__ = ["algocore", "game_state", "game_map", "navigation", "unit", "util"]
+from .simulation import ActionSimulator, SimulationResult, simulate_many, shutdown_pool
+from .scheduler import TurnBudget, anytime_search
+from .action_frame import ActionFrame
+from .diagnostics import DIAGNOSTICS
+from .history import TurnHistory, EnemyPredictor
+from .resources import ResourceSchedule, AttackForecaster
+
+__all__ = ["action_frame", "algocore", "diagnostics", "game_state", "game_map", "geometry", "history", "navigation", "resources", "scheduler", "simulation", "unit", "util"]
  
\ No newline at end of file
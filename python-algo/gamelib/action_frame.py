@@ -0,0 +1,156 @@
+import re
+from collections import namedtuple
+
+from .util import decode_state
+
+AttackEvent = namedtuple("AttackEvent", "source target damage unit_type unit_id target_id player_index")
+BreachEvent = namedtuple("BreachEvent", "location damage unit_type unit_id player_index")
+DamageEvent = namedtuple("DamageEvent", "location damage unit_type unit_id player_index")
+DeathEvent = namedtuple("DeathEvent", "location unit_type unit_id player_index removed_by_owner", defaults=(False,))
+MeleeEvent = namedtuple("MeleeEvent", "source target damage unit_type unit_id player_index")
+MoveEvent = namedtuple("MoveEvent", "old_location new_location desired_location unit_type unit_id player_index")
+SelfDestructEvent = namedtuple("SelfDestructEvent", "location targets damage unit_type unit_id player_index")
+ShieldEvent = namedtuple("ShieldEvent", "source target shield unit_type unit_id target_id player_index")
+SpawnEvent = namedtuple("SpawnEvent", "location unit_type unit_id player_index")
+
+EVENT_TYPES = {
+    "attack": AttackEvent,
+    "breach": BreachEvent,
+    "damage": DamageEvent,
+    "death": DeathEvent,
+    "melee": MeleeEvent,
+    "move": MoveEvent,
+    "selfDestruct": SelfDestructEvent,
+    "shield": ShieldEvent,
+    "spawn": SpawnEvent,
+}
+
+_TURN_INFO = re.compile(r'"turnInfo"\s*:\s*\[\s*(-?\d+)\s*,\s*(-?\d+)\s*,\s*(-?\d+)')
+
+
+def parse_turn_info(string):
+    """Reads the turnInfo of a game engine message without decoding the rest of it
+
+    Args:
+        string: A message from the game engine
+
+    Returns:
+        A tuple (state type, turn number, action phase frame number), or None if the message has no turnInfo
+
+    """
+    match = _TURN_INFO.search(string)
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2)), int(match.group(3))
+
+
+def has_events(string, kind):
+    """Checks whether an action frame has any event of a kind, without decoding it
+
+    Args:
+        string: An action frame from the game engine
+        kind: The name of the event list in the frame, such as "breach" or "selfDestruct"
+
+    Returns:
+        False if the frame has an empty list of these events, True otherwise
+
+    """
+    start = string.find('"{}"'.format(kind))
+    if start == -1:
+        return True
+    start = string.find("[", start) + 1
+    while string[start] in " \t\r\n":
+        start += 1
+    return string[start] != "]"
+
+
+class ActionFrame:
+    """A single frame of the action phase, decoded once
+
+    Events are converted on first access to named tuples with player_index 0 for you and 1 for your opponent
+    (the game engine uses 1 and 2), and unit types as shorthands (the game engine uses indexes into unitInformation).
+
+    Attributes :
+        * state (dict): The decoded frame
+        * turn_number (int): The turn this action phase belongs to
+        * frame_number (int): The index of this frame in the action phase
+
+    """
+    def __init__(self, config, frame):
+        """ Decodes a frame unless it already was
+
+        Args:
+            config: A json object containing information about the game
+            frame: The action frame as a json string, or as the dict decoded from it
+
+        """
+        self.state = decode_state(frame) if isinstance(frame, (str, bytes)) else frame
+        turn_info = self.state["turnInfo"]
+        self.turn_number = int(turn_info[1])
+        self.frame_number = int(turn_info[2])
+        self._unit_types = [unit_information.get("shorthand") for unit_information in config["unitInformation"]]
+        self._events = {}
+
+    def events(self, kind):
+        """Gets the events of a kind in this frame
+
+        Args:
+            kind: One of the keys of EVENT_TYPES, such as "breach" or "selfDestruct"
+
+        Returns:
+            A list of named tuples of the matching type in EVENT_TYPES
+
+        """
+        events = self._events.get(kind)
+        if events is None:
+            event_type = EVENT_TYPES[kind]
+            size = len(event_type._fields)
+            unit_types = self._unit_types
+            type_field = event_type._fields.index("unit_type")
+            owner_field = event_type._fields.index("player_index")
+            events = []
+            for raw in self.state.get("events", {}).get(kind, ()):
+                values = list(raw[:size])
+                unit_type = values[type_field]
+                if isinstance(unit_type, (int, float)) and 0 <= unit_type < len(unit_types):
+                    values[type_field] = unit_types[int(unit_type)]
+                values[owner_field] = int(values[owner_field]) - 1
+                events.append(event_type(*values))
+            self._events[kind] = events
+        return events
+
+    @property
+    def attacks(self):
+        return self.events("attack")
+
+    @property
+    def breaches(self):
+        return self.events("breach")
+
+    @property
+    def damages(self):
+        return self.events("damage")
+
+    @property
+    def deaths(self):
+        return self.events("death")
+
+    @property
+    def melees(self):
+        return self.events("melee")
+
+    @property
+    def moves(self):
+        return self.events("move")
+
+    @property
+    def self_destructs(self):
+        return self.events("selfDestruct")
+
+    @property
+    def shields(self):
+        return self.events("shield")
+
+    @property
+    def spawns(self):
+        return self.events("spawn")
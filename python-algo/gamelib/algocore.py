@@ -1,7 +1,16 @@
-import json
 
-from .game_state import GameState
-from .util import get_command, debug_write, BANNER_TEXT, send_command
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .game_state import GameState, load_unit_types
+from .scheduler import TurnBudget
+from .simulation import shutdown_pool
+from .diagnostics import DIAGNOSTICS, Diagnostics
+from .history import TurnHistory, EnemyPredictor
+from .resources import ResourceSchedule, AttackForecaster
+from .action_frame import ActionFrame, EVENT_TYPES, parse_turn_info, has_events
+from .util import get_command, send_commands, debug_write, flush_debug, BANNER_TEXT, json_loads, decode_state
 
 class AlgoCore(object):
     """
@@ -10,10 +19,34 @@ class AlgoCore(object):
 
     Attributes :
         * config (JSON): json object containing information about the game
+        * turn_budget (TurnBudget): The time budget of the turn being played, see scheduler.py
+        * turn_state (dict): The state of the turn being played, decoded from json, do not modify it
+        * speculation: What speculate returned for the last action frame of the previous turn, or None
+        * speculative_state (GameState): The game state speculate was given, or None
+        * history (TurnHistory): The structures and stats of recent turns, recorded before each on_turn, see history.py
+        * enemy_predictor (EnemyPredictor): Forecasts of the opponent's next structures and MP spending
+        * resource_schedule (ResourceSchedule): The MP and SP income, decay and cap of every turn, see resources.py
+        * attack_forecaster (AttackForecaster): Estimates when the opponent will launch their next large attack
 
     """
     def __init__(self):
         self.config = None
+        self.turn_budget = None
+        self.turn_state = None
+        self.speculation = None
+        self.speculative_state = None
+        self.history = TurnHistory()
+        self.enemy_predictor = None
+        self.resource_schedule = None
+        self.attack_forecaster = None
+        self._last_turn_time = None
+        self._speculator = None
+        self._speculating = None
+        self._speculated = None
+        self._speculated_turn = None
+        # The cancel flag of the speculation running on the current thread, set by __run_speculation
+        self._speculation_local = threading.local()
+        self._frame_handlers = []
 
     def on_game_start(self, config):
         """
@@ -27,23 +60,147 @@ class AlgoCore(object):
         """
         This step function is called at the start of each turn.
         It is passed the current game state, which can be used to initiate a new GameState object. 
+        The same state, already decoded from json, is in self.turn_state.
         By default, it sends empty commands to the game engine. \n
         algo_strategy.py inherits from AlgoCore and overrides this on turn function. 
         Adjusting the on_turn function in algo_strategy is the main way to adjust your algo's logic. 
+        self.turn_budget tells how much time is left, check it as you search and submit before the deadline. 
+        If the turn is not submitted in time an empty turn (or the plan given to self.turn_budget.set_fallback) 
+        is submitted for you, but on_turn is not stopped: work continuing after the deadline is wasted, 
+        and the plan it submits is dropped.
         """
-        send_command("[]")
-        send_command("[]")
+        if self.turn_budget is None:
+            send_commands("[]", "[]")
+        else:
+            self.turn_budget.submit("[]", "[]")
     
     def on_action_frame(self, action_frame_game_state):
         """
         After each deploy phase, the game engine will run the action phase of the round.
         The action phase is made up of a sequence of distinct frames. 
         Each of these frames is sent to the algo in order. 
-        They can be handled in this function. 
+        They can be handled in this function, as json strings. 
+        subscribe_events is faster if you only need some of the events.
         """
         pass
 
 
+    def subscribe_events(self, handler, *kinds):
+        """
+        Calls handler with an ActionFrame for every action frame that has at least one event of the given kinds 
+        (any of "attack", "breach", "damage", "death", "melee", "move", "selfDestruct", "shield", "spawn"), 
+        or for every action frame if no kind is given. \n
+        Frames without any of these events are skipped without being decoded, and a frame is decoded only 
+        once however many handlers it goes to. Call it from on_game_start.
+        """
+        for kind in kinds:
+            if kind not in EVENT_TYPES:
+                debug_write("Unknown action frame event kind {}, it will never match".format(kind))
+        self._frame_handlers.append((handler, kinds))
+
+    def __dispatch_frame(self, game_state_string):
+        frame = None
+        for handler, kinds in self._frame_handlers:
+            if kinds and not any(has_events(game_state_string, kind) for kind in kinds):
+                continue
+            if frame is None:
+                frame = ActionFrame(self.config, game_state_string)
+            handler(frame)
+
+    def speculate(self, game_state):
+        """
+        This function is called on a background thread during the action phase, while action frames stream in. 
+        It is passed a GameState built from the latest action frame, which is a guess of the next turn's board. 
+        By default, it warms the path and threat map caches of both players, see warm_start. \n
+        You can override it in algo_strategy.py to start planning the next turn early, what it returns is 
+        available as self.speculation in the next on_turn. It must not change self, and it is called once per 
+        action phase, on its first frame, so it competes with the frame loop for the interpreter only once. 
+        Once the next turn arrives its result is discarded, but it keeps running until it returns: long 
+        speculations should check speculation_cancelled() often and return as soon as it is True. 
+        Its warnings are kept apart from the turn's, in game_state.diagnostics.
+        """
+        for player_index in (0, 1):
+            if self.speculation_cancelled():
+                return
+            game_state.find_paths_from_edges(player_index)
+            if self.speculation_cancelled():
+                return
+            game_state.get_threat_map(player_index)
+
+    def speculation_cancelled(self):
+        """
+        Returns True once the turn the speculation running on this thread was preparing for has arrived.
+        Outside of speculate it returns False.
+        """
+        cancel = getattr(self._speculation_local, "cancel", None)
+        return cancel is not None and cancel.is_set()
+
+    def warm_start(self, game_state):
+        """
+        Gives game_state the path and threat map caches computed by speculate during the last action phase.
+        Call it at the start of on_turn, right after creating the GameState.
+        Returns True if there was a speculation for this turn to take the caches from.
+        """
+        if self.speculative_state is None:
+            return False
+        game_state.adopt_caches(self.speculative_state)
+        return True
+
+    def __start_speculation(self, game_state_string, turn_number):
+        """
+        Starts speculate on the first action frame of a turn, unless the previous speculation is still running.
+        """
+        if self._speculated_turn == turn_number:
+            return
+        if self._speculating is not None:
+            if not self._speculating[1].done():
+                return
+            self.__collect_speculation()
+        self._speculated_turn = turn_number
+        if self._speculator is None:
+            self._speculator = ThreadPoolExecutor(max_workers=1)
+        cancel = threading.Event()
+        self._speculating = (turn_number, self._speculator.submit(self.__run_speculation, game_state_string, cancel), cancel)
+
+    def __run_speculation(self, game_state_string, cancel):
+        # Each run gets its own flag through a thread local, so nothing shared is written from this thread
+        if cancel.is_set():
+            return None, None
+        self._speculation_local.cancel = cancel
+        try:
+            game_state = GameState(self.config, game_state_string, Diagnostics())
+            return game_state, self.speculate(game_state)
+        finally:
+            self._speculation_local.cancel = None
+
+    def __collect_speculation(self):
+        """
+        Keeps the result of the speculation that just finished, if it did not fail.
+        """
+        turn_number, future, _ = self._speculating
+        self._speculating = None
+        try:
+            self._speculated = (turn_number,) + future.result()
+        except Exception as error:
+            debug_write("Speculation failed: {}".format(error))
+
+    def __take_speculation(self, turn_number):
+        """
+        Sets self.speculation and self.speculative_state for the turn about to be played. 
+        A speculation still running is not waited for but cancelled, turns that arrive before it ends go without.
+        """
+        if self._speculating is not None:
+            if self._speculating[1].done():
+                self.__collect_speculation()
+            else:
+                self._speculating[2].set()
+                self._speculating = None
+        self.speculation = None
+        self.speculative_state = None
+        if self._speculated is not None and self._speculated[0] + 1 == turn_number:
+            _, self.speculative_state, self.speculation = self._speculated
+        self._speculated = None
+
     def start(self):
         """ 
         Start the parsing loop.
@@ -57,31 +214,46 @@ class AlgoCore(object):
             # Note: Python blocks and hangs on stdin. Can cause issues if connections aren't setup properly and may need to
             # manually kill this Python program.
             game_state_string = get_command()
+            received_at = time.perf_counter()
             if "replaySave" in game_state_string:
                 """
                 This means this must be the config file. So, load in the config file as a json and add it to your AlgoStrategy class.
                 """
-                parsed_config = json.loads(game_state_string)
+                parsed_config = json_loads(game_state_string)
+                # Build the unit type tables once, every GameState made with this config reuses them
+                load_unit_types(parsed_config)
+                self.resource_schedule = ResourceSchedule.for_config(parsed_config)
+                self.enemy_predictor = EnemyPredictor(parsed_config, self.history)
+                self.attack_forecaster = AttackForecaster(self.resource_schedule, self.enemy_predictor)
                 self.on_game_start(parsed_config)
             elif "turnInfo" in game_state_string:
-                state = json.loads(game_state_string)
-                stateType = int(state.get("turnInfo")[0])
+                # Action frames come by the hundred, only decode what is needed to route them
+                turn_info = parse_turn_info(game_state_string)
+                if turn_info is None:
+                    turn_info = decode_state(game_state_string).get("turnInfo")
+                stateType = int(turn_info[0])
                 if stateType == 0:
                     """
                     This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
                     deploy phase. Printing is handled by the provided functions.
                     """
-                    self.on_turn(game_state_string)
+                    self.__take_speculation(int(turn_info[1]))
+                    self.__play_turn(game_state_string, received_at)
                 elif stateType == 1:
                     """
                     If stateType == 1, this game_state_string string represents a single frame of an action phase
                     """
                     self.on_action_frame(game_state_string)
+                    self.__dispatch_frame(game_state_string)
+                    self.__start_speculation(game_state_string, int(turn_info[1]))
                 elif stateType == 2:
                     """
                     This is the end game message. This means the game is over so break and finish the program.
                     """
                     debug_write("Got end state, game over. Stopping algo.")
+                    if self._speculator is not None:
+                        self._speculator.shutdown(wait=False)
+                    shutdown_pool()
                     break
                 else:
                     """
@@ -93,3 +265,32 @@ class AlgoCore(object):
                 Something is wrong? Received an incorrect or improperly formatted string.
                 """
                 debug_write("Got unexpected string : {}".format(game_state_string))
+
+    def __play_turn(self, game_state_string, received_at):
+        """
+        Records the turn in self.history, then calls on_turn with a started turn budget, and makes sure the turn 
+        was submitted afterwards. The time the game measured for our last turn, minus the time we measured, 
+        is added to the safety margin. The state is decoded once, GameState reuses the decode.
+        """
+        state = decode_state(game_state_string)
+        self.turn_state = state
+        latency = 0
+        if self._last_turn_time is not None:
+            latency = float(state["p1Stats"][3]) / 1000 - self._last_turn_time
+        self.history.record(state)
+        self.turn_budget = TurnBudget.from_config(self.config, received_at, latency)
+        self.turn_budget.start()
+        try:
+            self.on_turn(game_state_string)
+        finally:
+            self.turn_budget.finish()
+            DIAGNOSTICS.end_turn()
+            if self.turn_budget.timed_out:
+                debug_write("WARNING: on_turn returned {:.2f}s after its deadline, the fallback plan was played instead of its own".format(
+                    -self.turn_budget.remaining()))
+            elif not self.turn_budget.submitted:
+                debug_write("on_turn returned without submitting, submitting an empty turn")
+                self.turn_budget.submit("[]", "[]")
+            self._last_turn_time = self.turn_budget.elapsed()
+            # Write this turn's debug output now, rather than when the algo next waits for input
+            flush_debug()
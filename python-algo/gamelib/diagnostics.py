@@ -0,0 +1,91 @@
+from .util import debug_write
+
+GENERAL = "general"
+OUT_OF_BOUNDS = "out_of_bounds"
+INVALID_ARGUMENT = "invalid_argument"
+INVALID_PLAYER_INDEX = "invalid_player_index"
+INVALID_UNIT = "invalid_unit"
+SPAWN_INVALID_LOCATION = "spawn_invalid_location"
+SPAWN_UNAFFORDABLE = "spawn_unaffordable"
+SPAWN_BLOCKED = "spawn_blocked"
+SPAWN_ENEMY_TERRITORY = "spawn_enemy_territory"
+SPAWN_NOT_ON_EDGE = "spawn_not_on_edge"
+REMOVE_FAILED = "remove_failed"
+UPGRADE_FAILED = "upgrade_failed"
+PATH_BLOCKED_START = "path_blocked_start"
+NO_SAVEPOINT = "no_savepoint"
+ALREADY_SUBMITTED = "already_submitted"
+
+
+class Diagnostics:
+    """Counts warnings by code and prints only the first few of each code per turn.
+
+    Messages are formatted only when they are printed, so a warning that is dropped costs a dictionary update.
+    AlgoCore calls end_turn after each on_turn, which prints how many warnings of each code were dropped. 
+    Warnings reported while suppressed, such as those of simulated game states, are counted apart and left out of it.
+
+    Attributes :
+        * limit_per_turn (int): How many warnings of each code are printed per turn
+        * counts (dict): The number of warnings of each code this turn
+        * suppressed (dict): How many of counts were reported with show set to False
+        * totals (dict): The number of warnings of each code since the start of the game
+
+    """
+    def __init__(self, limit_per_turn=3):
+        self.limit_per_turn = limit_per_turn
+        self.counts = {}
+        self.suppressed = {}
+        self.totals = {}
+        self._printed = {}
+
+    def report(self, code, message, *args, show=True):
+        """Counts a warning, and prints it unless show is False or the limit of its code was reached this turn
+
+        Args:
+            code: The warning code, one of the constants of this module
+            message: The message, as a format string filled with args when it is printed
+            args: The values to format message with
+            show: Whether the warning may be printed, warnings are counted either way
+
+        """
+        self.counts[code] = self.counts.get(code, 0) + 1
+        if not show:
+            self.suppressed[code] = self.suppressed.get(code, 0) + 1
+            return
+        printed = self._printed.get(code, 0)
+        if printed < self.limit_per_turn:
+            self._printed[code] = printed + 1
+            debug_write(message.format(*args) if args else message)
+
+    def summary(self):
+        """Describes the warnings of this turn that were not suppressed
+
+        Returns:
+            A string such as "spawn_blocked x12 (3 shown), out_of_bounds x1", or an empty string if there was no warning
+
+        """
+        parts = []
+        counts = [(code, count - self.suppressed.get(code, 0)) for code, count in list(self.counts.items())]
+        for code, count in sorted(counts, key=lambda item: -item[1]):
+            if count == 0:
+                continue
+            printed = self._printed.get(code, 0)
+            parts.append("{} x{}".format(code, count) if printed == count else "{} x{} ({} shown)".format(code, count, printed))
+        return ", ".join(parts)
+
+    def end_turn(self):
+        """Prints a summary of the warnings that were not printed this turn, and starts counting for the next turn
+
+        """
+        # A snapshot, in case a background thread reports while the turn ends
+        counts = list(self.counts.items())
+        if any(self._printed.get(code, 0) < count - self.suppressed.get(code, 0) for code, count in counts):
+            debug_write("Warnings this turn: " + self.summary())
+        for code, count in counts:
+            self.totals[code] = self.totals.get(code, 0) + count
+        self.counts = {}
+        self.suppressed = {}
+        self._printed = {}
+
+
+DIAGNOSTICS = Diagnostics()
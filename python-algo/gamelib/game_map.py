@@ -1,6 +1,12 @@
 import math
+from array import array
 from .unit import GameUnit
-from .util import debug_write
+from . import geometry
+from .diagnostics import DIAGNOSTICS, GENERAL, OUT_OF_BOUNDS, INVALID_ARGUMENT, INVALID_PLAYER_INDEX, UPGRADE_FAILED
+
+# Shared between every GameMap, range stencils only depend on their radius and hit radius tolerance
+_STENCILS = {}
+_DISTANCES = geometry.DISTANCES
 
 class GameMap:
     """Holds data about the current game map and provides functions
@@ -9,15 +15,31 @@ class GameMap:
     game_map[x, y] will return a list of Units located at that location, 
     or an empty list if there are no units at the location
 
+    Alongside the list grid, the structure on each tile is mirrored in a set of 
+    flat, parallel typed arrays indexed by x * ARENA_SIZE + y. These give O(1) 
+    structure and owner lookups and can be read in bulk. They are kept up to date by 
+    add_unit, remove_unit and item assignment; if you mutate the lists returned by 
+    game_map[x, y] directly, call sync_location afterwards.
+
+    Iterating over the map yields every location of the board, and can be nested. 
+    occupied_locations, structure_locations and type_locations only visit the tiles that hold units.
+
     Attributes :
         * config (JSON): Contains information about the current game rules
         * enable_warnings (bool): If true, debug messages for game_map functions will print out
+        * diagnostics (Diagnostics): Where warnings are reported, the shared DIAGNOSTICS unless GameState gives its own
         * ARENA_SIZE (int): The size of the arena.
         * HALF_ARENA (int): Half of the size of the arena.
         * TOP_RIGHT (int): A constant that represents the top right edge
         * TOP_LEFT (int): A constant that represents the top left edge
         * BOTTOM_LEFT (int): Hidden challenge! Can you guess what this constant represents???
         * BOTTOM_RIGHT (int): A constant that represents the bottom right edge
+        * structure_types (array): Per tile unit type index of the structure on it, -1 if there is none
+        * structure_owners (array): Per tile player index of the structure on it, -1 if there is none
+        * structure_health (array): Per tile health of the structure on it, 0 if there is none
+        * structure_upgraded (array): Per tile flag, 1 if the structure on it is upgraded
+        * layout_version (int): Incremented every time a structure is added, removed, replaced or upgraded
+        * units_version (int): Incremented every time the units of a location are refreshed by sync_location
 
     """
     def __init__(self, config):
@@ -29,6 +51,7 @@ class GameMap:
         """
         self.config = config
         self.enable_warnings = True
+        self.diagnostics = DIAGNOSTICS
         self.ARENA_SIZE = 28
         self.HALF_ARENA = int(self.ARENA_SIZE / 2)
         self.TOP_RIGHT = 0
@@ -36,7 +59,21 @@ class GameMap:
         self.BOTTOM_LEFT = 2
         self.BOTTOM_RIGHT = 3
         self.__map = self.__empty_grid()
-        self.__start = [13,0]
+        self._in_bounds = geometry.VALID_MASK
+        self._edge_mask = geometry.EDGE_MASK
+        self.__type_index = {unit["shorthand"]: index for index, unit in enumerate(self.config["unitInformation"]) if "shorthand" in unit}
+        num_tiles = self.ARENA_SIZE * self.ARENA_SIZE
+        self._structures = [None] * num_tiles
+        self.structure_types = array('b', [-1]) * num_tiles
+        self.structure_owners = array('b', [-1]) * num_tiles
+        self.structure_health = array('d', [0.0]) * num_tiles
+        self.structure_upgraded = array('b', [0]) * num_tiles
+        self.layout_version = 0
+        self.units_version = 0
+        self._layout_changes = []
+        self._shares_units = False
+        self._owned_structures = set()
+        self._occupied = set()
     
     def __getitem__(self, location):
         if len(location) == 2 and self.in_arena_bounds(location):
@@ -47,25 +84,66 @@ class GameMap:
     def __setitem__(self, location, val):
         if type(location) == tuple and len(location) == 2 and self.in_arena_bounds(location):
             self.__map[location[0]][location[1]] = val
+            # The new units may be shared with a copy of this map
+            self._owned_structures.discard(self.get_index(location))
+            self.sync_location(location)
             return
         self._invalid_coordinates(location)
 
     def __iter__(self):
-        self.__start = [13,0]
-        return self
-    
-    def __next__(self):
-        location = self.__start
-        if location == [15,27]:
-            raise StopIteration
-        new_location = [location[0]+1, location[1]]
-        while not self.in_arena_bounds(new_location) and not location == [14,27]:
-            if new_location[0] == self.ARENA_SIZE:
-                new_location = [0, new_location[1]+1]
-            else:
-                new_location = [new_location[0]+1, new_location[1]]
-        self.__start = new_location
-        return location 
+        return ([x, y] for x, y in geometry.LOCATIONS)
+
+    def __occupied_indexes(self):
+        # Board order, like iterating over the map
+        return sorted(self._occupied, key=geometry.CELL_NUMBERS.__getitem__)
+
+    def occupied_locations(self):
+        """Iterates over the locations that hold at least one unit, in the same order as iterating over the map
+
+        Returns:
+            A generator of locations
+
+        """
+        size = self.ARENA_SIZE
+        return ([index // size, index % size] for index in self.__occupied_indexes())
+
+    def structure_locations(self, player_index=None, unit_type=None):
+        """Iterates over the locations that hold a structure, in the same order as iterating over the map
+
+        Args:
+            player_index: Only yield the structures of this player, 0 for you 1 for the enemy, or None for both
+            unit_type: Only yield the structures of this type, or None for every type
+
+        Returns:
+            A generator of locations
+
+        """
+        size = self.ARENA_SIZE
+        owners = self.structure_owners
+        types = self.structure_types
+        type_index = -1 if unit_type is None else self.__type_index.get(unit_type, -2)
+        return ([index // size, index % size] for index in self.__occupied_indexes() 
+                if types[index] >= 0 and (player_index is None or owners[index] == player_index) 
+                and (type_index == -1 or types[index] == type_index))
+
+    def type_locations(self, unit_type, player_index=None):
+        """Iterates over the locations that hold at least one unit of a type, mobile or not, in the same order as iterating over the map
+
+        Args:
+            unit_type: The type of unit to look for
+            player_index: Only count the units of this player, 0 for you 1 for the enemy, or None for both
+
+        Returns:
+            A generator of locations
+
+        """
+        size = self.ARENA_SIZE
+        for index in self.__occupied_indexes():
+            x, y = index // size, index % size
+            for unit in self.__map[x][y]:
+                if unit.unit_type == unit_type and (player_index is None or unit.player_index == player_index):
+                    yield [x, y]
+                    break
 
     def __empty_grid(self):
         grid = []
@@ -75,8 +153,140 @@ class GameMap:
                 grid[x].append([])
         return grid
 
+    def get_index(self, location):
+        """Gets the flat index of a location in the structure arrays
+
+        Args:
+            location: A map location
+
+        Returns:
+            x * ARENA_SIZE + y, the index of the location in structure_types and the other per tile arrays
+
+        """
+        x, y = location
+        return int(x) * self.ARENA_SIZE + int(y)
+
+    def get_structure(self, location):
+        """Gets the structure at a location in constant time
+
+        Args:
+            location: A map location
+
+        Returns:
+            The stationary GameUnit at the location, or None if there is none or the location is out of bounds
+
+        """
+        if not self.in_arena_bounds(location):
+            return None
+        return self._structures[self.get_index(location)]
+
+    def get_structure_owner(self, location):
+        """Gets the owner of the structure at a location in constant time
+
+        Args:
+            location: A map location
+
+        Returns:
+            0 or 1 for the player index owning the structure, or -1 if there is no structure at the location
+
+        """
+        if not self.in_arena_bounds(location):
+            return -1
+        return self.structure_owners[self.get_index(location)]
+
+    def get_structure_mask(self, player_index=None):
+        """Gets a bulk view of the tiles holding structures
+
+        Args:
+            player_index: If given, only structures controlled by this player are marked
+
+        Returns:
+            A bytearray indexed like structure_types with 1 where there is a matching structure and 0 elsewhere
+
+        """
+        if player_index is None:
+            return bytearray(owner >= 0 for owner in self.structure_owners)
+        return bytearray(owner == player_index for owner in self.structure_owners)
+
+    def sync_location(self, location):
+        """Refreshes the structure arrays for a location from the units stored there.
+
+        Called automatically by add_unit, remove_unit and item assignment. Call it yourself after 
+        mutating the list of units at a location, or a unit in it, directly.
+
+        Args:
+            location: The map location to refresh
+
+        """
+        x, y = map(int, location)
+        index = x * self.ARENA_SIZE + y
+        self.units_version += 1
+        if self.__map[x][y]:
+            self._occupied.add(index)
+        else:
+            self._occupied.discard(index)
+        structure = None
+        for unit in self.__map[x][y]:
+            if unit.stationary:
+                structure = unit
+                break
+
+        if structure is None:
+            changed = self._structures[index] is not None
+            self._structures[index] = None
+            self.structure_types[index] = -1
+            self.structure_owners[index] = -1
+            self.structure_health[index] = 0.0
+            self.structure_upgraded[index] = 0
+        else:
+            type_index = self.__type_index[structure.unit_type]
+            owner = -1 if structure.player_index is None else structure.player_index
+            changed = (self._structures[index] is not structure or self.structure_types[index] != type_index or
+                       self.structure_owners[index] != owner or self.structure_upgraded[index] != structure.upgraded)
+            self._structures[index] = structure
+            self.structure_types[index] = type_index
+            self.structure_owners[index] = owner
+            self.structure_health[index] = structure.health
+            self.structure_upgraded[index] = 1 if structure.upgraded else 0
+
+        if changed:
+            self.layout_version += 1
+            self._layout_changes.append(index)
+
+    def get_edge_mask(self):
+        """Gets which edges every tile is on, computed once for all maps
+
+        Returns:
+            geometry.EDGE_MASK, a bytes object indexed by flat tile index (see get_index), where bit 1 << quadrant_description 
+            is set for each edge the tile is on, for example mask[index] & (1 << game_map.BOTTOM_LEFT)
+
+        """
+        return self._edge_mask
+
+    def get_range_stencil(self, radius, tolerance=None, inclusive=False):
+        """Gets the offsets of every location within a radius of the origin, computed once per distinct radius
+
+        Args:
+            radius: The radius of the search area
+            tolerance: Added to the radius, defaults to the getHitRadius of the game config
+            inclusive: If True, offsets at exactly radius + tolerance are included
+
+        Returns:
+            A list of [dx, dy] offsets, ordered by dx and then dy. Do not modify it, it is shared.
+
+        """
+        if tolerance is None:
+            tolerance = self.config["unitInformation"][0]['getHitRadius']
+        key = (radius, tolerance, inclusive)
+        stencil = _STENCILS.get(key)
+        if stencil is None:
+            # The same offsets as geometry.get_range_offsets, as lists
+            stencil = [[dx, dy] for dx, dy in geometry.get_range_offsets(radius, tolerance, inclusive)]
+            _STENCILS[key] = stencil
+        return stencil
+
     def _invalid_coordinates(self, location):
-        self.warn("{} is out of bounds.".format(str(location)))
+        self.warn("{} is out of bounds.", location, code=OUT_OF_BOUNDS)
 
     def in_arena_bounds(self, location):
         """Checks if the given location is inside the diamond shaped game board.
@@ -88,20 +298,7 @@ class GameMap:
             True if the location is on the board, False otherwise
         
         """
-        x, y = location
-        half_board = self.HALF_ARENA
-
-        row_size = y + 1
-        startx = half_board - row_size
-        endx = startx + (2 * row_size) - 1
-        top_half_check = (y < self.HALF_ARENA and x >= startx and x <= endx)
-
-        row_size = (self.ARENA_SIZE - 1 - y) + 1
-        startx = half_board - row_size
-        endx = startx + (2 * row_size) - 1
-        bottom_half_check = (y >= self.HALF_ARENA and x >= startx and x <= endx)
-
-        return bottom_half_check or top_half_check
+        return geometry.in_arena_bounds(location)
 
     def get_edge_locations(self, quadrant_description):
         """Takes in an edge description and returns a list of locations.
@@ -114,11 +311,10 @@ class GameMap:
 
         """
         if not quadrant_description in [self.TOP_LEFT, self.TOP_RIGHT, self.BOTTOM_LEFT, self.BOTTOM_RIGHT]:
-            self.warn("Passed invalid quadrant_description '{}'. See the documentation for valid inputs for get_edge_locations.".format(quadrant_description))
+            self.warn("Passed invalid quadrant_description '{}'. See the documentation for valid inputs for get_edge_locations.", quadrant_description, code=INVALID_ARGUMENT)
             return
 
-        edges = self.get_edges()
-        return edges[quadrant_description]
+        return [[x, y] for x, y in geometry.EDGES[quadrant_description]]
 
     def get_edges(self):
         """Gets all of the edges and their edge locations
@@ -127,27 +323,7 @@ class GameMap:
             A list with four lists inside of it of locations corresponding to the four edges.
             [0] = top_right, [1] = top_left, [2] = bottom_left, [3] = bottom_right.
         """
-        top_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = self.ARENA_SIZE - 1 - num
-            top_right.append([int(x), int(y)])
-        top_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = self.ARENA_SIZE - 1 - num
-            top_left.append([int(x), int(y)])
-        bottom_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = num
-            bottom_left.append([int(x), int(y)])
-        bottom_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = num
-            bottom_right.append([int(x), int(y)])
-        return [top_right, top_left, bottom_left, bottom_right]
+        return [[[x, y] for x, y in edge] for edge in geometry.EDGES]
     
     def add_unit(self, unit_type, location, player_index=0):
         """Add a single GameUnit to the map at the given location.
@@ -164,7 +340,7 @@ class GameMap:
         if not self.in_arena_bounds(location):
             self._invalid_coordinates(location)
         if player_index < 0 or player_index > 1:
-            self.warn("Player index {} is invalid. Player index should be 0 or 1.".format(player_index))
+            self.warn("Player index {} is invalid. Player index should be 0 or 1.", player_index, code=INVALID_PLAYER_INDEX)
 
         x, y = location
         new_unit = GameUnit(unit_type, self.config, player_index, None, location[0], location[1])
@@ -172,6 +348,63 @@ class GameMap:
             self.__map[x][y].append(new_unit)
         else:
             self.__map[x][y] = [new_unit]
+        self.sync_location(location)
+
+    def upgrade_unit(self, location):
+        """Upgrade the structure at the given location.
+
+        Args:
+            location: The location of the structure to upgrade
+
+        Returns:
+            The upgraded GameUnit, or None if there is no structure at the location
+
+        This function does not affect your turn and only changes the data stored in GameMap. Use GameState.attempt_upgrade
+        to upgrade your own structures. If this map shares its units with a copy, the structure is copied before being upgraded.
+        """
+        structure = self.get_structure(location)
+        if structure is None:
+            self.warn("There is no structure to upgrade at {}.", location, code=UPGRADE_FAILED)
+            return None
+
+        x, y = map(int, location)
+        index = x * self.ARENA_SIZE + y
+        if self._shares_units and index not in self._owned_structures:
+            own_structure = structure.copy()
+            cell = self.__map[x][y]
+            cell[cell.index(structure)] = own_structure
+            self._owned_structures.add(index)
+            structure = own_structure
+        structure.upgrade()
+        self.sync_location([x, y])
+        return structure
+
+    def copy(self):
+        """Creates a copy of this map for hypothetical play.
+
+        The copy has its own unit lists and structure arrays, so adding, removing or upgrading units on either map 
+        does not affect the other. The units themselves are shared until one of the maps upgrades a structure, 
+        which is then copied first. Mutating a shared unit directly affects both maps.
+
+        Returns:
+            A new GameMap with the same units as this one
+
+        """
+        game_map = GameMap.__new__(GameMap)
+        game_map.__dict__.update(self.__dict__)
+        game_map.__map = [[list(cell) for cell in column] for column in self.__map]
+        game_map._occupied = set(self._occupied)
+        game_map._structures = list(self._structures)
+        game_map.structure_types = self.structure_types[:]
+        game_map.structure_owners = self.structure_owners[:]
+        game_map.structure_health = self.structure_health[:]
+        game_map.structure_upgraded = self.structure_upgraded[:]
+        game_map._layout_changes = []
+        game_map._owned_structures = set()
+        game_map._shares_units = True
+        self._shares_units = True
+        self._owned_structures = set()
+        return game_map
 
     def remove_unit(self, location):
         """Remove all units on the map in the given location.
@@ -187,6 +420,7 @@ class GameMap:
         
         x, y = location
         self.__map[x][y] = []
+        self.sync_location(location)
 
     def get_locations_in_range(self, location, radius):
         """Gets locations in a circular area around a location
@@ -200,20 +434,20 @@ class GameMap:
 
         """
         if radius < 0 or radius > self.ARENA_SIZE:
-            self.warn("Radius {} was passed to get_locations_in_range. Expected integer between 0 and {}".format(radius, self.ARENA_SIZE))
+            self.warn("Radius {} was passed to get_locations_in_range. Expected integer between 0 and {}", radius, self.ARENA_SIZE, code=INVALID_ARGUMENT)
         if not self.in_arena_bounds(location):
             self._invalid_coordinates(location)
 
-        x, y = location
+        x, y = map(int, location)
+        size = self.ARENA_SIZE
+        in_bounds = self._in_bounds
         locations = []
-        search_radius = math.ceil(radius)
-        getHitRadius = self.config["unitInformation"][0]['getHitRadius']
-        for i in range(int(x - search_radius), int(x + search_radius + 1)):
-            for j in range(int(y - search_radius), int(y + search_radius + 1)):
-                new_location = [i, j]
-                # A unit with a given range affects all locations whose centers are within that range + get hit radius
-                if self.in_arena_bounds(new_location) and self.distance_between_locations(location, new_location) < radius + getHitRadius:
-                    locations.append(new_location)
+        # A unit with a given range affects all locations whose centers are within that range + get hit radius
+        for dx, dy in self.get_range_stencil(radius):
+            i = x + dx
+            j = y + dy
+            if 0 <= i < size and 0 <= j < size and in_bounds[i * size + j]:
+                locations.append([i, j])
         return locations
 
     def distance_between_locations(self, location_1, location_2):
@@ -230,11 +464,15 @@ class GameMap:
         x1, y1 = location_1
         x2, y2 = location_2
 
-        return math.sqrt((x1 - x2)**2 + (y1 - y2)**2)
+        squared = (x1 - x2)**2 + (y1 - y2)**2
+        try:
+            # Tiles of the board are a table lookup away
+            return _DISTANCES[squared]
+        except (IndexError, TypeError):
+            return math.sqrt(squared)
 
-    def warn(self, message):
+    def warn(self, message, *args, code=GENERAL):
         """
-        Used internally by game_map to print out default messaging
+        Used internally by game_map to report warnings, see diagnostics.Diagnostics
         """
-        if(self.enable_warnings):
-            debug_write(message)
+        self.diagnostics.report(code, message, *args, show=self.enable_warnings)
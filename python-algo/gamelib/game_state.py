@@ -1,11 +1,66 @@
 import math
 import json
 import sys
+from collections import namedtuple
 
-from .navigation import ShortestPathFinder
-from .util import send_command, debug_write
-from .unit import GameUnit
+from .navigation import ShortestPathFinder, PathTable
+from .util import send_commands, decode_state
+from .unit import GameUnit, get_unit_type_table
 from .game_map import GameMap
+from . import geometry
+from .simulation import simulate_many, target_key
+from .scheduler import active_budget
+from .resources import ResourceSchedule
+from .diagnostics import (DIAGNOSTICS, GENERAL, OUT_OF_BOUNDS, INVALID_ARGUMENT, INVALID_PLAYER_INDEX, INVALID_UNIT,
+    SPAWN_INVALID_LOCATION, SPAWN_UNAFFORDABLE, SPAWN_BLOCKED, SPAWN_ENEMY_TERRITORY, SPAWN_NOT_ON_EDGE,
+    REMOVE_FAILED, UPGRADE_FAILED, PATH_BLOCKED_START, NO_SAVEPOINT, ALREADY_SUBMITTED)
+
+_LOADED_CONFIG = None
+
+ShieldMap = namedtuple("ShieldMap", "masks amounts")
+ShieldMap.__doc__ = """The supports of a player that can shield each tile
+
+    * masks (list): Indexed by flat tile index, an int with bit i set if support i shields units on that tile
+    * amounts (list): The shield support i gives each unit it shields
+"""
+
+def load_unit_types(config):
+    """Sets up the unit type constants of this module and the per-type unit stat table from a game config.
+
+    The work is only done once per config object. It is called by AlgoCore when the config is received 
+    and again, at no cost, by every GameState created with the same config.
+
+    Args:
+        config (JSON): A json object containing information about the game
+
+    """
+    global _LOADED_CONFIG, WALL, SUPPORT, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE, STRUCTURE_TYPES, ALL_UNITS, UNIT_TYPE_TO_INDEX
+    if config is _LOADED_CONFIG:
+        return
+
+    UNIT_TYPE_TO_INDEX = {}
+    WALL = config["unitInformation"][0]["shorthand"]
+    UNIT_TYPE_TO_INDEX[WALL] = 0
+    SUPPORT = config["unitInformation"][1]["shorthand"]
+    UNIT_TYPE_TO_INDEX[SUPPORT] = 1
+    TURRET = config["unitInformation"][2]["shorthand"]
+    UNIT_TYPE_TO_INDEX[TURRET] = 2
+    SCOUT = config["unitInformation"][3]["shorthand"]
+    UNIT_TYPE_TO_INDEX[SCOUT] = 3
+    DEMOLISHER = config["unitInformation"][4]["shorthand"]
+    UNIT_TYPE_TO_INDEX[DEMOLISHER] = 4
+    INTERCEPTOR = config["unitInformation"][5]["shorthand"]
+    UNIT_TYPE_TO_INDEX[INTERCEPTOR] = 5
+    REMOVE = config["unitInformation"][6]["shorthand"]
+    UNIT_TYPE_TO_INDEX[REMOVE] = 6
+    UPGRADE = config["unitInformation"][7]["shorthand"]
+    UNIT_TYPE_TO_INDEX[UPGRADE] = 7
+
+    ALL_UNITS = [SCOUT, DEMOLISHER, INTERCEPTOR, WALL, SUPPORT, TURRET]
+    STRUCTURE_TYPES = [WALL, SUPPORT, TURRET]
+
+    get_unit_type_table(config)
+    _LOADED_CONFIG = config
 
 def is_stationary(unit_type):
     """
@@ -47,39 +102,21 @@ class GameState:
 
     """
 
-    def __init__(self, config, serialized_string):
+    def __init__(self, config, serialized_string, diagnostics=None):
         """ Setup a turns variables using arguments passed
 
         Args:
             * config (JSON): A json object containing information about the game
             * serialized_string (string): A string containing information about the game state at the start of this turn
+            * diagnostics (Diagnostics): Where warnings are reported, defaults to the shared DIAGNOSTICS
 
         """
         self.serialized_string = serialized_string
         self.config = config
         self.enable_warnings = True
+        self.diagnostics = DIAGNOSTICS if diagnostics is None else diagnostics
 
-        global WALL, SUPPORT, TURRET, SCOUT, DEMOLISHER, INTERCEPTOR, REMOVE, UPGRADE, STRUCTURE_TYPES, ALL_UNITS, UNIT_TYPE_TO_INDEX
-        UNIT_TYPE_TO_INDEX = {}
-        WALL = config["unitInformation"][0]["shorthand"]
-        UNIT_TYPE_TO_INDEX[WALL] = 0
-        SUPPORT = config["unitInformation"][1]["shorthand"]
-        UNIT_TYPE_TO_INDEX[SUPPORT] = 1
-        TURRET = config["unitInformation"][2]["shorthand"]
-        UNIT_TYPE_TO_INDEX[TURRET] = 2
-        SCOUT = config["unitInformation"][3]["shorthand"]
-        UNIT_TYPE_TO_INDEX[SCOUT] = 3
-        DEMOLISHER = config["unitInformation"][4]["shorthand"]
-        UNIT_TYPE_TO_INDEX[DEMOLISHER] = 4
-        INTERCEPTOR = config["unitInformation"][5]["shorthand"]
-        UNIT_TYPE_TO_INDEX[INTERCEPTOR] = 5
-        REMOVE = config["unitInformation"][6]["shorthand"]
-        UNIT_TYPE_TO_INDEX[REMOVE] = 6
-        UPGRADE = config["unitInformation"][7]["shorthand"]
-        UNIT_TYPE_TO_INDEX[UPGRADE] = 7
-
-        ALL_UNITS = [SCOUT, DEMOLISHER, INTERCEPTOR, WALL, SUPPORT, TURRET]
-        STRUCTURE_TYPES = [WALL, SUPPORT, TURRET]
+        load_unit_types(config)
 
         self.ARENA_SIZE = 28
         self.HALF_ARENA = int(self.ARENA_SIZE / 2)
@@ -90,7 +127,14 @@ class GameState:
         SP = self.SP
 
         self.game_map = GameMap(self.config)
+        self.game_map.diagnostics = self.diagnostics
         self._shortest_path_finder = ShortestPathFinder()
+        self._threat_maps = {}
+        self._shield_maps = {}
+        self._mobile_tiles = None
+        self._max_attack_range = None
+        self._unit_counts = {}
+        self._undo_log = None
         self._build_stack = []
         self._deploy_stack = []
         self._player_resources = [
@@ -98,12 +142,57 @@ class GameState:
                 {'SP': 0, 'MP': 0}]  # player 1, which is the opponent
         self.__parse_state(serialized_string)
 
+    def clone(self):
+        """Creates a copy of this game state for hypothetical play, without parsing the serialized state again.
+
+        The copy has its own game map, resources, build and deploy stacks and path cache, so calling attempt_spawn, 
+        attempt_upgrade or attempt_remove on it does not affect this game state. Units are shared until upgraded, 
+        see GameMap.copy. Do not submit a clone unless it is the plan you want to play.
+
+        Returns:
+            A new GameState
+
+        """
+        state = GameState.__new__(GameState)
+        state.__dict__.update(self.__dict__)
+        state.game_map = self.game_map.copy()
+        state._shortest_path_finder = self._shortest_path_finder.copy(self.game_map, state.game_map)
+        state._threat_maps = dict(self._threat_maps)
+        state._shield_maps = dict(self._shield_maps)
+        state._unit_counts = dict(self._unit_counts)
+        state._build_stack = list(self._build_stack)
+        state._deploy_stack = list(self._deploy_stack)
+        state._player_resources = [dict(resources) for resources in self._player_resources]
+        state._undo_log = None
+        return state
+
+    def adopt_caches(self, other):
+        """Reuses the path, threat map and shield map caches of another game state with a similar board, 
+        such as one built from the last action frame of the previous turn
+
+        Path fields are repaired for the tiles where the boards differ, and threat and shield maps are only reused 
+        if the structures of both boards are identical.
+
+        Args:
+            other: The GameState to take the caches from, it is not modified
+
+        """
+        self._shortest_path_finder = other._shortest_path_finder.transfer(other.game_map, self.game_map)
+        if (other.game_map.structure_types == self.game_map.structure_types 
+                and other.game_map.structure_owners == self.game_map.structure_owners 
+                and other.game_map.structure_upgraded == self.game_map.structure_upgraded):
+            for caches, other_caches in ((self._threat_maps, other._threat_maps), (self._shield_maps, other._shield_maps)):
+                for player_index in (0, 1):
+                    cached = other_caches.get(player_index)
+                    if cached is not None and cached[0] == other.game_map.layout_version:
+                        caches[player_index] = (self.game_map.layout_version, cached[1])
+
     def __parse_state(self, state_line):
         """
         Fills in map based on the serialized game state so that self.game_map[x,y] is a list of GameUnits at that location.
-        state_line is the game state as a json string.
+        state_line is the game state as a json string, the decode AlgoCore made for the turn is reused.
         """
-        state = json.loads(state_line)
+        state = decode_state(state_line)
 
         turn_info = state["turnInfo"]
         self.turn_number = int(turn_info[1])
@@ -132,8 +221,8 @@ class GameState:
         """
         typedef = self.config.get("unitInformation")
         for i, unit_types in enumerate(units):
+            unit_type = typedef[i].get("shorthand")
             for uinfo in unit_types:
-                unit_type = typedef[i].get("shorthand")
                 sx, sy, shp = uinfo[:3]
                 x, y = map(int, [sx, sy])
                 hp = float(shp)
@@ -144,10 +233,11 @@ class GameState:
                         self.game_map[x,y][0].pending_removal = True
                 elif unit_type == UPGRADE:
                     if self.contains_stationary_unit([x,y]):
-                        self.game_map[x,y][0].upgrade()
+                        self.game_map.upgrade_unit([x,y])
                 else:
                     unit = GameUnit(unit_type, self.config, player_number, hp, x, y)
                     self.game_map[x,y].append(unit)
+                    self.game_map.sync_location([x,y])
 
     def __resource_required(self, unit_type):
         return self.SP if is_stationary(unit_type) else self.MP
@@ -163,22 +253,80 @@ class GameState:
         elif resource_type == self.SP:
             resource_key = 'SP'
         held_resource = self.get_resource(resource_type, player_index)
+        if self._undo_log is not None:
+            self._undo_log.append((self.__restore_resource, (player_index, resource_key, held_resource)))
         self._player_resources[player_index][resource_key] = held_resource + amount
 
+    def __restore_resource(self, player_index, resource_key, amount):
+        self._player_resources[player_index][resource_key] = amount
+
+    def __restore_location(self, location, units):
+        self.game_map[location] = units
+
+    def __restore_upgrade(self, location, units, unit, stats, upgraded):
+        unit._stats = stats
+        unit.upgraded = upgraded
+        self.game_map[location] = units
+
+    def __push(self, stack, command):
+        stack.append(command)
+        if self._undo_log is not None:
+            self._undo_log.append((stack.pop, ()))
+
+    def savepoint(self):
+        """Starts recording the changes made by attempt_spawn, attempt_upgrade and attempt_remove, if not already recording,
+        and marks the current point of the record.
+
+        Savepoints can be nested: roll back to an inner savepoint to undo part of a plan and keep the rest.
+        Changes made directly to game_map are not recorded.
+
+        Returns:
+            A savepoint that can be passed to rollback
+
+        """
+        if self._undo_log is None:
+            self._undo_log = []
+        return len(self._undo_log)
+
+    def rollback(self, savepoint=0):
+        """Undoes every recorded change made since a savepoint, in reverse order. 
+        The cost is proportional to the number of changes undone. Recording continues afterwards.
+
+        Args:
+            savepoint: A value returned by savepoint, by default the first one
+
+        """
+        if self._undo_log is None:
+            self.warn("Attempted to rollback without a savepoint.", code=NO_SAVEPOINT)
+            return
+        while len(self._undo_log) > savepoint:
+            undo, args = self._undo_log.pop()
+            undo(*args)
+
+    def commit(self):
+        """Keeps every recorded change and stops recording. Savepoints can no longer be rolled back to afterwards.
+        """
+        self._undo_log = None
+
     def _invalid_player_index(self, index):
-        self.warn("Invalid player index {} passed, player index should always be 0 (yourself) or 1 (your opponent)".format(index))
+        self.warn("Invalid player index {} passed, player index should always be 0 (yourself) or 1 (your opponent)", index, code=INVALID_PLAYER_INDEX)
     
     def _invalid_unit(self, unit):
-        self.warn("Invalid unit {}".format(unit))
+        self.warn("Invalid unit {}", unit, code=INVALID_UNIT)
 
     def submit_turn(self):
         """Submit and end your turn.
             Must be called at the end of your turn or the algo will hang.
+            Does nothing if the turn was already submitted, for example by the TurnBudget watchdog.
         """
         build_string = json.dumps(self._build_stack)
         deploy_string = json.dumps(self._deploy_stack)
-        send_command(build_string)
-        send_command(deploy_string)
+        budget = active_budget()
+        if budget is not None:
+            if not budget.submit(build_string, deploy_string):
+                self.warn("The turn was already submitted, this plan was not sent", code=ALREADY_SUBMITTED)
+            return
+        send_commands(build_string, deploy_string)
 
     def get_resource(self, resource_type, player_index = 0):
         """Gets a players resources
@@ -195,7 +343,7 @@ class GameState:
             self._invalid_player_index(player_index)
             return
         if not resource_type == self.MP and not resource_type == self.SP:
-            self.warn("Invalid resource_type '{}'. Please use MP (0) or SP (1)".format(resource_type))
+            self.warn("Invalid resource_type '{}'. Please use MP (0) or SP (1)", resource_type, code=INVALID_ARGUMENT)
             return
 
         if resource_type == self.MP:
@@ -247,7 +395,7 @@ class GameState:
         elif costs[SP] > 0:
             return math.floor(player_held[SP] / costs[SP])
         else:
-            self.warn("Invalid costs for unit, cost is 0 for both resources, returning 0")
+            self.warn("Invalid costs for unit, cost is 0 for both resources, returning 0", code=INVALID_UNIT)
             return 0
 
     def project_future_MP(self, turns_in_future=1, player_index=0, current_MP=None):
@@ -259,28 +407,19 @@ class GameState:
             current_MP: If we pass a value here, we will use that value instead of the current MP of the given player.
 
         Returns:
-            The number of MP the given player will have after the given number of turns
+            The number of MP the given player will have after the given number of turns, see ResourceSchedule.project_MP
 
         """
 
         if turns_in_future < 1 or turns_in_future > 99:
-            self.warn("Invalid turns in future used ({}). Turns in future should be between 1 and 99".format(turns_in_future))
+            self.warn("Invalid turns in future used ({}). Turns in future should be between 1 and 99", turns_in_future, code=INVALID_ARGUMENT)
         if not player_index == 1 and not player_index == 0:
             self._invalid_player_index(player_index)
         if type(current_MP) == int and current_MP < 0:
-            self.warn("Invalid current MP ({}). Current MP cannot be negative.".format(current_MP))
+            self.warn("Invalid current MP ({}). Current MP cannot be negative.", current_MP, code=INVALID_ARGUMENT)
 
         MP = self.get_resource(self.MP, player_index) if not current_MP else current_MP
-        for increment in range(1, turns_in_future + 1):
-            current_turn = self.turn_number + increment
-            MP *= (1 - self.config["resources"]["bitDecayPerRound"])
-            MP_per_round = self.config["resources"]["bitsPerRound"]
-            MP_ramp_ups = current_turn // self.config["resources"]["turnIntervalForBitSchedule"]
-            MP_per_round_growth = self.config["resources"]["bitGrowthRate"]
-            MP_gained = MP_per_round + (MP_per_round_growth * MP_ramp_ups)
-            MP += MP_gained
-            MP = round(MP, 1)
-        return MP
+        return ResourceSchedule.for_config(self.config).project_MP(MP, self.turn_number, turns_in_future)
 
     def type_cost(self, unit_type, upgrade=False):
         """Gets the cost of a unit based on its type
@@ -325,36 +464,47 @@ class GameState:
             return
         
         if not self.game_map.in_arena_bounds(location):
-            if self.enable_warnings:
-                self.warn("Could not spawn {} at location {}. Location invalid.".format(unit_type, location))
+            self.warn("Could not spawn {} at location {}. Location invalid.", unit_type, location, code=SPAWN_INVALID_LOCATION)
             return False
 
         affordable = self.number_affordable(unit_type) >= num
         stationary = is_stationary(unit_type)
-        blocked = self.contains_stationary_unit(location) or (stationary and len(self.game_map[location[0],location[1]]) > 0)
-        correct_territory = location[1] < self.HALF_ARENA
-        on_edge = location in (self.game_map.get_edge_locations(self.game_map.BOTTOM_LEFT) + self.game_map.get_edge_locations(self.game_map.BOTTOM_RIGHT))
-
-        if self.enable_warnings:
-            fail_reason = ""
-            if not affordable:
-                fail_reason = fail_reason + " Not enough resources."
-            if blocked:
-                fail_reason = fail_reason + " Location is blocked."
-            if not correct_territory:
-                fail_reason = fail_reason + " Location in enemy territory."
-            if not (stationary or on_edge):
-                fail_reason = fail_reason + " Information units must be deployed on the edge."
-            if len(fail_reason) > 0:
-                self.warn("Could not spawn {} at location {}.{}".format(unit_type, location, fail_reason))
-
-        return (affordable and correct_territory and not blocked and
-                (stationary or on_edge) and
-                (not stationary or num == 1))
+        return self.__check_spawn(unit_type, location, stationary, affordable) and (not stationary or num == 1)
+
+    def __check_spawn(self, unit_type, location, stationary, affordable):
+        """The checks of can_spawn after the location is known to be in bounds and affordability is computed
+        """
+        x, y = map(int, location)
+        index = x * self.ARENA_SIZE + y
+        blocked = self.game_map._structures[index] is not None or (stationary and len(self.game_map[x, y]) > 0)
+        correct_territory = geometry.HALF_MASKS[0][index]
+        on_edge = geometry.EDGE_MASK[index] & geometry.FRIENDLY_EDGE_BITS[0]
+
+        if affordable and correct_territory and not blocked and (stationary or on_edge):
+            return True
+        # The code is the first reason, the message lists them all
+        failures = [(code, reason) for failed, code, reason in (
+            (not affordable, SPAWN_UNAFFORDABLE, " Not enough resources."),
+            (blocked, SPAWN_BLOCKED, " Location is blocked."),
+            (not correct_territory, SPAWN_ENEMY_TERRITORY, " Location in enemy territory."),
+            (not (stationary or on_edge), SPAWN_NOT_ON_EDGE, " Information units must be deployed on the edge.")) if failed]
+        self.warn("Could not spawn {} at location {}.{}", unit_type, location, "".join(reason for _, reason in failures), code=failures[0][0])
+        return False
+
+    def __in_own_half(self, location):
+        """Whether location is an arena tile on your half of the board
+        """
+        if not self.game_map.in_arena_bounds(location):
+            return False
+        x, y = map(int, location)
+        return geometry.HALF_MASKS[0][x * self.ARENA_SIZE + y]
 
     def attempt_spawn(self, unit_type, locations, num=1):
         """Attempts to spawn new units with the type given in the given locations.
 
+        A whole list of structures, or a stack of mobile units, is placed in one pass: the unit cost is looked up once 
+        and each location is checked against the structure array and precomputed edge mask of the game map.
+
         Args:
             unit_type: The type of unit we want to spawn
             locations: A single location or list of locations to spawn units at
@@ -368,27 +518,35 @@ class GameState:
             self._invalid_unit(unit_type)
             return
         if num < 1 or not locations:
-            self.warn("Attempted to spawn fewer than one units! ({})".format(num))
+            self.warn("Attempted to spawn fewer than one units! ({})", num, code=INVALID_ARGUMENT)
             return
       
         if type(locations[0]) == int:
             locations = [locations]
+        costs = self.type_cost(unit_type)
+        stationary = is_stationary(unit_type)
+        stack = self._build_stack if stationary else self._deploy_stack
+        resources = self._player_resources[0]
         spawned_units = 0
         for location in locations:
+            if not self.game_map.in_arena_bounds(location):
+                self.warn("Could not spawn {} at location {}. Location invalid.", unit_type, location, code=SPAWN_INVALID_LOCATION)
+                continue
+            x, y = map(int, location)
             for i in range(num):
-                if self.can_spawn(unit_type, location, 1):
-                    x, y = map(int, location)
-                    costs = self.type_cost(unit_type)
-                    self.__set_resource(SP, 0 - costs[SP])
-                    self.__set_resource(MP, 0 - costs[MP])
-                    self.game_map.add_unit(unit_type, location, 0)
-                    if is_stationary(unit_type):
-                        self._build_stack.append((unit_type, x, y))
-                    else:
-                        self._deploy_stack.append((unit_type, x, y))
-                    spawned_units += 1
-                else:
+                # Same as number_affordable(unit_type) >= 1
+                affordable = ((costs[SP] > 0 or costs[MP] > 0) 
+                              and (costs[SP] <= 0 or math.floor(resources['SP'] / costs[SP]) >= 1) 
+                              and (costs[MP] <= 0 or math.floor(resources['MP'] / costs[MP]) >= 1))
+                if not self.__check_spawn(unit_type, location, stationary, affordable):
                     break
+                self.__set_resource(SP, 0 - costs[SP])
+                self.__set_resource(MP, 0 - costs[MP])
+                if self._undo_log is not None:
+                    self._undo_log.append((self.__restore_location, ((x, y), list(self.game_map[x, y]))))
+                self.game_map.add_unit(unit_type, location, 0)
+                self.__push(stack, (unit_type, x, y))
+                spawned_units += 1
         return spawned_units
 
     def attempt_remove(self, locations):
@@ -405,12 +563,12 @@ class GameState:
             locations = [locations]
         removed_units = 0
         for location in locations:
-            if location[1] < self.HALF_ARENA and self.contains_stationary_unit(location):
+            if self.__in_own_half(location) and self.contains_stationary_unit(location):
                 x, y = map(int, location)
-                self._build_stack.append((REMOVE, x, y))
+                self.__push(self._build_stack, (REMOVE, x, y))
                 removed_units += 1
             else:
-                self.warn("Could not remove a unit from {}. Location has no structures or is enemy territory.".format(location))
+                self.warn("Could not remove a unit from {}. Location has no structures or is enemy territory.", location, code=REMOVE_FAILED)
         return removed_units
 
     def attempt_upgrade(self, locations):
@@ -425,31 +583,29 @@ class GameState:
         """
 
         if not locations:
-            self.warn("Attempted to upgrade fewer than one units!")
+            self.warn("Attempted to upgrade fewer than one units!", code=INVALID_ARGUMENT)
             return
 
         if type(locations[0]) == int:
             locations = [locations]
         spawned_units = 0
         for location in locations:
-            if location[1] < self.HALF_ARENA and self.contains_stationary_unit(location):
+            existing_unit = self.contains_stationary_unit(location) if self.__in_own_half(location) else False
+            if existing_unit:
                 x, y = map(int, location)
-                existing_unit = None
-                for unit in self.game_map[x,y]:
-                    if unit.stationary:
-                        existing_unit = unit
-
                 if not existing_unit.upgraded and self.config["unitInformation"][UNIT_TYPE_TO_INDEX[existing_unit.unit_type]].get("upgrade", None) is not None:
                     costs = self.type_cost(existing_unit.unit_type, True)
                     resources = self.get_resources()
                     if resources[SP] >= costs[SP] and resources[MP] >= costs[MP]:
                         self.__set_resource(SP, 0 - costs[SP])
                         self.__set_resource(MP, 0 - costs[MP])
-                        existing_unit.upgrade()
-                        self._build_stack.append((UPGRADE, x, y))
+                        if self._undo_log is not None:
+                            self._undo_log.append((self.__restore_upgrade, ((x, y), list(self.game_map[x, y]), existing_unit, existing_unit._stats, existing_unit.upgraded)))
+                        self.game_map.upgrade_unit([x,y])
+                        self.__push(self._build_stack, (UPGRADE, x, y))
                         spawned_units += 1
             else:
-                self.warn("Could not upgrade a unit from {}. Location has no structures or is enemy territory.".format(location))
+                self.warn("Could not upgrade a unit from {}. Location has no structures or is enemy territory.", location, code=UPGRADE_FAILED)
         return spawned_units
 
     def get_target_edge(self, start_location):
@@ -489,7 +645,7 @@ class GameState:
 
         """
         if self.contains_stationary_unit(start_location):
-            self.warn("Attempted to perform pathing from blocked starting location {}".format(start_location))
+            self.warn("Attempted to perform pathing from blocked starting location {}", start_location, code=PATH_BLOCKED_START)
             return
 
         if target_edge is None:
@@ -498,6 +654,37 @@ class GameState:
         end_points = self.game_map.get_edge_locations(target_edge)
         return self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
 
+    def find_paths_from_edges(self, player_index=0):
+        """Gets the path a unit would take from every edge location a player can deploy on, in one pass.
+
+        Locations are grouped by target edge so the search towards each edge is only done once.
+
+        Args:
+            player_index: The player whose deploy edges are used, 0 for you 1 for the enemy
+
+        Returns:
+            A PathTable whose locations are the player's two edges, left edge first. 
+            Paths from locations blocked by a structure are None.
+
+        """
+        if not player_index == 1 and not player_index == 0:
+            self._invalid_player_index(player_index)
+            return
+
+        if player_index == 0:
+            edges = [self.game_map.BOTTOM_LEFT, self.game_map.BOTTOM_RIGHT]
+        else:
+            edges = [self.game_map.TOP_LEFT, self.game_map.TOP_RIGHT]
+
+        locations = []
+        paths = []
+        for edge in edges:
+            start_points = self.game_map.get_edge_locations(edge)
+            end_points = self.game_map.get_edge_locations(self.get_target_edge(start_points[0]))
+            locations += start_points
+            paths += self._shortest_path_finder.navigate_from_many(start_points, end_points, self)
+        return PathTable(locations, paths, self.ARENA_SIZE)
+
     def contains_stationary_unit(self, location):
         """Check if a location is blocked, return structures unit if it is
 
@@ -509,20 +696,18 @@ class GameState:
             
         """
         if not self.game_map.in_arena_bounds(location):
-            self.warn('Checked for stationary unit outside of arena bounds')
+            self.warn('Checked for stationary unit outside of arena bounds', code=OUT_OF_BOUNDS)
             return False
-        x, y = map(int, location)
-        for unit in self.game_map[x,y]:
-            if unit.stationary:
-                return unit
-        return False
+        structure = self.game_map._structures[self.game_map.get_index(location)]
+        return structure if structure is not None else False
 
-    def warn(self, message):
-        """ Used internally by game_state to print warnings
-        """
+    def warn(self, message, *args, code=GENERAL):
+        """ Used internally by game_state to report warnings, see diagnostics.Diagnostics
 
-        if(self.enable_warnings):
-            debug_write(message)
+        Warnings are counted per code, and only the first few of each code are printed every turn. 
+        message is formatted with args only if it is printed.
+        """
+        self.diagnostics.report(code, message, *args, show=self.enable_warnings)
 
     def suppress_warnings(self, suppress):
         """Suppress all warnings
@@ -551,68 +736,86 @@ class GameState:
         """
 
         if not isinstance(attacking_unit, GameUnit):
-            self.warn("Passed a {} to get_target as attacking_unit. Expected a GameUnit.".format(type(attacking_unit)))
+            self.warn("Passed a {} to get_target as attacking_unit. Expected a GameUnit.", type(attacking_unit), code=INVALID_ARGUMENT)
             return
+        return self.get_targets([attacking_unit])[0][1]
 
-        attacker_location = [attacking_unit.x, attacking_unit.y]
-        possible_locations = self.game_map.get_locations_in_range(attacker_location, attacking_unit.attackRange)
-        target = None
-        target_stationary = True
-        target_distance = sys.maxsize
-        target_health = sys.maxsize
-        target_y = self.ARENA_SIZE
-        target_x_distance = 0
+    def get_targets(self, attackers=None):
+        """Returns the target of many units at once, as get_target would choose them on the current map
 
-        for location in possible_locations:
-            for unit in self.game_map[location]:
-                if unit.player_index == attacking_unit.player_index or (attacking_unit.damage_f == 0 and is_stationary(unit.unit_type)) or (attacking_unit.damage_i == 0 and not(is_stationary(unit.unit_type))):
-                    continue
-
-                new_target = False
-                unit_stationary = unit.stationary
-                unit_distance = self.game_map.distance_between_locations(location, [attacking_unit.x, attacking_unit.y])
-                unit_health = unit.health
-                unit_y = unit.y
-                unit_x_distance = abs(self.HALF_ARENA - 0.5 - unit.x)
-
-                if target_stationary and not unit_stationary:
-                    new_target = True
-                elif not target_stationary and unit_stationary:
-                    continue
-                
-                if target_distance > unit_distance:
-                    new_target = True
-                elif target_distance < unit_distance and not new_target:
-                    continue
-
-                if target_health > unit_health:
-                    new_target = True
-                elif target_health < unit_health and not new_target:
-                    continue
-
-                # Compare height heuristic relative to attacking unit's player index
-                if attacking_unit.player_index == 0:
-                    if target_y > unit_y:
-                        new_target = True
-                    elif target_y < unit_y and not new_target:
-                        continue
-                else:
-                    if target_y < unit_y:
-                        new_target = True
-                    elif target_y > unit_y and not new_target:
-                        continue
-
-                if target_x_distance < unit_x_distance:
-                    new_target = True
-                
-                if new_target:
-                    target = unit
-                    target_stationary = unit_stationary
-                    target_distance = unit_distance
-                    target_health = unit_health
-                    target_y = unit_y
-                    target_x_distance = unit_x_distance
-        return target
+        The tiles holding mobile units of each player are indexed once per change to the map, and each attacker 
+        searches the tiles in its range nearest first, stopping at the first distance with a target. 
+        Units must be on tiles refreshed by GameMap.sync_location, as add_unit and remove_unit do.
+
+        Args:
+            attackers: A list of GameUnits, defaults to every unit on the map that can attack
+
+        Returns:
+            A list of (attacking unit, target) pairs in the order of attackers, the target being None if nothing is in range
+
+        """
+        game_map = self.game_map
+        if attackers is None:
+            attackers = [unit for location in game_map.occupied_locations() for unit in game_map[location] 
+                         if unit.damage_f > 0 or unit.damage_i > 0]
+
+        version = game_map.units_version
+        if self._mobile_tiles is None or self._mobile_tiles[0] != version:
+            mobile_tiles = (set(), set())
+            for location in game_map.occupied_locations():
+                for unit in game_map[location]:
+                    if not unit.stationary:
+                        # Indexed by the player attacking them
+                        mobile_tiles[1 - unit.player_index].add(location[0] * self.ARENA_SIZE + location[1])
+            self._mobile_tiles = (version, mobile_tiles)
+        mobile_tiles = self._mobile_tiles[1]
+
+        size = self.ARENA_SIZE
+        in_bounds = game_map._in_bounds
+        structures = game_map._structures
+        tolerance = self.config["unitInformation"][0]['getHitRadius']
+        targets = []
+        for attacker in attackers:
+            x = int(attacker.x)
+            y = int(attacker.y)
+            player_index = attacker.player_index
+            shells = geometry.get_range_shells(attacker.attackRange, tolerance)
+            target = None
+            if attacker.damage_i > 0:
+                tiles = mobile_tiles[player_index]
+                best_key = None
+                for distance, offsets in shells:
+                    for dx, dy in offsets:
+                        i = x + dx
+                        j = y + dy
+                        index = i * size + j
+                        if 0 <= i < size and 0 <= j < size and index in tiles and in_bounds[index]:
+                            for unit in game_map[i, j]:
+                                if unit.player_index == player_index or unit.stationary:
+                                    continue
+                                key = target_key(False, distance, unit.health, i, j, player_index)
+                                if best_key is None or key < best_key:
+                                    best_key = key
+                                    target = unit
+                    if target is not None:
+                        break
+            if target is None and attacker.damage_f > 0:
+                best_key = None
+                for distance, offsets in shells:
+                    for dx, dy in offsets:
+                        i = x + dx
+                        j = y + dy
+                        if 0 <= i < size and 0 <= j < size:
+                            unit = structures[i * size + j]
+                            if unit is not None and unit.player_index != player_index:
+                                key = target_key(True, distance, unit.health, i, j, player_index)
+                                if best_key is None or key < best_key:
+                                    best_key = key
+                                    target = unit
+                    if target is not None:
+                        break
+            targets.append((attacker, target))
+        return targets
 
     def get_attackers(self, location, player_index):
         """Gets the stationary units threatening a given location
@@ -629,19 +832,289 @@ class GameState:
         if not player_index == 0 and not player_index == 1:
             self._invalid_player_index(player_index)
         if not self.game_map.in_arena_bounds(location):
-            self.warn("Location {} is not in the arena bounds.".format(location))
+            self.warn("Location {} is not in the arena bounds.", location, code=OUT_OF_BOUNDS)
 
         attackers = []
         """
         Get locations in the range of TURRET units
         """
-        max_range = 0
-        for unit in self.config["unitInformation"]:
-            if unit.get('attackRange', 0) >= max_range:
-                max_range = unit.get('attackRange', 0)
-        possible_locations= self.game_map.get_locations_in_range(location, max_range)
-        for location_unit in possible_locations:
-            for unit in self.game_map[location_unit]:
-                if unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and self.game_map.distance_between_locations(location, location_unit) <= unit.attackRange:
+        max_range = self._max_attack_range
+        if max_range is None:
+            max_range = 0
+            for unit in self.config["unitInformation"]:
+                if unit.get('attackRange', 0) >= max_range:
+                    max_range = unit.get('attackRange', 0)
+            self._max_attack_range = max_range
+        x, y = location
+        if type(x) is not int or type(y) is not int:
+            possible_locations= self.game_map.get_locations_in_range(location, max_range)
+            for location_unit in possible_locations:
+                for unit in self.game_map[location_unit]:
+                    if unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and self.game_map.distance_between_locations(location, location_unit) <= unit.attackRange:
+                        attackers.append(unit)
+            return attackers
+
+        # Only visit the occupied tiles in range, in flat index order, and compare squared distances, see geometry.squared_range
+        size = self.ARENA_SIZE
+        tolerance = self.config["unitInformation"][0]['getHitRadius']
+        for index in sorted(geometry.tiles_in_range((location, ), max_range, tolerance).intersection(self.game_map._occupied)):
+            i = index // size
+            j = index % size
+            squared = (i - x) * (i - x) + (j - y) * (j - y)
+            for unit in self.game_map[i, j]:
+                if unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and squared <= geometry.squared_range(unit.attackRange, 0, True):
                     attackers.append(unit)
         return attackers
+
+    def __get_unit_counts(self, player_index, unit_type, stationary):
+        """
+        Builds, or gets from the cache, the summed area table of the matching units: 
+        entry (x + 1) * (ARENA_SIZE + 1) + (y + 1) is the number of units with coordinates at most x and y.
+        The table is cached until a location is refreshed on the map.
+        """
+        key = (player_index, unit_type, stationary)
+        version = self.game_map.units_version
+        cached = self._unit_counts.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        size = self.ARENA_SIZE
+        counts = [0] * (size * size)
+        for x, y in self.game_map.occupied_locations():
+            for unit in self.game_map[x, y]:
+                if (unit.player_index == player_index and (unit_type is None or unit.unit_type == unit_type) 
+                        and (stationary is None or unit.stationary == stationary)):
+                    counts[x * size + y] += 1
+
+        stride = size + 1
+        table = [0] * (stride * stride)
+        for x in range(size):
+            running = 0
+            for y in range(size):
+                running += counts[x * size + y]
+                table[(x + 1) * stride + y + 1] = table[x * stride + y + 1] + running
+        self._unit_counts[key] = (version, table)
+        return table
+
+    def count_units(self, player_index=0, unit_type=None, x_range=None, y_range=None, stationary=None):
+        """Counts the units of a player in a rectangle of the board, such as a row band or one side
+
+        The counts are indexed once per player, unit type and stationary filter, and the index is reused until units 
+        are added, removed or replaced, so each query costs the same whatever the size of the rectangle.
+
+        Args:
+            player_index: The index corresponding to the player whose units are counted, 0 for you 1 for the enemy
+            unit_type: Only count units of this type, or None for every type
+            x_range: The (lowest, highest) x coordinates to count, inclusive, or None for the whole board width
+            y_range: The (lowest, highest) y coordinates to count, inclusive, or None for the whole board height
+            stationary: True to only count structures, False to only count mobile units, None to count both
+
+        Returns:
+            The number of matching units
+
+        """
+        if not player_index == 0 and not player_index == 1:
+            self._invalid_player_index(player_index)
+            return 0
+
+        size = self.ARENA_SIZE
+        x_min, x_max = (0, size - 1) if x_range is None else (max(x_range[0], 0), min(x_range[1], size - 1))
+        y_min, y_max = (0, size - 1) if y_range is None else (max(y_range[0], 0), min(y_range[1], size - 1))
+        if x_min > x_max or y_min > y_max:
+            return 0
+        table = self.__get_unit_counts(player_index, unit_type, stationary)
+        stride = size + 1
+        return (table[(x_max + 1) * stride + y_max + 1] - table[x_min * stride + y_max + 1] 
+                - table[(x_max + 1) * stride + y_min] + table[x_min * stride + y_min])
+
+    def get_unit_counts(self, player_index=0, stationary=None):
+        """Counts the units of a player on the whole board by type
+
+        Args:
+            player_index: The index corresponding to the player whose units are counted, 0 for you 1 for the enemy
+            stationary: True to only count structures, False to only count mobile units, None to count both
+
+        Returns:
+            A dict from unit type to the number of units of that type, types without units are left out
+
+        """
+        if not player_index == 0 and not player_index == 1:
+            self._invalid_player_index(player_index)
+            return {}
+
+        counts = {}
+        for location in self.game_map.occupied_locations():
+            for unit in self.game_map[location]:
+                if unit.player_index == player_index and (stationary is None or unit.stationary == stationary):
+                    counts[unit.unit_type] = counts.get(unit.unit_type, 0) + 1
+        return counts
+
+    def get_threat_map(self, player_index=0):
+        """Gets the damage per frame a mobile unit would take from enemy structures on every tile
+
+        The map is built in one pass over all enemy structures that can attack mobile units, using their
+        current (possibly upgraded) attackRange and damage_i, and is cached until a structure is added, removed or upgraded.
+        A tile is threatened by a structure under the same rule get_attackers uses.
+
+        Args:
+            player_index: The index corresponding to the player controlling the mobile unit, 0 for you 1 for the enemy
+
+        Returns:
+            A list indexed by flat tile index (x * ARENA_SIZE + y, see GameMap.get_index) with the total damage per frame on that tile
+
+        """
+        if not player_index == 0 and not player_index == 1:
+            self._invalid_player_index(player_index)
+            return
+
+        version = self.game_map.layout_version
+        cached = self._threat_maps.get(player_index)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        threat_map = [0.0] * (self.ARENA_SIZE * self.ARENA_SIZE)
+        for unit in self.game_map._structures:
+            if unit is None or unit.player_index == player_index or unit.damage_i <= 0:
+                continue
+            for index in geometry.tiles_in_range(((unit.x, unit.y), ), unit.attackRange, 0, True):
+                threat_map[index] += unit.damage_i
+
+        self._threat_maps[player_index] = (version, threat_map)
+        return threat_map
+
+    def get_threat(self, location, player_index=0):
+        """Gets the damage per frame a mobile unit would take from enemy structures at a location
+
+        Args:
+            location: The location of a hypothetical mobile unit
+            player_index: The index corresponding to the player controlling the mobile unit, 0 for you 1 for the enemy
+
+        Returns:
+            The total damage per frame from every enemy structure in range, see get_threat_map
+
+        """
+        if not self.game_map.in_arena_bounds(location):
+            self.warn("Location {} is not in the arena bounds.", location, code=OUT_OF_BOUNDS)
+            return 0
+        return self.get_threat_map(player_index)[self.game_map.get_index(location)]
+
+    def get_path_threat(self, path, player_index=0):
+        """Sums the damage per frame of every tile along a path
+
+        Args:
+            path: A list of locations, such as the result of find_path_to_edge
+            player_index: The index corresponding to the player controlling the mobile unit, 0 for you 1 for the enemy
+
+        Returns:
+            The sum of the threat map over the tiles of the path
+
+        """
+        threat_map = self.get_threat_map(player_index)
+        return sum([threat_map[int(x) * self.ARENA_SIZE + int(y)] for x, y in path])
+
+    def get_shield_map(self, player_index=0):
+        """Gets which supports of a player shield mobile units on every tile
+
+        The map is built in one pass over the player's supports, using their current (possibly upgraded) shieldRange, 
+        shieldPerUnit and shieldBonusPerY, and is cached until a structure is added, removed or upgraded. 
+        A tile is shielded by a support under the same rule the action phase simulator uses.
+
+        Args:
+            player_index: The index corresponding to the player controlling the mobile unit, 0 for you 1 for the enemy
+
+        Returns:
+            A ShieldMap with one bit per support
+
+        """
+        if not player_index == 0 and not player_index == 1:
+            self._invalid_player_index(player_index)
+            return
+
+        version = self.game_map.layout_version
+        cached = self._shield_maps.get(player_index)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        masks = [0] * (self.ARENA_SIZE * self.ARENA_SIZE)
+        amounts = []
+        tolerance = self.config["unitInformation"][0]['getHitRadius']
+        for unit in self.game_map._structures:
+            if unit is None or unit.player_index != player_index or unit.shieldPerUnit <= 0 or unit.shieldRange <= 0:
+                continue
+            bonus_y = unit.y if player_index == 0 else self.ARENA_SIZE - 1 - unit.y
+            bit = 1 << len(amounts)
+            amounts.append(unit.shieldPerUnit + unit.shieldBonusPerY * bonus_y)
+            for index in geometry.tiles_in_range(((unit.x, unit.y), ), unit.shieldRange, tolerance):
+                masks[index] |= bit
+
+        shield_map = ShieldMap(masks, amounts)
+        self._shield_maps[player_index] = (version, shield_map)
+        return shield_map
+
+    def get_path_shield(self, path, player_index=0):
+        """Gets the shield a mobile unit collects walking along a path
+
+        Each support shields a unit once, however many tiles of the path it covers. 
+        Supports are assumed to survive the whole action phase.
+
+        Args:
+            path: A list of locations, such as the result of find_path_to_edge
+            player_index: The index corresponding to the player controlling the mobile unit, 0 for you 1 for the enemy
+
+        Returns:
+            The total shield given by the player's supports in range of any tile of the path
+
+        """
+        masks, amounts = self.get_shield_map(player_index)
+        covered = 0
+        for x, y in path:
+            covered |= masks[int(x) * self.ARENA_SIZE + int(y)]
+        return self.__sum_shields(covered, amounts)
+
+    def get_path_shields(self, paths, player_index=0):
+        """Gets the shield a mobile unit collects along every path of a PathTable, such as the result of find_paths_from_edges
+
+        Args:
+            paths: A PathTable
+            player_index: The index corresponding to the player controlling the mobile unit, 0 for you 1 for the enemy
+
+        Returns:
+            A list with the shield collected along each path, see get_path_shield, None for blocked start locations
+
+        """
+        masks, amounts = self.get_shield_map(player_index)
+        shields = []
+        for path, indexes in zip(paths.paths, paths.indexes):
+            if not path:
+                shields.append(None)
+                continue
+            covered = 0
+            for index in indexes:
+                covered |= masks[index]
+            shields.append(self.__sum_shields(covered, amounts))
+        return shields
+
+    @staticmethod
+    def __sum_shields(covered, amounts):
+        total = 0
+        while covered:
+            lowest = covered & -covered
+            total += amounts[lowest.bit_length() - 1]
+            covered ^= lowest
+        return total
+
+    def simulate_deploys(self, plans, enemy_deploys=(), processes=None):
+        """Predicts the action phase for each of many candidate deploys, see simulation.ActionSimulator
+
+        Path searches are shared between all the plans, and plans can be spread over a process pool.
+
+        Args:
+            plans: A list of candidate deploys, each a list of (unit_type, x, y) like the ones attempt_spawn adds to the deploy stack
+            enemy_deploys: A list of (unit_type, x, y) your opponent deploys in every plan
+            processes: The number of worker processes to use, or None to simulate every plan in this process
+
+        Returns:
+            A list of SimulationResult, in the same order as plans
+
+        """
+        return simulate_many(self, plans, enemy_deploys, processes)
@@ -0,0 +1,253 @@
+"""
+Precomputed geometry of the diamond shaped game board, shared by GameMap, ShortestPathFinder and the scripts.
+
+Tiles are identified by their flat index x * ARENA_SIZE + y, as in GameMap.get_index.
+Distances between tiles are compared as integer squared distances, see squared_range, which gives 
+the same results as comparing math.sqrt distances, getHitRadius tolerance included.
+Everything here is computed once when the module is imported and must not be modified.
+This module does not import anything from gamelib, so scripts can load it on its own.
+"""
+
+import math
+
+ARENA_SIZE = 28
+HALF_ARENA = ARENA_SIZE // 2
+NUM_TILES = ARENA_SIZE * ARENA_SIZE
+
+# Quadrant descriptions, in the order of GameMap.get_edges
+TOP_RIGHT = 0
+TOP_LEFT = 1
+BOTTOM_LEFT = 2
+BOTTOM_RIGHT = 3
+
+
+def _in_diamond(x, y):
+    # The diamond bounds arithmetic of GameMap.in_arena_bounds
+    row_size = y + 1
+    startx = HALF_ARENA - row_size
+    endx = startx + (2 * row_size) - 1
+    top_half_check = (y < HALF_ARENA and x >= startx and x <= endx)
+
+    row_size = (ARENA_SIZE - 1 - y) + 1
+    startx = HALF_ARENA - row_size
+    endx = startx + (2 * row_size) - 1
+    bottom_half_check = (y >= HALF_ARENA and x >= startx and x <= endx)
+
+    return bottom_half_check or top_half_check
+
+
+# 1 for each flat index inside the board
+VALID_MASK = bytes(_in_diamond(x, y) for x in range(ARENA_SIZE) for y in range(ARENA_SIZE))
+
+# The playable tiles row by row from the bottom, left to right, the order GameMap iterates in
+LOCATIONS = tuple((x, y) for y in range(ARENA_SIZE) for x in range(ARENA_SIZE) if VALID_MASK[x * ARENA_SIZE + y])
+CELL_INDEXES = tuple(x * ARENA_SIZE + y for x, y in LOCATIONS)
+
+# The position in LOCATIONS of every flat index, -1 outside of the board
+CELL_NUMBERS = [-1] * NUM_TILES
+for _number, _index in enumerate(CELL_INDEXES):
+    CELL_NUMBERS[_index] = _number
+CELL_NUMBERS = tuple(CELL_NUMBERS)
+
+# 1 for the playable tiles of each half of the board, player 0 owns the bottom half
+BOTTOM_HALF_MASK = bytes(VALID_MASK[x * ARENA_SIZE + y] and y < HALF_ARENA for x in range(ARENA_SIZE) for y in range(ARENA_SIZE))
+TOP_HALF_MASK = bytes(VALID_MASK[x * ARENA_SIZE + y] and y >= HALF_ARENA for x in range(ARENA_SIZE) for y in range(ARENA_SIZE))
+HALF_MASKS = (BOTTOM_HALF_MASK, TOP_HALF_MASK)
+
+# The locations of each edge, indexed by quadrant description, in the order of GameMap.get_edges
+EDGES = (
+    tuple((HALF_ARENA + num, ARENA_SIZE - 1 - num) for num in range(HALF_ARENA)),
+    tuple((HALF_ARENA - 1 - num, ARENA_SIZE - 1 - num) for num in range(HALF_ARENA)),
+    tuple((HALF_ARENA - 1 - num, num) for num in range(HALF_ARENA)),
+    tuple((HALF_ARENA + num, num) for num in range(HALF_ARENA)),
+)
+
+# Bit 1 << quadrant description is set for each edge a flat index is on
+EDGE_MASK = bytearray(NUM_TILES)
+for _quadrant, _edge in enumerate(EDGES):
+    for _x, _y in _edge:
+        EDGE_MASK[_x * ARENA_SIZE + _y] |= 1 << _quadrant
+EDGE_MASK = bytes(EDGE_MASK)
+
+# The EDGE_MASK bits of each player's two deploy edges, player 0 deploys from the bottom edges
+FRIENDLY_EDGE_BITS = ((1 << BOTTOM_LEFT) | (1 << BOTTOM_RIGHT), (1 << TOP_LEFT) | (1 << TOP_RIGHT))
+
+# The in bounds neighbors of every flat index, up, down, right then left as in ShortestPathFinder._get_neighbors
+NEIGHBORS = tuple(
+    tuple(nx * ARENA_SIZE + ny for nx, ny in ((x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y))
+          if 0 <= nx < ARENA_SIZE and 0 <= ny < ARENA_SIZE and VALID_MASK[nx * ARENA_SIZE + ny])
+    for x in range(ARENA_SIZE) for y in range(ARENA_SIZE))
+
+
+# The largest squared distance between two tiles of the board
+MAX_SQUARED_DISTANCE = 2 * (ARENA_SIZE - 1) ** 2
+
+# The distance of every integer squared distance up to MAX_SQUARED_DISTANCE, as math.sqrt computes it
+DISTANCES = tuple(math.sqrt(squared) for squared in range(MAX_SQUARED_DISTANCE + 1))
+
+_SQUARED_RANGES = {}
+_OFFSETS = {}
+_SHELLS = {}
+_RANGE_TILES = {}
+
+
+def squared_range(radius, tolerance=0, inclusive=False):
+    """Gets the largest integer squared distance within a radius
+
+    Since math.sqrt is monotonic, math.sqrt(dx ** 2 + dy ** 2) < radius + tolerance holds exactly for the integer 
+    offsets with dx ** 2 + dy ** 2 <= squared_range(radius, tolerance), and likewise with <= when inclusive is True. 
+    Comparing squared distances to it gives the same results as comparing distances, without any square root.
+
+    Args:
+        radius: The radius of the search area
+        tolerance: Added to the radius, such as the getHitRadius of the game config
+        inclusive: If True, squared distances at exactly radius + tolerance are included
+
+    Returns:
+        The largest squared distance in range, -1 if even the origin is not
+
+    """
+    key = (radius, tolerance, inclusive)
+    squared = _SQUARED_RANGES.get(key)
+    if squared is None:
+        limit = radius + tolerance
+        squared = max(int(limit) ** 2 - 1, -1)
+        while squared + 1 <= MAX_SQUARED_DISTANCE * 2 and (math.sqrt(squared + 1) < limit or (inclusive and math.sqrt(squared + 1) == limit)):
+            squared += 1
+        _SQUARED_RANGES[key] = squared
+    return squared
+
+
+def get_range_offsets(radius, tolerance=0, inclusive=False):
+    """Gets the offsets of every location within a radius of the origin, computed once per distinct radius
+
+    Every other range query, GameMap.get_range_stencil, get_range_shells and tiles_in_range, is built from these 
+    offsets, so they all follow the same tolerance and inclusive rules.
+
+    Args:
+        radius: The radius of the search area
+        tolerance: Added to the radius, such as the getHitRadius of the game config
+        inclusive: If True, offsets at exactly radius + tolerance are included
+
+    Returns:
+        A tuple of (dx, dy) ordered by dx and then dy
+
+    """
+    key = (radius, tolerance, inclusive)
+    offsets = _OFFSETS.get(key)
+    if offsets is None:
+        in_range = squared_range(radius, tolerance, inclusive)
+        search_radius = max(math.ceil(radius + tolerance), 0)
+        offsets = tuple((dx, dy) for dx in range(-search_radius, search_radius + 1) for dy in range(-search_radius, search_radius + 1)
+                        if dx * dx + dy * dy <= in_range)
+        _OFFSETS[key] = offsets
+    return offsets
+
+
+def get_range_shells(radius, tolerance):
+    """Gets the offsets of get_range_offsets(radius, tolerance) grouped by distance, computed once per distinct radius
+
+    A search can stop at the first distance where it finds what it looks for.
+
+    Args:
+        radius: The radius of the search area
+        tolerance: Added to the radius, such as the getHitRadius of the game config
+
+    Returns:
+        A tuple of (distance, offsets) pairs, nearest first, where offsets is a tuple of (dx, dy) ordered by dx and then dy
+
+    """
+    key = (radius, tolerance)
+    shells = _SHELLS.get(key)
+    if shells is None:
+        by_distance = {}
+        for dx, dy in get_range_offsets(radius, tolerance):
+            by_distance.setdefault(dx * dx + dy * dy, []).append((dx, dy))
+        shells = tuple((math.sqrt(squared), tuple(offsets)) for squared, offsets in sorted(by_distance.items()))
+        _SHELLS[key] = shells
+    return shells
+
+
+def tiles_in_range(points, radius, tolerance=0, inclusive=False):
+    """Gets every tile of the board within a radius of any of a set of points
+
+    The tiles around each point on the board are computed once per distinct radius and reused, so get_attackers, 
+    get_threat_map and get_shield_map only pay for the tiles actually in range.
+
+    Args:
+        points: Integer locations, such as the locations of a player's turrets
+        radius: The radius around each point
+        tolerance: Added to the radius, such as the getHitRadius of the game config
+        inclusive: If True, tiles at exactly radius + tolerance are included
+
+    Returns:
+        A set of flat indexes
+
+    """
+    key = (radius, tolerance, inclusive)
+    table = _RANGE_TILES.get(key)
+    if table is None:
+        table = _RANGE_TILES[key] = [None] * (ARENA_SIZE * ARENA_SIZE)
+    tiles = set()
+    for x, y in points:
+        if 0 <= x < ARENA_SIZE and 0 <= y < ARENA_SIZE:
+            # The tiles around each point are computed once, then reused by every later call
+            around = table[x * ARENA_SIZE + y]
+            if around is None:
+                around = table[x * ARENA_SIZE + y] = _tiles_around(x, y, radius, tolerance, inclusive)
+            tiles.update(around)
+        else:
+            tiles.update(_tiles_around(x, y, radius, tolerance, inclusive))
+    return tiles
+
+
+def _tiles_around(x, y, radius, tolerance, inclusive):
+    tiles = []
+    for dx, dy in get_range_offsets(radius, tolerance, inclusive):
+        i = x + dx
+        j = y + dy
+        if 0 <= i < ARENA_SIZE and 0 <= j < ARENA_SIZE and VALID_MASK[i * ARENA_SIZE + j]:
+            tiles.append(i * ARENA_SIZE + j)
+    return tuple(tiles)
+
+
+def in_arena_bounds(location):
+    """Checks if the given location is inside the diamond shaped game board.
+
+    Args:
+        location: A map location
+
+    Returns:
+        True if the location is on the board, False otherwise
+
+    """
+    x, y = location
+    if type(x) is int and type(y) is int:
+        return 0 <= x < ARENA_SIZE and 0 <= y < ARENA_SIZE and VALID_MASK[x * ARENA_SIZE + y] == 1
+    return _in_diamond(x, y)
+
+
+def get_index(location):
+    """Gets the flat index of a location
+
+    Args:
+        location: A location inside the board
+
+    Returns:
+        x * ARENA_SIZE + y
+
+    """
+    return int(location[0]) * ARENA_SIZE + int(location[1])
+
+
+def get_location(index):
+    """Gets the location of a flat index
+
+    Args:
+        index: A flat index
+
+    Returns:
+        The location [x, y]
+
+    """
+    return [index // ARENA_SIZE, index % ARENA_SIZE]
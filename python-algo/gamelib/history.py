@@ -0,0 +1,235 @@
+from collections import deque, namedtuple
+
+from .geometry import ARENA_SIZE
+from .resources import ResourceSchedule
+
+# Positions in config["unitInformation"] and in the p1Units / p2Units lists of a game state
+STRUCTURE_INDEXES = (0, 1, 2)
+UPGRADE_INDEX = 7
+
+TurnRecord = namedtuple("TurnRecord", "turn_number added removed stats")
+TurnRecord.__doc__ = """The changes to the structures since the previous recorded turn
+
+    * turn_number (int): The turn the record was made at
+    * added (tuple): (index, type_index, player_index, upgraded) of every structure that appeared or changed
+    * removed (tuple): (index, type_index, player_index, upgraded) of every structure that disappeared or changed, as it was before
+    * stats (tuple): The p1Stats and p2Stats of the turn, as (health, SP, MP, time) tuples
+"""
+
+
+def parse_structures(state):
+    """Reads the structures of a decoded game state
+
+    Args:
+        state: A game state decoded from json, with p1Units and p2Units
+
+    Returns:
+        A dict from flat tile index (x * 28 + y) to (type_index, player_index, upgraded)
+
+    """
+    structures = {}
+    for player_index, key in enumerate(("p1Units", "p2Units")):
+        units = state[key]
+        for type_index in STRUCTURE_INDEXES:
+            for unit in units[type_index]:
+                structures[int(unit[0]) * ARENA_SIZE + int(unit[1])] = (type_index, player_index, 0)
+        if len(units) > UPGRADE_INDEX:
+            for unit in units[UPGRADE_INDEX]:
+                index = int(unit[0]) * ARENA_SIZE + int(unit[1])
+                if index in structures:
+                    structures[index] = structures[index][:2] + (1,)
+    return structures
+
+
+class TurnHistory:
+    """Keeps the board of every recent turn, as the structures that changed between turns
+
+    Only the structures of the latest turn are stored in full. Each turn adds a TurnRecord with the changes
+    since the previous one, and only the last max_turns records are kept, so memory stays bounded however
+    long the game is. AlgoCore records every turn in self.history before calling on_turn.
+
+    Attributes :
+        * max_turns (int): How many records are kept
+        * records (deque): The TurnRecord of each recorded turn, oldest first
+        * structures (dict): The structures of the latest turn, see parse_structures
+
+    """
+    def __init__(self, max_turns=100):
+        self.max_turns = max_turns
+        self.records = deque(maxlen=max_turns)
+        self.structures = {}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Calls listener with every new TurnRecord, for example to update an EnemyPredictor
+
+        Args:
+            listener: A function taking the new TurnRecord and this history
+
+        """
+        self._listeners.append(listener)
+
+    def record(self, state):
+        """Records a turn
+
+        Args:
+            state: The game state of the turn, decoded from json
+
+        Returns:
+            The new TurnRecord
+
+        """
+        structures = parse_structures(state)
+        previous = self.structures
+        added = tuple((index, ) + structure for index, structure in structures.items() if previous.get(index) != structure)
+        removed = tuple((index, ) + structure for index, structure in previous.items() if structures.get(index) != structure)
+        stats = tuple(tuple(float(value) for value in state[key][:4]) for key in ("p1Stats", "p2Stats"))
+        record = TurnRecord(int(state["turnInfo"][1]), added, removed, stats)
+        self.structures = structures
+        self.records.append(record)
+        for listener in self._listeners:
+            listener(record, self)
+        return record
+
+    def get_structures(self, turns_ago=0):
+        """Rebuilds the structures of an earlier turn by undoing the records since then
+
+        Args:
+            turns_ago: 0 for the latest recorded turn, 1 for the one before, up to len(records) - 1
+
+        Returns:
+            A dict from flat tile index to (type_index, player_index, upgraded), or None if that turn is no longer kept
+
+        """
+        if turns_ago < 0 or turns_ago >= len(self.records):
+            return None
+        structures = dict(self.structures)
+        for offset in range(turns_ago):
+            record = self.records[-1 - offset]
+            for entry in record.added:
+                del structures[entry[0]]
+            for entry in record.removed:
+                structures[entry[0]] = entry[1:]
+        return structures
+
+    def get_stats(self, player_index, turns_ago=0):
+        """Gets the (health, SP, MP, time) of a player on a recorded turn
+
+        Args:
+            player_index: 0 for you, 1 for your opponent
+            turns_ago: 0 for the latest recorded turn, 1 for the one before and so on
+
+        Returns:
+            The stats, or None if that turn is no longer kept
+
+        """
+        if turns_ago < 0 or turns_ago >= len(self.records):
+            return None
+        return self.records[-1 - turns_ago].stats[player_index]
+
+
+class EnemyPredictor:
+    """Forecasts the structures and MP spending of the opponent from a TurnHistory
+
+    Every recorded turn updates running scores in time proportional to the number of changed structures:
+    each tile scores how often the opponent builds there and how often their structure there was destroyed,
+    with older turns counting less, and the opponent's MP spending is estimated from the change in their
+    MP between turns. AlgoCore keeps one in self.enemy_predictor.
+
+    Attributes :
+        * decay (float): How much the score of past builds is kept each turn, more than 0 and at most 1
+        * build_scores (dict): Flat tile index to {type_index: score} of the opponent's past builds
+        * spend_fractions (deque): The fraction of their MP the opponent spent on each recent turn
+        * spends (deque): (MP held, fraction spent) of the opponent on each recent turn
+
+    """
+    def __init__(self, config, history, decay=0.8, player_index=1):
+        if not 0 < decay <= 1:
+            raise ValueError("decay must be more than 0 and at most 1, got {}".format(decay))
+        self.config = config
+        self.schedule = ResourceSchedule.for_config(config)
+        self.decay = decay
+        self.player_index = player_index
+        self.build_scores = {}
+        self.spend_fractions = deque(maxlen=history.max_turns)
+        self.spends = deque(maxlen=history.max_turns)
+        self._weight = 1.0
+        self._last_stats = None
+        history.add_listener(self.update)
+
+    def update(self, record, history):
+        """Updates the forecast with a new turn, called by the TurnHistory
+
+        Args:
+            record: The new TurnRecord
+            history: The TurnHistory it was added to
+
+        """
+        # Rather than decaying every score, newer builds weigh more
+        self._weight /= self.decay
+        if self._weight > 1e12:
+            self.__rescale()
+        for index, type_index, player_index, upgraded in record.added:
+            if player_index == self.player_index:
+                scores = self.build_scores.setdefault(index, {})
+                scores[type_index] = scores.get(type_index, 0.0) + self._weight
+        # A destroyed structure is likely to be rebuilt
+        for index, type_index, player_index, upgraded in record.removed:
+            if player_index == self.player_index and index not in history.structures:
+                scores = self.build_scores.setdefault(index, {})
+                scores[type_index] = scores.get(type_index, 0.0) + self._weight
+
+        stats = record.stats[self.player_index]
+        # When all MP decays, what was kept tells nothing about what was spent
+        if self._last_stats is not None and self._last_stats[2] > 0 and self.schedule.decay < 1:
+            kept = stats[2] - self.schedule.income(record.turn_number)[0]
+            spent = self._last_stats[2] - kept / (1 - self.schedule.decay)
+            fraction = min(max(spent / self._last_stats[2], 0.0), 1.0)
+            self.spend_fractions.append(fraction)
+            self.spends.append((self._last_stats[2], fraction))
+        self._last_stats = stats
+
+    def __rescale(self):
+        for scores in self.build_scores.values():
+            for type_index in scores:
+                scores[type_index] /= self._weight
+        self._weight = 1.0
+
+    def predict_structures(self, history, count=10):
+        """Predicts where the opponent will build next
+
+        Tiles they often build on, or where their structures were often destroyed, come first.
+
+        Args:
+            history: The TurnHistory this predictor listens to
+            count: The maximum number of predictions
+
+        Returns:
+            A list of ([x, y], type_index, score) for free tiles, highest score first, scores sum to at most 1
+
+        """
+        predictions = []
+        total = 0.0
+        for index, scores in self.build_scores.items():
+            if index in history.structures:
+                continue
+            type_index, score = max(scores.items(), key=lambda item: item[1])
+            predictions.append((score, index, type_index))
+            total += sum(scores.values())
+        predictions.sort(reverse=True)
+        return [([index // ARENA_SIZE, index % ARENA_SIZE], type_index, score / total)
+                for score, index, type_index in predictions[:count]]
+
+    def predict_mp_spend(self, current_MP):
+        """Predicts how much MP the opponent will spend this turn
+
+        Args:
+            current_MP: The opponent's MP this turn
+
+        Returns:
+            The average fraction of their MP they spent on recent turns, times current_MP
+
+        """
+        if not self.spend_fractions:
+            return 0.0
+        return current_MP * sum(self.spend_fractions) / len(self.spend_fractions)
@@ -1,24 +1,53 @@
 import heapq
 import math
 import sys
-import queue
 from .util import debug_write
+from . import geometry
 
-class Node:
-    """A path-finding node
+class PathTable:
+    """The paths of a set of start locations, stored densely for bulk scoring
 
     Attributes :
-        * visited_idealness (bool): Have we visited this node during the idealness search step?
-        * visited_validate (bool): Have we visited this node during the validation step?
-        * blocked (bool): Is there a structures at this node's location
-        * pathlength: The distance between this node and the target location
+        * locations (list): The start locations, in the order they were requested
+        * paths (list): The path from each start location, or None if the start location is blocked
+        * indexes (list): Each path as a list of flat tile indexes (x * ARENA_SIZE + y), or an empty list if the start location is blocked
 
     """
-    def __init__(self):
-        self.visited_idealness = False
-        self.visited_validate = False
-        self.blocked = False
-        self.pathlength = -1
+    def __init__(self, locations, paths, arena_size=28):
+        self.locations = locations
+        self.paths = paths
+        self.indexes = [[x * arena_size + y for x, y in path] if path else [] for path in paths]
+
+    def __len__(self):
+        return len(self.locations)
+
+    def get_path(self, location):
+        """Gets the path from a start location in the table
+
+        Args:
+            location: One of the start locations of this table
+
+        Returns:
+            The path from that location, or None if it is blocked or not in the table
+
+        """
+        for start, path in zip(self.locations, self.paths):
+            if start[0] == location[0] and start[1] == location[1]:
+                return path
+        return None
+
+    def sum_along_paths(self, values):
+        """Sums a per tile value along every path
+
+        Args:
+            values: A sequence indexed by flat tile index, such as a threat map
+
+        Returns:
+            A list with the sum of values over the tiles of each path, None for blocked start locations
+
+        """
+        return [sum([values[index] for index in indexes]) if path else None for path, indexes in zip(self.paths, self.indexes)]
+
 
 """
 This class helps with pathfinding. We guarantee the results will
@@ -28,29 +57,120 @@ code to maximise time efficiency
 class ShortestPathFinder:
     """Handles path-finding
 
+    The pathfinder keeps a blocked mask and the distance fields computed by the validation
+    step between queries. Fields towards a set of endpoints are shared by every start location
+    that can reach those endpoints, and are repaired incrementally when structures are added or
+    removed on the game map instead of being recomputed from scratch.
+
+    Tiles are addressed by their flat index x * ARENA_SIZE + y, the same indexing used by the
+    structure arrays on GameMap.
+
     Attributes :
         * HORIZONTAL (int): A constant representing a horizontal movement
         * VERTICAL (int): A constant representing a vertical movement
+        * MAX_INCREMENTAL_CHANGES (int): Above this many structure changes since the last query, cached fields are rebuilt instead of repaired
 
         * game_state (:obj: GameState): The current gamestate
-        * game_map (:obj: GameMap): The current gamemap
 
     """
+    MAX_INCREMENTAL_CHANGES = 32
+
     def __init__(self):
         self.HORIZONTAL = 1
         self.VERTICAL = 2
         self.initialized = False
+        self.game_state = None
+        self._map = None
+        self._synced_changes = 0
+        self._blocked = None
+        self._in_bounds = None
+        self._neighbors = None
+        self._edge_fields = {}
+        self._pocket_fields = {}
+        self._last_field = None
 
     def initialize_map(self, game_state):
-        """Initializes the map
+        """Initializes the map, or brings the cached blocked mask and distance fields up to date with it
 
         Args:
             game_state: A GameState object representing the gamestate we want to traverse
         """
-        #Initialize map 
         self.initialized = True
         self.game_state = game_state
-        self.game_map = [[Node() for x in range(self.game_state.ARENA_SIZE)] for y in range(self.game_state.ARENA_SIZE)]
+        self._sync(game_state.game_map)
+
+    def _sync(self, game_map):
+        """Replays the structure changes made on game_map since the last sync, or rebuilds the caches for a new map
+        """
+        if self._neighbors is None:
+            self._build_geometry(game_map)
+
+        changes = game_map._layout_changes
+        if self._map is not game_map or len(changes) - self._synced_changes > self.MAX_INCREMENTAL_CHANGES:
+            self._map = game_map
+            self._blocked = bytearray(type_index >= 0 for type_index in game_map.structure_types)
+            self._edge_fields = {}
+            self._pocket_fields = {}
+        else:
+            for index in changes[self._synced_changes:]:
+                blocked = game_map.structure_types[index] >= 0
+                if blocked != bool(self._blocked[index]):
+                    self._set_blocked(index, blocked)
+        self._synced_changes = len(changes)
+
+    def copy(self, source_map, game_map):
+        """Creates a pathfinder for a copy of a game map, starting from the fields cached for the original
+
+        Args:
+            * source_map: The map game_map was copied from
+            * game_map: The copied map
+
+        Returns:
+            A new ShortestPathFinder whose cache can be repaired independently of this one
+
+        """
+        finder = ShortestPathFinder()
+        if self._map is not source_map:
+            return finder
+        self._sync(source_map)
+        # Geometry is never modified, and pocket fields are replaced rather than repaired
+        finder._in_bounds = self._in_bounds
+        finder._neighbors = self._neighbors
+        finder._map = game_map
+        finder._synced_changes = len(game_map._layout_changes)
+        finder._blocked = bytearray(self._blocked)
+        finder._edge_fields = {key: list(field) for key, field in self._edge_fields.items()}
+        finder._pocket_fields = dict(self._pocket_fields)
+        return finder
+
+    def transfer(self, source_map, game_map):
+        """Creates a pathfinder for an unrelated map with a similar layout, such as the map of the next turn,
+        starting from the fields cached for source_map
+
+        Args:
+            * source_map: The map this pathfinder was last used with
+            * game_map: The map to use the new pathfinder with
+
+        Returns:
+            A new ShortestPathFinder, with empty caches if the layouts differ on more than MAX_INCREMENTAL_CHANGES tiles
+
+        """
+        finder = self.copy(source_map, game_map)
+        if finder._map is not game_map:
+            return finder
+        changed = [index for index, type_index in enumerate(game_map.structure_types) 
+                   if (type_index >= 0) != bool(finder._blocked[index])]
+        if len(changed) > self.MAX_INCREMENTAL_CHANGES:
+            return ShortestPathFinder()
+        for index in changed:
+            finder._set_blocked(index, game_map.structure_types[index] >= 0)
+        return finder
+
+    def _build_geometry(self, game_map):
+        """Uses the in bounds mask and neighbor lists of every tile from the geometry module
+        """
+        self._in_bounds = geometry.VALID_MASK
+        self._neighbors = geometry.NEIGHBORS
 
     def navigate_multiple_endpoints(self, start_point, end_points, game_state):
         """Finds the path a unit would take to reach a set of endpoints
@@ -68,44 +188,81 @@ class ShortestPathFinder:
         if game_state.contains_stationary_unit(start_point):
             return
 
-        #Initialize map 
         self.initialize_map(game_state)
-        #Fill in walls
-        for location in self.game_state.game_map:
-            if self.game_state.contains_stationary_unit(location):
-                self.game_map[location[0]][location[1]].blocked = True
-        #Do pathfinding
-        ideal_endpoints = self._idealness_search(start_point, end_points)
-        self._validate(ideal_endpoints, end_points)
-        return self._get_path(start_point, end_points)
+        field = self._get_field(start_point, end_points)
+        self._last_field = field
+        return self._get_path(start_point, end_points, field)
 
-    def _idealness_search(self, start, end_points):
-        """
-        Finds the most ideal tile in our 'pocket' of pathable space. 
-        The edge if it is available, or the best self destruct location otherwise
-        """
-        current = queue.Queue()
-        current.put(start)
-        best_idealness = self._get_idealness(start, end_points)
-        self.game_map[start[0]][start[1]].visited_idealness = True
-        most_ideal = start
+    def navigate_from_many(self, start_points, end_points, game_state):
+        """Finds the paths units at several start locations would take to reach the same set of endpoints
 
-        while not current.empty():
-            search_location = current.get()
-            for neighbor in self._get_neighbors(search_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
-                    continue
+        The validation search towards end_points is done once and shared by every start location.
 
-                x, y = neighbor
-                current_idealness = self._get_idealness(neighbor, end_points)
+        Args:
+            * start_points: A list of starting locations
+            * end_points: The end points of the units, should be a list of edge locations
+            * game_state: The current game state
 
-                if current_idealness > best_idealness:
-                    best_idealness = current_idealness
-                    most_ideal = neighbor
+        Returns:
+            A list of paths in the same order as start_points, with None for start locations that are blocked
 
-                if not self.game_map[x][y].visited_idealness and not self.game_map[x][y].blocked:
-                    self.game_map[x][y].visited_idealness = True
-                    current.put(neighbor)
+        """
+        self.initialize_map(game_state)
+        paths = []
+        for start_point in start_points:
+            if game_state.contains_stationary_unit(start_point):
+                paths.append(None)
+                continue
+            field = self._get_field(start_point, end_points)
+            self._last_field = field
+            paths.append(self._get_path(start_point, end_points, field))
+        return paths
+
+    def _get_field(self, start_point, end_points):
+        """Gets the distance field a unit at start_point follows, from the cache if possible
+        """
+        size = self.game_state.ARENA_SIZE
+        start = int(start_point[0]) * size + int(start_point[1])
+        key = tuple(int(x) * size + int(y) for x, y in end_points)
+
+        edge_field = self._edge_fields.get(key)
+        if edge_field is None:
+            edge_field = self._validate(key)
+            self._edge_fields[key] = edge_field
+        if edge_field[start] >= 0:
+            return edge_field
+
+        # The edge is unreachable, so the unit heads for the most ideal tile of its pocket instead
+        ideal_tile = self._idealness_search(start, end_points)
+        pocket_field = self._pocket_fields.get((key, ideal_tile))
+        if pocket_field is None:
+            pocket_field = self._validate((ideal_tile,))
+            self._pocket_fields[(key, ideal_tile)] = pocket_field
+        return pocket_field
+
+    def _idealness_search(self, start, end_points):
+        """
+        Finds the most ideal tile in our 'pocket' of pathable space.
+        Only called when no edge tile is reachable, so this is the best self destruct location
+        """
+        size = self.game_state.ARENA_SIZE
+        direction = self._get_direction_from_endpoints(end_points)
+        blocked = self._blocked
+        neighbors = self._neighbors
+
+        visited = {start}
+        current = [start]
+        most_ideal = start
+        best_idealness = -1
+        for index in current:
+            idealness = self._get_idealness([index // size, index % size], end_points, direction)
+            if idealness > best_idealness:
+                best_idealness = idealness
+                most_ideal = index
+            for neighbor in neighbors[index]:
+                if neighbor not in visited and not blocked[neighbor]:
+                    visited.add(neighbor)
+                    current.append(neighbor)
 
         return most_ideal
 
@@ -119,7 +276,7 @@ class ShortestPathFinder:
         """Prints a message to the games debug output
 
         Args:
-            * end_points: A set of endpoints, should be an edge 
+            * end_points: A set of endpoints, should be an edge
 
         Returns:
             A direction [x,y] representing the edge. For example, [1,1] for the top right and [-1, 1] for the top left
@@ -134,9 +291,9 @@ class ShortestPathFinder:
             direction[1] = -1
         return direction
 
-    def _get_idealness(self, location, end_points):
+    def _get_idealness(self, location, end_points, direction=None):
         """Get the idealness of a tile, the reachable tile the unit most wants to path to.
-        Better self destruct locations are more ideal. The endpoints are perfectly ideal. 
+        Better self destruct locations are more ideal. The endpoints are perfectly ideal.
 
         Returns:
             A location the unit will attempt to reach
@@ -144,69 +301,136 @@ class ShortestPathFinder:
         if location in end_points:
             return sys.maxsize
 
-        direction = self._get_direction_from_endpoints(end_points)
+        if direction is None:
+            direction = self._get_direction_from_endpoints(end_points)
 
         idealness = 0
         if direction[1] == 1:
             idealness += 28 * location[1]
-        else: 
+        else:
             idealness += 28 * (27 - location[1])
         if direction[0] == 1:
             idealness += location[0]
-        else: 
+        else:
             idealness += (27 - location[0])
 
         return idealness
 
-    def _validate(self, ideal_tile, end_points):
-        """Breadth first search of the grid, setting the pathlengths of each node
+    def _validate(self, seeds):
+        """Breadth first search of the grid from the given tile indexes, returning the pathlength of each tile
 
+        Blocked seeds keep a pathlength of 0 but are never expanded. Unreached tiles have a pathlength of -1.
         """
-        #VALIDATION
-        #Add our most ideal tiles to current
-        current = queue.Queue()
-        if ideal_tile in end_points:
-            for location in end_points:
-               current.put(location)
-               #Set current pathlength to 0
-               self.game_map[location[0]][location[1]].pathlength = 0
-               self.game_map[location[0]][location[1]].visited_validate = True
-        else:
-            current.put(ideal_tile)
-            self.game_map[ideal_tile[0]][ideal_tile[1]].pathlength = 0
-            self.game_map[ideal_tile[0]][ideal_tile[1]].visited_validate = True
-
-        #While current is not empty
-        while not current.empty():
-            current_location = current.get()
-            current_node = self.game_map[current_location[0]][current_location[1]]
-            for neighbor in self._get_neighbors(current_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
-                    continue
-
-                neighbor_node = self.game_map[neighbor[0]][neighbor[1]]
-                if not neighbor_node.visited_validate and not current_node.blocked:
-                    neighbor_node.pathlength = current_node.pathlength + 1
-                    neighbor_node.visited_validate = True
-                    current.put(neighbor)
+        blocked = self._blocked
+        neighbors = self._neighbors
+        field = [-1] * len(blocked)
+        current = []
+        for seed in seeds:
+            if field[seed] == -1:
+                field[seed] = 0
+                current.append(seed)
+
+        for index in current:
+            if blocked[index]:
+                continue
+            pathlength = field[index] + 1
+            for neighbor in neighbors[index]:
+                if field[neighbor] == -1 and not blocked[neighbor]:
+                    field[neighbor] = pathlength
+                    current.append(neighbor)
+        return field
+
+    def _set_blocked(self, index, blocked):
+        """Updates the blocked mask for a single tile and repairs the cached edge fields in place
+        """
+        self._blocked[index] = blocked
+        # Pockets can merge or split on any change, they are cheap to recompute on demand
+        self._pocket_fields = {}
+        for seeds, field in self._edge_fields.items():
+            if blocked:
+                self._repair_blocked(field, index, seeds)
+            else:
+                self._repair_unblocked(field, index, seeds)
 
-        #debug_write("Print after validate")
-        #self.print_map()
-        return
+    def _repair_blocked(self, field, index, seeds):
+        """Repairs a distance field after a tile that may have been on shortest paths becomes blocked
+        """
+        if field[index] == -1:
+            return
+        blocked = self._blocked
+        neighbors = self._neighbors
+
+        # Collect, level by level, the tiles that lose every neighbor one step closer to the seeds
+        affected = [index]
+        lost = {index}
+        for tile in affected:
+            pathlength = field[tile] + 1
+            for neighbor in neighbors[tile]:
+                if neighbor in lost or blocked[neighbor] or field[neighbor] != pathlength or neighbor in seeds:
+                    continue
+                supported = False
+                for support in neighbors[neighbor]:
+                    if field[support] == pathlength - 1 and not blocked[support] and support not in lost:
+                        supported = True
+                        break
+                if not supported:
+                    lost.add(neighbor)
+                    affected.append(neighbor)
+
+        if index not in seeds:
+            field[index] = -1
+        frontier = []
+        for tile in affected[1:]:
+            field[tile] = -1
+        for tile in affected[1:]:
+            for neighbor in neighbors[tile]:
+                if field[neighbor] >= 0 and not blocked[neighbor]:
+                    frontier.append((field[neighbor], neighbor))
+        heapq.heapify(frontier)
+        self._relax(field, frontier)
+
+    def _repair_unblocked(self, field, index, seeds):
+        """Repairs a distance field after a tile becomes free to path through
+        """
+        blocked = self._blocked
+        if index in seeds:
+            field[index] = 0
+        else:
+            best = -1
+            for neighbor in self._neighbors[index]:
+                if field[neighbor] >= 0 and not blocked[neighbor] and (best == -1 or field[neighbor] < best):
+                    best = field[neighbor]
+            field[index] = -1 if best == -1 else best + 1
+        if field[index] >= 0:
+            self._relax(field, [(field[index], index)])
+
+    def _relax(self, field, frontier):
+        """Propagates shorter pathlengths outward from a heap of (pathlength, index) tiles
+        """
+        blocked = self._blocked
+        neighbors = self._neighbors
+        while frontier:
+            pathlength, tile = heapq.heappop(frontier)
+            if pathlength != field[tile]:
+                continue
+            pathlength += 1
+            for neighbor in neighbors[tile]:
+                if not blocked[neighbor] and (field[neighbor] == -1 or field[neighbor] > pathlength):
+                    field[neighbor] = pathlength
+                    heapq.heappush(frontier, (pathlength, neighbor))
 
-    def _get_path(self, start_point, end_points):
+    def _get_path(self, start_point, end_points, field):
         """Once all nodes are validated, and a target is found, the unit can path to its target
 
         """
         #GET THE PATH
+        size = self.game_state.ARENA_SIZE
         path = [start_point]
         current = start_point
         move_direction = 0
 
-        while not self.game_map[current[0]][current[1]].pathlength == 0:
-            #debug_write("current tile {} has cost {}".format(current, self.game_map[current[0]][current[1]].pathlength))
-            next_move = self._choose_next_move(current, move_direction, end_points)
-            #debug_write(next_move)
+        while not field[int(current[0]) * size + int(current[1])] == 0:
+            next_move = self._choose_next_move(current, move_direction, end_points, field)
 
             if current[0] == next_move[0]:
                 move_direction = self.VERTICAL
@@ -214,32 +438,29 @@ class ShortestPathFinder:
                 move_direction = self.HORIZONTAL
             path.append(next_move)
             current = next_move
-        
-        #debug_write(path)
+
         return path
-  
-    def _choose_next_move(self, current_point, previous_move_direction, end_points):
+
+    def _choose_next_move(self, current_point, previous_move_direction, end_points, field):
         """Given the current location and adjacent locations, return the best 'next step' for a given unit to take
         """
+        size = self.game_state.ARENA_SIZE
         neighbors = self._get_neighbors(current_point)
-        #debug_write("Unit at {} previously moved {} and has these neighbors {}".format(current_point, previous_move_direction, neighbors))
 
         ideal_neighbor = current_point
-        best_pathlength = self.game_map[current_point[0]][current_point[1]].pathlength
+        best_pathlength = field[int(current_point[0]) * size + int(current_point[1])]
         for neighbor in neighbors:
-            #debug_write("Comparing champ {} and contender {}".format(ideal_neighbor, neighbor))
-            if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+            x, y = neighbor
+            if not (0 <= x < size and 0 <= y < size) or not self._in_bounds[x * size + y] or self._blocked[x * size + y]:
                 continue
 
             new_best = False
-            x, y = neighbor
-            current_pathlength = self.game_map[x][y].pathlength
+            current_pathlength = field[x * size + y]
 
             #Filter by pathlength
             if current_pathlength > best_pathlength:
                 continue
             elif current_pathlength < best_pathlength:
-                #debug_write("Contender has better pathlength at {} vs champs {}".format(current_pathlength, best_pathlength))
                 new_best = True
 
             #Filter by direction based on prev move
@@ -249,7 +470,6 @@ class ShortestPathFinder:
             ideal_neighbor = neighbor
             best_pathlength = current_pathlength
 
-        #debug_write("Gave unit at {} new tile {}".format(current_point, ideal_neighbor))
         return ideal_neighbor
 
     def _better_direction(self, prev_tile, new_tile, prev_best, previous_move_direction, end_points):
@@ -261,26 +481,26 @@ class ShortestPathFinder:
         if previous_move_direction == self.HORIZONTAL and not new_tile[0] == prev_best[0]:
             #We want to go up now. If we have not changed our y, we are not going up
             if prev_tile[1] == new_tile[1]:
-                return False 
+                return False
             return True
         if previous_move_direction == self.VERTICAL and not new_tile[1] == prev_best[1]:
             if prev_tile[0] == new_tile[0]:
                 #debug_write("contender {} has the same x coord as prev tile {} so we will keep best move {}".format(new_tile, prev_tile, prev_best))
                 return False
             return True
-        if previous_move_direction == 0: 
-            if prev_tile[1] == new_tile[1]: 
+        if previous_move_direction == 0:
+            if prev_tile[1] == new_tile[1]:
                 return False
             return True
-        
-        #To make it here, both moves are on the same axis 
+
+        #To make it here, both moves are on the same axis
         direction = self._get_direction_from_endpoints(end_points)
         if new_tile[1] == prev_best[1]: #If they both moved horizontal...
             if direction[0] == 1 and new_tile[0] > prev_best[0]: #If we moved right and right is our direction, we moved towards our direction
-                return True 
+                return True
             if direction[0] == -1 and new_tile[0] < prev_best[0]: #If we moved left and left is our direction, we moved towards our direction
-                return True 
-            return False 
+                return True
+            return False
         if new_tile[0] == prev_best[0]: #If they both moved vertical...
             if direction[1] == 1 and new_tile[1] > prev_best[1]: #If we moved up and up is our direction, we moved towards our direction
                 return True
@@ -290,18 +510,18 @@ class ShortestPathFinder:
         return True
 
     def print_map(self):
-        """Prints an ASCII version of the current game map for debug purposes
+        """Prints an ASCII version of the distance field used by the last path query for debug purposes
 
         """
-        if not self.initialized:
+        if not self.initialized or self._last_field is None:
             debug_write("Attempted to print_map before pathfinder initialization. Use 'this_object.initialize_map(game_state)' to initialize the map first")
             return
 
         for y in range(28):
             for x in range(28):
-                node = self.game_map[x][28 - y - 1]
-                if not node.blocked and not node.pathlength == -1:
-                    self._print_justified(node.pathlength)
+                index = x * 28 + (28 - y - 1)
+                if not self._blocked[index] and not self._last_field[index] == -1:
+                    self._print_justified(self._last_field[index])
                 else:
                     sys.stderr.write("   ")
             debug_write("")
@@ -0,0 +1,208 @@
+_SCHEDULES = []
+
+
+class ResourceSchedule:
+    """The MP and SP income, MP decay and MP cap of every turn of a game, computed once from the game config
+
+    On turn t a player gains MP_income[t] MP after the MP they kept decays by bitDecayPerRound, and gains
+    SP_income[t] SP. Turns past the table are computed on demand.
+
+    MP_cap is an estimate, not a rule confirmed against the game engine: maxBits until turn roundStartBitRamp, 
+    then raised by bitRampBitCapGrowthRate every turnIntervalForBitCapSchedule turns. Projections only apply 
+    it when asked to with capped=True.
+    AlgoCore builds one when the config is received, GameState.project_future_MP shares it through for_config.
+
+    Attributes :
+        * decay (float): The fraction of the MP kept from the previous turn that is lost
+        * MP_income (tuple): MP gained at the start of each turn, indexed by turn number
+        * SP_income (tuple): SP gained at the start of each turn, indexed by turn number
+        * MP_cap (tuple): The estimated most MP a player can hold on each turn, indexed by turn number
+
+    """
+    TURNS = 200
+
+    def __init__(self, config, turns=TURNS):
+        self._resources = config["resources"]
+        self.decay = self._resources["bitDecayPerRound"]
+        self.MP_income = tuple(self.__MP_income(turn) for turn in range(turns))
+        self.SP_income = tuple(self.__SP_income(turn) for turn in range(turns))
+        self.MP_cap = tuple(self.__MP_cap(turn) for turn in range(turns))
+        self._projections = {}
+
+    @classmethod
+    def for_config(cls, config):
+        """Gets the schedule of a config, building it the first time only
+
+        Args:
+            config: A json object containing information about the game
+
+        Returns:
+            The ResourceSchedule of that config
+
+        """
+        for known_config, schedule in _SCHEDULES:
+            if known_config is config:
+                return schedule
+        schedule = cls(config)
+        # Keeping the config alive keeps its id from being reused
+        _SCHEDULES[:] = _SCHEDULES[-3:] + [(config, schedule)]
+        return schedule
+
+    def __MP_income(self, turn):
+        resources = self._resources
+        return resources["bitsPerRound"] + resources["bitGrowthRate"] * (turn // resources["turnIntervalForBitSchedule"])
+
+    def __SP_income(self, turn):
+        return self._resources["coresPerRound"]
+
+    def __MP_cap(self, turn):
+        resources = self._resources
+        cap = resources.get("maxBits", float("inf"))
+        ramp_start = resources.get("roundStartBitRamp")
+        if ramp_start is not None and turn >= ramp_start:
+            interval = resources.get("turnIntervalForBitCapSchedule", 1)
+            cap += resources.get("bitRampBitCapGrowthRate", 0) * ((turn - ramp_start) // interval + 1)
+        return cap
+
+    def income(self, turn):
+        """Gets the MP and SP gained at the start of a turn
+
+        Args:
+            turn: A turn number
+
+        Returns:
+            A tuple (MP income, SP income)
+
+        """
+        if turn < len(self.MP_income):
+            return self.MP_income[turn], self.SP_income[turn]
+        return self.__MP_income(turn), self.__SP_income(turn)
+
+    def cap(self, turn):
+        """Gets the estimated most MP a player can hold on a turn, see MP_cap
+
+        Args:
+            turn: A turn number
+
+        Returns:
+            The MP cap of that turn
+
+        """
+        if turn < len(self.MP_cap):
+            return self.MP_cap[turn]
+        return self.__MP_cap(turn)
+
+    def project_MP(self, MP, turn, turns_in_future=1, spent_fraction=0.0, capped=False):
+        """Predicts how much MP a player will have on a future turn
+
+        Results are cached, asking again for the same projection costs a dictionary lookup.
+
+        Args:
+            MP: The MP of the player on turn
+            turn: The current turn number
+            turns_in_future: How many turns to look forward
+            spent_fraction: The fraction of their MP the player spends every turn, 0 if they only save
+            capped: Whether to hold the MP under the estimated MP_cap every turn
+
+        Returns:
+            The MP the player will have turns_in_future turns after turn, rounded to 0.1 every turn like the game engine
+
+        """
+        key = (MP, turn, turns_in_future, spent_fraction, capped)
+        projected = self._projections.get(key)
+        if projected is not None:
+            return projected
+        kept = (1 - spent_fraction) * (1 - self.decay)
+        projected = MP
+        for current_turn in range(turn + 1, turn + turns_in_future + 1):
+            projected = projected * kept + self.income(current_turn)[0]
+            if capped:
+                projected = min(projected, self.cap(current_turn))
+            projected = round(projected, 1)
+        if len(self._projections) > 4096:
+            self._projections.clear()
+        self._projections[key] = projected
+        return projected
+
+    def project_SP(self, SP, turn, turns_in_future=1):
+        """Predicts how much SP a player will have on a future turn if they spend none
+
+        Args:
+            SP: The SP of the player on turn
+            turn: The current turn number
+            turns_in_future: How many turns to look forward
+
+        Returns:
+            The SP the player will have turns_in_future turns after turn, not counting SP from damage or supports
+
+        """
+        return SP + sum(self.income(current_turn)[1] for current_turn in range(turn + 1, turn + turns_in_future + 1))
+
+
+class AttackForecaster:
+    """Estimates when the opponent will launch their next large attack
+
+    A large attack is a turn on which the opponent spent at least attack_fraction of their MP. The forecaster
+    learns how much MP they tend to hold when they attack and how much they spend on other turns from an
+    EnemyPredictor, and projects their MP with a ResourceSchedule until it reaches that level.
+
+    Attributes :
+        * schedule (ResourceSchedule): The resource schedule of the game
+        * predictor (EnemyPredictor): The source of the opponent's past spending
+        * attack_fraction (float): The fraction of their MP the opponent must spend for a turn to count as an attack
+        * capped (bool): Whether projections apply the estimated MP cap of the schedule, and an opponent at the 
+          cap is expected to attack
+
+    """
+    def __init__(self, schedule, predictor, attack_fraction=0.5, capped=False):
+        self.schedule = schedule
+        self.predictor = predictor
+        self.attack_fraction = attack_fraction
+        self.capped = capped
+
+    def attack_MP(self):
+        """Gets the average MP the opponent held on the turns they attacked
+
+        Returns:
+            The average MP, or None if they have not attacked yet
+
+        """
+        attacks = [MP for MP, fraction in self.predictor.spends if fraction >= self.attack_fraction]
+        if not attacks:
+            return None
+        return sum(attacks) / len(attacks)
+
+    def saving_fraction(self):
+        """Gets the average fraction of their MP the opponent spent on the turns they did not attack
+
+        Returns:
+            The average fraction, 0 if every observed turn was an attack
+
+        """
+        fractions = [fraction for MP, fraction in self.predictor.spends if fraction < self.attack_fraction]
+        if not fractions:
+            return 0.0
+        return sum(fractions) / len(fractions)
+
+    def predict_attack(self, enemy_MP, turn_number, horizon=10):
+        """Predicts the next large attack of the opponent
+
+        Args:
+            enemy_MP: The opponent's MP this turn
+            turn_number: The current turn number
+            horizon: How many turns to look forward
+
+        Returns:
+            A tuple (turns from now, MP they will hold), 0 turns meaning this turn, or None if they have not attacked
+            yet or are not expected to within the horizon
+
+        """
+        attack_MP = self.attack_MP()
+        if attack_MP is None:
+            return None
+        spent_fraction = self.saving_fraction()
+        for turns in range(horizon + 1):
+            MP = enemy_MP if turns == 0 else self.schedule.project_MP(enemy_MP, turn_number, turns, spent_fraction, self.capped)
+            if MP >= attack_MP or (self.capped and MP >= self.schedule.cap(turn_number + turns)):
+                return turns, MP
+        return None
@@ -0,0 +1,186 @@
+import json
+import threading
+import time
+
+from .util import send_commands, debug_write, flush_debug
+
+_ACTIVE_BUDGET = None
+
+def active_budget():
+    """Returns the TurnBudget of the turn being played, or None outside of on_turn
+
+    """
+    return _ACTIVE_BUDGET
+
+
+class TurnBudget:
+    """Keeps track of the time left to submit the current turn.
+
+    AlgoCore makes one for every turn as soon as the turn message arrives and stores it in
+    self.turn_budget before calling on_turn. Long searches should check remaining() or expired() 
+    as they go, as anytime_search does, and submit before the deadline. 
+
+    The watchdog is only a last resort: just before the soft time limit it submits the fallback plan 
+    (an empty turn unless set_fallback was called), so a search that overran loses the rest of its 
+    work instead of health. It cannot stop on_turn, which keeps running, and whatever on_turn submits 
+    afterwards is dropped. Submitting is idempotent, only the first of GameState.submit_turn and the 
+    watchdog reaches the game engine.
+
+    Attributes :
+        * soft_limit (float): Seconds allowed by the game before going over time starts to cost health
+        * hard_limit (float): Seconds after which the game ends your turn for you
+        * margin (float): Seconds kept in reserve before the soft limit for sending the turn
+        * serialize_time (float): The longest set_fallback took to serialize a plan, also kept in reserve
+        * started_at (float): time.perf_counter() when the turn message was received
+        * submitted (bool): Whether the turn was already sent to the game engine
+        * timed_out (bool): Whether the watchdog had to submit the fallback plan
+
+    """
+    DEFAULT_MARGIN = 0.25
+
+    def __init__(self, soft_limit, hard_limit, margin=DEFAULT_MARGIN, started_at=None):
+        self.soft_limit = soft_limit
+        self.hard_limit = hard_limit
+        self.margin = margin
+        self.serialize_time = 0.0
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.submitted = False
+        self.timed_out = False
+        self._fallback = ("[]", "[]")
+        self._lock = threading.Lock()
+        self._timer = None
+
+    @classmethod
+    def from_config(cls, config, started_at=None, latency=0):
+        """Creates the budget of a turn from the timingAndReplay section of the game config
+
+        Args:
+            config: A json object containing information about the game
+            started_at: time.perf_counter() when the turn message was received, defaults to now
+            latency: Seconds lost outside of the algo last turn, added to the safety margin
+
+        Returns:
+            A new TurnBudget
+
+        """
+        timing = config.get("timingAndReplay", {}) if config else {}
+        soft_limit = timing.get("waitTimeBotSoft", 5000) / 1000
+        hard_limit = timing.get("waitTimeBotMax", 35000) / 1000
+        margin = min(cls.DEFAULT_MARGIN + max(latency, 0), soft_limit / 2)
+        return cls(soft_limit, hard_limit, margin, started_at)
+
+    @property
+    def deadline(self):
+        """time.perf_counter() value by which the turn should be submitted"""
+        return self.started_at + self.soft_limit - self.margin - self.serialize_time
+
+    def elapsed(self):
+        """Returns the seconds spent on this turn so far"""
+        return time.perf_counter() - self.started_at
+
+    def remaining(self):
+        """Returns the seconds left before the deadline, negative once it has passed"""
+        return self.deadline - time.perf_counter()
+
+    def expired(self):
+        """Returns True once the deadline has passed or the turn was submitted, searches should stop then"""
+        return self.submitted or time.perf_counter() >= self.deadline
+
+    def set_fallback(self, game_state):
+        """Sets the plan the watchdog submits if the deadline is reached
+
+        The build and deploy stacks are serialized right away, so the game state can keep being changed afterwards. 
+        The time that takes is kept in reserve before the deadline, since a large plan takes as long to submit.
+
+        Args:
+            game_state: The GameState holding the best plan found so far
+
+        """
+        started = time.perf_counter()
+        self._fallback = (json.dumps(game_state._build_stack), json.dumps(game_state._deploy_stack))
+        serialize_time = time.perf_counter() - started
+        if serialize_time > self.serialize_time:
+            self.serialize_time = serialize_time
+            if self._timer is not None:
+                # Bring the watchdog forward to the new deadline
+                self.__arm()
+
+    def submit(self, build_string, deploy_string):
+        """Sends the build and deploy lines of this turn, unless the turn was already submitted
+
+        Args:
+            build_string: The json encoded build stack
+            deploy_string: The json encoded deploy stack
+
+        Returns:
+            True if the lines were sent, False if the turn had already been submitted
+
+        """
+        with self._lock:
+            if self.submitted:
+                return False
+            self.submitted = True
+            send_commands(build_string, deploy_string)
+        return True
+
+    def start(self):
+        """Makes this the active budget and starts the watchdog"""
+        global _ACTIVE_BUDGET
+        _ACTIVE_BUDGET = self
+        self.__arm()
+
+    def __arm(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(self.remaining(), 0), self._on_deadline)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def finish(self):
+        """Stops the watchdog and clears the active budget, called by AlgoCore once on_turn returns"""
+        global _ACTIVE_BUDGET
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if _ACTIVE_BUDGET is self:
+            _ACTIVE_BUDGET = None
+
+    def _on_deadline(self):
+        if self.submit(*self._fallback):
+            self.timed_out = True
+            debug_write("Turn deadline reached after {:.2f}s, submitted the fallback plan".format(self.elapsed()))
+            # on_turn may never return, make sure this is written
+            flush_debug()
+
+
+def anytime_search(candidates, evaluate, budget=None, on_improve=None):
+    """Evaluates candidates until the budget runs out and returns the best one found so far
+
+    A candidate is not started if the slowest evaluation so far would not finish before the deadline.
+
+    Args:
+        candidates: An iterable of candidates, best guesses first
+        evaluate: A function from a candidate to a score, higher is better
+        budget: The TurnBudget to respect, defaults to the active one. Without a budget every candidate is evaluated
+        on_improve: An optional function called with (candidate, score) every time a better candidate is found,
+            for example to call budget.set_fallback
+
+    Returns:
+        A tuple (best candidate, best score), (None, None) if nothing was evaluated
+
+    """
+    if budget is None:
+        budget = active_budget()
+    best, best_score = None, None
+    slowest = 0
+    for candidate in candidates:
+        if budget is not None and (budget.expired() or budget.remaining() < slowest):
+            break
+        started = time.perf_counter()
+        score = evaluate(candidate)
+        slowest = max(slowest, time.perf_counter() - started)
+        if best_score is None or score > best_score:
+            best, best_score = candidate, score
+            if on_improve is not None:
+                on_improve(candidate, score)
+    return best, best_score
@@ -0,0 +1,419 @@
+import atexit
+
+from .unit import get_unit_type_table
+from .geometry import HALF_ARENA, DISTANCES
+from .diagnostics import SPAWN_INVALID_LOCATION, SPAWN_BLOCKED
+
+_DEATH_CONFIG = [None, None]
+
+def _get_mobile_rules(config):
+    """Reads the self destruct and breach rules of each unit type, once per config
+    """
+    if _DEATH_CONFIG[0] is config:
+        return _DEATH_CONFIG[1]
+    rules = {}
+    for type_config in config["unitInformation"]:
+        if "shorthand" not in type_config:
+            continue
+        rules[type_config["shorthand"]] = (
+            type_config.get("selfDestructDamageTower", 0),
+            type_config.get("selfDestructDamageWalker", 0),
+            type_config.get("selfDestructRange", 0),
+            type_config.get("selfDestructStepsRequired", 0),
+            type_config.get("playerBreachDamage", 1),
+        )
+    _DEATH_CONFIG[0] = config
+    _DEATH_CONFIG[1] = rules
+    return rules
+
+
+class SimulationResult:
+    """The predicted outcome of an action phase
+
+    Attributes :
+        * frames (int): The number of frames simulated
+        * breaches ([int, int]): The number of breaches scored by each player
+        * health_damage ([float, float]): The damage dealt to each player's health by breaches
+        * structure_damage ([float, float]): The total damage taken by each player's structures
+        * destroyed_structures (list): [x, y, player_index, unit_type] for each structure destroyed, in order
+        * outcomes (list): For each deployed unit, in the order given, one of "breach", "self_destruct", "destroyed", "alive"
+          or "invalid" for a deploy out of bounds or onto a structure, which is skipped
+        * remaining_health (list): For each deployed unit, in the order given, its health when it left the board or the simulation ended
+        * structure_health (list): The health of the structure on each tile at the end, indexed by flat tile index
+
+    """
+    def __init__(self, frames, breaches, health_damage, structure_damage, destroyed_structures, outcomes, remaining_health, structure_health):
+        self.frames = frames
+        self.breaches = breaches
+        self.health_damage = health_damage
+        self.structure_damage = structure_damage
+        self.destroyed_structures = destroyed_structures
+        self.outcomes = outcomes
+        self.remaining_health = remaining_health
+        self.structure_health = structure_health
+
+    def __repr__(self):
+        return "SimulationResult(frames={}, breaches={}, structure_damage={}, destroyed={})".format(
+            self.frames, self.breaches, self.structure_damage, len(self.destroyed_structures))
+
+
+def target_key(stationary, distance, health, x, y, player_index):
+    """Ranks a possible target under the targeting priority of GameState.get_target, lower ranks are attacked first
+
+    Args:
+        stationary: Whether the target is a structure
+        distance: The distance from the attacker to the target
+        health: The health of the target
+        x, y: The location of the target
+        player_index: The player controlling the attacker
+
+    Returns:
+        A tuple to compare with the keys of the other targets in range
+
+    """
+    return (1 if stationary else 0, distance, health, y if player_index == 0 else -y, -abs(HALF_ARENA - 0.5 - x))
+
+
+class ActionSimulator:
+    """Predicts the result of an action phase from the start of turn board and the units deployed on it.
+
+    Every frame is stepped in the order the game engine resolves it:
+
+        1. Each support shields the friendly mobile units in its range that it has not shielded yet.
+        2. Mobile units that are due to move take one step along their path. A unit that cannot move further
+           breaches if it stands on its target edge, and self destructs otherwise.
+        3. Every unit attacks the target get_target would choose for it.
+        4. Units reduced to 0 health are removed, and paths are recomputed if a structure was destroyed.
+
+    Unit state is kept in flat lists rather than GameUnit objects, and paths come from the cached pathfinder
+    of a clone of the game state, so many plans can be evaluated per turn. This is an estimate: the engine's
+    exact timing rules may differ in edge cases.
+
+    Attributes :
+        * game_state (:obj: GameState): The game state the simulations start from. It is never modified.
+        * max_frames (int): Simulations stop after this many frames even if mobile units remain
+
+    """
+    def __init__(self, game_state, max_frames=500):
+        """Prepares a simulator for the board of a game state
+
+        Args:
+            * game_state: The game state at the start of the action phase, including the structures built this turn
+            * max_frames: The maximum number of frames to simulate
+
+        """
+        self.game_state = game_state
+        self.max_frames = max_frames
+        self._size = game_state.ARENA_SIZE
+        self._hit_radius = game_state.config["unitInformation"][0]["getHitRadius"]
+        self._rules = _get_mobile_rules(game_state.config)
+
+    def simulate(self, deploys=None, enemy_deploys=()):
+        """Simulates an action phase
+
+        Args:
+            * deploys: A list of (unit_type, x, y) to deploy for you, in the format of the deploy stack. Defaults to the units you have spawned with attempt_spawn this turn.
+            * enemy_deploys: A list of (unit_type, x, y) to deploy for your opponent
+
+        Returns:
+            A SimulationResult. Its outcomes list your units first, then your opponent's.
+
+        """
+        if deploys is None:
+            deploys = self.game_state._deploy_stack
+        state = self.game_state.clone()
+        state.suppress_warnings(True)
+        game_map = state.game_map
+        size = self._size
+        in_bounds = game_map._in_bounds
+
+        # Structures, by flat tile index
+        structures = list(game_map._structures)
+        structure_hp = list(game_map.structure_health)
+        supports = []
+        attacking_structures = []
+        for index, unit in enumerate(structures):
+            if unit is None:
+                continue
+            if unit.shieldPerUnit > 0 and unit.shieldRange > 0:
+                supports.append(index)
+            if unit.damage_f > 0 or unit.damage_i > 0:
+                attacking_structures.append(index)
+
+        # Mobile units, one entry per unit in every list
+        stats = []
+        owner = []
+        xs = []
+        ys = []
+        hp = []
+        steps = []
+        move_timer = []
+        frames_per_move = []
+        target_edge = []
+        edge_tiles = []
+        paths = []
+        path_position = []
+        path_version = []
+        outcomes = []
+        mobiles_at = {}
+        invalid = []
+        for player_index, player_deploys in ((0, deploys), (1, enemy_deploys)):
+            for unit_type, x, y in player_deploys:
+                unit_id = len(stats)
+                unit_stats = self._get_stats(unit_type)
+                # An invalid deploy keeps its entry, so outcomes stay in the order given, but never enters the board
+                valid = False
+                if not game_map.in_arena_bounds([x, y]):
+                    self.game_state.warn("Could not simulate {} at {}, it is out of bounds", unit_type, [x, y], code=SPAWN_INVALID_LOCATION)
+                elif structures[x * size + y] is not None:
+                    self.game_state.warn("Could not simulate {} at {}, the tile is blocked by a structure", unit_type, [x, y], code=SPAWN_BLOCKED)
+                else:
+                    valid = True
+                edge = state.get_target_edge([x, y]) if valid else None
+                stats.append(unit_stats)
+                owner.append(player_index)
+                xs.append(x)
+                ys.append(y)
+                hp.append(unit_stats.max_health if valid else 0)
+                steps.append(0)
+                move_timer.append(0)
+                frames_per_move.append(max(1, int(round(1 / unit_stats.speed))) if unit_stats.speed > 0 else 0)
+                target_edge.append(edge)
+                edge_tiles.append(set(x * size + y for x, y in game_map.get_edge_locations(edge)) if valid else set())
+                paths.append(None)
+                path_position.append(0)
+                path_version.append(-1)
+                if valid:
+                    outcomes.append("alive")
+                    mobiles_at.setdefault(x * size + y, []).append(unit_id)
+                else:
+                    outcomes.append("invalid")
+                    invalid.append(unit_id)
+
+        alive = set(range(len(stats))).difference(invalid)
+        shielded = set()
+        breaches = [0, 0]
+        health_damage = [0.0, 0.0]
+        structure_damage = [0.0, 0.0]
+        destroyed = []
+        remaining_health = list(hp)
+
+        def in_range(x, y, radius):
+            for dx, dy in game_map.get_range_stencil(radius):
+                i = x + dx
+                j = y + dy
+                if 0 <= i < size and 0 <= j < size and in_bounds[i * size + j]:
+                    yield i, j, dx, dy
+
+        def remove_mobile(unit_id, outcome):
+            alive.discard(unit_id)
+            outcomes[unit_id] = outcome
+            remaining_health[unit_id] = hp[unit_id]
+            mobiles_at[xs[unit_id] * size + ys[unit_id]].remove(unit_id)
+
+        def damage_structure(index, amount):
+            if structure_hp[index] > 0:
+                structure_damage[structures[index].player_index] += min(amount, structure_hp[index])
+            structure_hp[index] -= amount
+
+        frame = 0
+        while alive and frame < self.max_frames:
+            frame += 1
+
+            # 1. Shielding
+            for index in supports:
+                support = structures[index]
+                if structure_hp[index] <= 0:
+                    continue
+                sx = index // size
+                sy = index % size
+                bonus_y = sy if support.player_index == 0 else size - 1 - sy
+                amount = support.shieldPerUnit + support.shieldBonusPerY * bonus_y
+                for i, j, _, _ in in_range(sx, sy, support.shieldRange):
+                    for unit_id in mobiles_at.get(i * size + j, ()):
+                        if owner[unit_id] == support.player_index and (index, unit_id) not in shielded:
+                            shielded.add((index, unit_id))
+                            hp[unit_id] += amount
+
+            # 2. Movement
+            for unit_id in sorted(alive):
+                if frames_per_move[unit_id] == 0:
+                    continue
+                move_timer[unit_id] += 1
+                if move_timer[unit_id] < frames_per_move[unit_id]:
+                    continue
+                move_timer[unit_id] = 0
+
+                if path_version[unit_id] != game_map.layout_version:
+                    paths[unit_id] = state.find_path_to_edge([xs[unit_id], ys[unit_id]], target_edge[unit_id])
+                    path_position[unit_id] = 0
+                    path_version[unit_id] = game_map.layout_version
+
+                path = paths[unit_id]
+                if path is None:
+                    # Boxed in, the unit waits where it is
+                    continue
+                if path_position[unit_id] + 1 < len(path):
+                    path_position[unit_id] += 1
+                    mobiles_at[xs[unit_id] * size + ys[unit_id]].remove(unit_id)
+                    xs[unit_id], ys[unit_id] = path[path_position[unit_id]]
+                    mobiles_at.setdefault(xs[unit_id] * size + ys[unit_id], []).append(unit_id)
+                    steps[unit_id] += 1
+                    continue
+
+                location = xs[unit_id] * size + ys[unit_id]
+                damage_tower, damage_walker, blast_range, steps_required, breach_damage = self._rules[stats[unit_id].unit_type]
+                if location in edge_tiles[unit_id]:
+                    breaches[owner[unit_id]] += 1
+                    health_damage[1 - owner[unit_id]] += breach_damage
+                    remove_mobile(unit_id, "breach")
+                    continue
+
+                remove_mobile(unit_id, "self_destruct")
+                if steps[unit_id] < steps_required:
+                    continue
+                for i, j, _, _ in in_range(xs[unit_id], ys[unit_id], blast_range):
+                    index = i * size + j
+                    if structures[index] is not None and structures[index].player_index != owner[unit_id]:
+                        damage_structure(index, damage_tower)
+                    for other in mobiles_at.get(index, ()):
+                        if owner[other] != owner[unit_id]:
+                            hp[other] -= damage_walker
+
+            # 3. Attacks
+            for index in attacking_structures:
+                if structure_hp[index] <= 0:
+                    continue
+                unit = structures[index]
+                target = self._choose_target(in_range, index // size, index % size, unit.player_index, unit.damage_f, unit.damage_i,
+                                             unit.attackRange, structures, structure_hp, mobiles_at, owner, hp, xs)
+                self._apply_attack(target, unit.damage_f, unit.damage_i, structures, damage_structure, hp)
+            for unit_id in sorted(alive):
+                unit_stats = stats[unit_id]
+                if hp[unit_id] <= 0 or (unit_stats.damage_f <= 0 and unit_stats.damage_i <= 0):
+                    continue
+                target = self._choose_target(in_range, xs[unit_id], ys[unit_id], owner[unit_id], unit_stats.damage_f, unit_stats.damage_i,
+                                             unit_stats.attackRange, structures, structure_hp, mobiles_at, owner, hp, xs)
+                self._apply_attack(target, unit_stats.damage_f, unit_stats.damage_i, structures, damage_structure, hp)
+
+            # 4. Removal
+            for unit_id in sorted(alive):
+                if hp[unit_id] <= 0:
+                    remove_mobile(unit_id, "destroyed")
+            for index, unit in enumerate(structures):
+                if unit is not None and structure_hp[index] <= 0:
+                    destroyed.append([index // size, index % size, unit.player_index, unit.unit_type])
+                    structures[index] = None
+                    structure_hp[index] = 0
+                    game_map.remove_unit([index // size, index % size])
+
+        for unit_id in alive:
+            remaining_health[unit_id] = hp[unit_id]
+        return SimulationResult(frame, breaches, health_damage, structure_damage, destroyed, outcomes, remaining_health,
+                                [max(0, health) for health in structure_hp])
+
+    def _get_stats(self, unit_type):
+        return get_unit_type_table(self.game_state.config)[unit_type]
+
+    def _choose_target(self, in_range, x, y, player_index, damage_f, damage_i, attack_range, structures, structure_hp, mobiles_at, owner, hp, xs):
+        """Applies the targeting priority of GameState.get_target to the simulated units
+
+        Returns:
+            ("structure", index), ("mobile", unit_id) or None
+        """
+        size = self._size
+        best_key = None
+        best = None
+        for i, j, dx, dy in in_range(x, y, attack_range):
+            index = i * size + j
+            distance = DISTANCES[dx * dx + dy * dy]
+            structure = structures[index]
+            if damage_f > 0 and structure is not None and structure.player_index != player_index and structure_hp[index] > 0:
+                key = target_key(True, distance, structure_hp[index], i, j, player_index)
+                if best_key is None or key < best_key:
+                    best_key = key
+                    best = ("structure", index)
+            if damage_i > 0:
+                for unit_id in mobiles_at.get(index, ()):
+                    if owner[unit_id] == player_index or hp[unit_id] <= 0:
+                        continue
+                    key = target_key(False, distance, hp[unit_id], i, j, player_index)
+                    if best_key is None or key < best_key:
+                        best_key = key
+                        best = ("mobile", unit_id)
+        return best
+
+    def _apply_attack(self, target, damage_f, damage_i, structures, damage_structure, hp):
+        if target is None:
+            return
+        kind, target_id = target
+        if kind == "structure":
+            damage_structure(target_id, damage_f)
+        else:
+            hp[target_id] -= damage_i
+
+
+_POOL = [None, 0]
+
+
+def shutdown_pool():
+    """Stops the worker processes started by simulate_many, if any, cancelling the plans they have not started
+
+    Called when the game ends and when the interpreter exits. A later call to simulate_many starts a new pool.
+
+    """
+    pool = _POOL[0]
+    if pool is not None:
+        _POOL[0] = None
+        _POOL[1] = 0
+        pool.shutdown(cancel_futures=True)
+
+
+atexit.register(shutdown_pool)
+
+
+def _simulate_chunk(game_state, max_frames, plans, enemy_deploys):
+    simulator = ActionSimulator(game_state, max_frames)
+    return [simulator.simulate(plan, enemy_deploys) for plan in plans]
+
+
+def simulate_many(game_state, plans, enemy_deploys=(), processes=None, max_frames=500):
+    """Simulates the action phase for many candidate deploys of the same board
+
+    The paths towards both target edges of each side are computed once before any plan is simulated,
+    and every simulation starts from those cached fields. With processes set, the plans are split into
+    one chunk per process and simulated by a process pool that is kept between calls, see shutdown_pool.
+
+    Args:
+        * game_state: The game state at the start of the action phase
+        * plans: A list of deploy lists, each a list of (unit_type, x, y) in the format of the deploy stack
+        * enemy_deploys: A list of (unit_type, x, y) deployed by your opponent in every plan
+        * processes: The number of worker processes to use, or None to simulate in this process
+        * max_frames: The maximum number of frames to simulate per plan
+
+    Returns:
+        A list of SimulationResult, in the same order as plans
+
+    """
+    # Warm the path cache shared by every clone of this game state
+    game_state.find_paths_from_edges(0)
+    if enemy_deploys:
+        game_state.find_paths_from_edges(1)
+
+    if not processes or processes < 2 or len(plans) < 2:
+        return _simulate_chunk(game_state, max_frames, plans, enemy_deploys)
+
+    from concurrent.futures import ProcessPoolExecutor
+    if _POOL[0] is None or _POOL[1] != processes:
+        if _POOL[0] is not None:
+            _POOL[0].shutdown()
+        _POOL[0] = ProcessPoolExecutor(max_workers=processes)
+        _POOL[1] = processes
+
+    chunk_size = -(-len(plans) // processes)
+    chunks = [plans[start:start + chunk_size] for start in range(0, len(plans), chunk_size)]
+    futures = [_POOL[0].submit(_simulate_chunk, game_state, max_frames, chunk, enemy_deploys) for chunk in chunks]
+    results = []
+    for future in futures:
+        results += future.result()
+    return results
@@ -1,7 +1,21 @@
 import unittest
 import json
+import io
+import os
+import sys
+import time
+import math
 from .game_state import GameState
+from .algocore import AlgoCore
 from .unit import GameUnit
+from .simulation import ActionSimulator, shutdown_pool
+from .scheduler import TurnBudget, anytime_search
+from .action_frame import ActionFrame, parse_turn_info, has_events
+from . import util
+from . import geometry
+from .diagnostics import Diagnostics, DIAGNOSTICS, SPAWN_BLOCKED, SPAWN_INVALID_LOCATION, OUT_OF_BOUNDS
+from .history import TurnHistory, EnemyPredictor
+from .resources import ResourceSchedule, AttackForecaster
 
 class BasicTests(unittest.TestCase):
 
@@ -192,6 +206,27 @@ class BasicTests(unittest.TestCase):
         state.suppress_warnings(True)
         return state
 
+    def test_parse_units(self):
+        game = self.make_turn_0_map()
+        turn = """{"p2Units":[[[13,20,75.0,"1"]],[],[[12,21,60.0,"2"]],[],[],[],[[13,20,0,"4"]],[[12,21,0,"5"]]],"turnInfo":[0,3,-1],"p1Stats":[29.0,12.0,7.5,1200],"p1Units":[[],[[14,5,30.0,"3"]],[],[[13,0,15.0,"6"],[13,0,15.0,"7"]],[],[],[],[]],"p2Stats":[27.0,3.0,9.0,900],"events":{}}"""
+        state = GameState(game.config, turn)
+        self.assertEqual(3, state.turn_number, "The turn number should be parsed")
+        self.assertEqual([12, 7.5], state.get_resources(0), "My resources should be parsed")
+        wall = state.contains_stationary_unit([13, 20])
+        self.assertEqual(1, wall.player_index, "The wall should belong to the enemy")
+        self.assertTrue(wall.pending_removal, "The wall should be marked for removal")
+        turret = state.contains_stationary_unit([12, 21])
+        self.assertTrue(turret.upgraded, "The turret should be upgraded")
+        self.assertEqual(3.5, turret.attackRange, "The turret should use its upgraded range")
+        self.assertEqual(60, turret.health, "The turret should keep its parsed health")
+        self.assertEqual(1, state.game_map.structure_upgraded[state.game_map.get_index([12, 21])], "The upgrade should be mirrored")
+        self.assertEqual(2, len(state.game_map[13, 0]), "Both scouts should be on the map")
+        self.assertEqual(0, state.game_map[13, 0][0].player_index, "The scouts should be mine")
+        self.assertEqual(2, state.game_map[13, 0][0].cost[1] + state.game_map[13, 0][1].cost[1], "Units should have their own cost lists")
+
+        self.assertIs(util.decode_state(turn), util.decode_state(turn), "The same string should only be decoded once")
+        self.assertIsNot(util.decode_state(turn), util.decode_state("".join(turn)), "Another string should be decoded again")
+
     def test_basic(self):
         self.assertEqual(True, True, "It's the end of the world as we know it, and I feel fine")
 
@@ -235,10 +270,147 @@ class BasicTests(unittest.TestCase):
             game.game_map.add_unit("FF", [13,13])
         self.assertEqual(1, len(game.game_map[13,13]), "Towers seem to be stacking")
         
+    def test_structure_arrays(self):
+        game = self.make_turn_0_map()
+        index = game.game_map.get_index([13, 13])
+        self.assertEqual(-1, game.game_map.structure_types[index], "An empty tile should have no structure type")
+        game.game_map.add_unit("EI", [13,13])
+        self.assertEqual(-1, game.game_map.structure_types[index], "Mobile units should not be tracked as structures")
+        game.game_map.add_unit("DF", [13,13], 1)
+        self.assertEqual(2, game.game_map.structure_types[index], "The turret type index should be stored")
+        self.assertEqual(1, game.game_map.get_structure_owner([13,13]), "The turret should belong to the enemy")
+        self.assertEqual(90, game.game_map.structure_health[index], "The turret health should be stored")
+        self.assertIs(game.game_map[13,13][0], game.contains_stationary_unit([13,13]), "The stored structure should be returned")
+        self.assertEqual(1, sum(game.game_map.get_structure_mask(1)), "Exactly one enemy structure should be marked")
+        self.assertEqual(0, sum(game.game_map.get_structure_mask(0)), "No friendly structure should be marked")
+
+        game.attempt_spawn("DF", [13, 6])
+        game.attempt_upgrade([13, 6])
+        self.assertEqual(1, game.game_map.structure_upgraded[game.game_map.get_index([13, 6])], "The upgrade should be mirrored")
+
+        game.game_map.remove_unit([13,13])
+        self.assertEqual(-1, game.game_map.structure_owners[index], "Removed structures should be cleared")
+        self.assertFalse(game.contains_stationary_unit([13,13]), "Removed structures should not block")
+
+    def test_pathing_cache(self):
+        game = self.make_turn_0_map()
+        path = game.find_path_to_edge([13, 0])
+        self.assertEqual([13, 0], path[0], "Paths should begin at the start location")
+        self.assertIn(path[-1], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT), "The path should reach the top right edge")
+        self.assertEqual(29, len(path), "The unobstructed path should take 28 steps")
+
+        # Wall off the rows above the start, the cached fields must be repaired rather than reused
+        wall = [[x, 2] for x in range(11, 17)]
+        for location in wall:
+            game.game_map.add_unit("FF", location, 1)
+        path = game.find_path_to_edge([13, 0])
+        self.assertNotIn(path[-1], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT), "The unit should be trapped and self destruct")
+        for location in path:
+            self.assertFalse(game.contains_stationary_unit(location), "Paths should not go through structures")
+
+        game.game_map.remove_unit([15, 2])
+        path = game.find_path_to_edge([13, 0])
+        self.assertIn(path[-1], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT), "The unit should escape through the opening")
+        self.assertIn([15, 2], path, "The unit should escape through the opening")
+
+    def test_paths_from_edges(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("FF", [5, 8], 0)
+        game.game_map.add_unit("DF", [20, 6], 0)
+        game.game_map.add_unit("FF", [3, 10], 0)
+        table = game.find_paths_from_edges()
+        self.assertEqual(28, len(table), "There should be a path for every friendly edge location")
+        for location, path in zip(table.locations, table.paths):
+            self.assertEqual(game.find_path_to_edge(location), path, "Shared paths should match single queries")
+
+        game.game_map.add_unit("FF", [13, 0], 0)
+        table = game.find_paths_from_edges()
+        self.assertIsNone(table.get_path([13, 0]), "Blocked locations should not have a path")
+        sums = table.sum_along_paths([1] * game.ARENA_SIZE ** 2)
+        self.assertEqual(len(table.get_path([14, 0])), sums[table.locations.index([14, 0])], "Summing ones should give the path length")
+
+    def test_adopt_caches(self):
+        speculative = self.make_turn_0_map()
+        speculative.game_map.add_unit("DF", [13, 6], 0)
+        speculative.game_map.add_unit("DF", [12, 6], 0)
+        speculative.game_map.add_unit("DF", [14, 14], 1)
+        speculative.find_paths_from_edges(0)
+        speculative.get_threat_map(1)
+
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 6], 0)
+        game.game_map.add_unit("DF", [14, 14], 1)
+        game.adopt_caches(speculative)
+        self.assertIsNone(game._threat_maps.get(1), "Threat maps of a different board should not be reused")
+        fresh = self.make_turn_0_map()
+        fresh.game_map.add_unit("DF", [13, 6], 0)
+        fresh.game_map.add_unit("DF", [14, 14], 1)
+        self.assertEqual(fresh.find_paths_from_edges(0).paths, game.find_paths_from_edges(0).paths, "Adopted paths should be repaired")
+
+        game.game_map.add_unit("DF", [12, 6], 0)
+        game.adopt_caches(speculative)
+        self.assertIs(speculative.get_threat_map(1), game.get_threat_map(1), "Threat maps of the same board should be reused")
+
+    def test_clone(self):
+        game = self.make_turn_0_map()
+        game.attempt_spawn("DF", [[13, 6], [10, 10]])
+        game.game_map.add_unit("FF", [13, 15], 1)
+        original_path = game.find_path_to_edge([13, 0])
+
+        clone = game.clone()
+        self.assertEqual(game._build_stack, clone._build_stack, "The clone should start with the same build stack")
+        clone.attempt_spawn("FF", [[12, 1], [13, 1], [14, 1], [15, 1]])
+        clone.attempt_upgrade([13, 6])
+        clone.attempt_spawn("PI", [14, 0], 2)
+
+        self.assertEqual(2, len(game._build_stack), "Spawning on the clone should not change the original stacks")
+        self.assertEqual([], game._deploy_stack, "Spawning on the clone should not change the original stacks")
+        self.assertEqual(21, game.get_resource(game.SP), "Spawning on the clone should not spend the original resources")
+        self.assertFalse(game.contains_stationary_unit([13, 1]), "Spawning on the clone should not change the original map")
+        self.assertFalse(game.contains_stationary_unit([13, 6]).upgraded, "Upgrading on the clone should not upgrade the original")
+        self.assertTrue(clone.contains_stationary_unit([13, 6]).upgraded, "The clone's structure should be upgraded")
+        self.assertIs(game.contains_stationary_unit([13, 15]), clone.contains_stationary_unit([13, 15]), "Untouched units should be shared")
+        self.assertEqual(original_path, game.find_path_to_edge([13, 0]), "The original paths should not change")
+        self.assertNotEqual(original_path, clone.find_path_to_edge([13, 0]), "The clone should path around its new walls")
+
+    def test_rollback(self):
+        game = self.make_turn_0_map()
+        game.attempt_spawn("DF", [13, 6])
+        start = game.savepoint()
+        game.attempt_spawn("FF", [[12, 1], [13, 1], [14, 1], [15, 1]])
+        inner = game.savepoint()
+        game.attempt_upgrade([13, 6])
+        game.attempt_spawn("PI", [14, 0], 2)
+        game.attempt_remove([12, 1])
+        self.assertTrue(game.contains_stationary_unit([13, 6]).upgraded, "The turret should be upgraded")
+
+        game.rollback(inner)
+        self.assertFalse(game.contains_stationary_unit([13, 6]).upgraded, "The upgrade should be undone")
+        self.assertEqual(0, game.game_map.structure_upgraded[game.game_map.get_index([13, 6])], "The upgrade should be undone")
+        self.assertEqual([], game.game_map[14, 0], "The scouts should be removed")
+        self.assertEqual(5, game.get_resource(game.MP), "The MP should be refunded")
+        self.assertEqual(5, len(game._build_stack), "Only the walls should remain queued")
+        self.assertNotIn([12, 1], game.find_path_to_edge([14, 0]), "The walls should still block")
+
+        game.rollback(start)
+        self.assertEqual([("DF", 13, 6)], game._build_stack, "Only the turret should remain queued")
+        self.assertEqual(23, game.get_resource(game.SP), "The SP should be refunded")
+        self.assertFalse(game.contains_stationary_unit([13, 1]), "The walls should be removed")
+        self.assertIn([13, 1], game.find_path_to_edge([13, 0]), "Paths should go through the removed walls")
+
+        game.commit()
+        game.attempt_spawn("FF", [13, 1])
+        game.rollback()
+        self.assertTrue(game.contains_stationary_unit([13, 1]), "Committed changes should not be undone")
+
     def test_get_units_in_range(self):
         game = self.make_turn_0_map()
         self.assertEqual(1, len(game.game_map.get_locations_in_range([13,13], 0)), "We should be in 0 range of ourself")
         self.assertEqual(37, len(game.game_map.get_locations_in_range([13,13], 3.5)), "Wrong number of tiles in range")
+        self.assertIs(game.game_map.get_range_stencil(3.5), game.game_map.get_range_stencil(3.5), "Stencils should be cached")
+        self.assertEqual(37, len(game.game_map.get_range_stencil(3.5)), "Wrong number of offsets in the stencil")
+        self.assertEqual(3, len(game.game_map.get_locations_in_range([13,0], 1)), "Out of bounds tiles should be skipped")
+        self.assertEqual(5, len(game.game_map.get_range_stencil(1, 0, True)), "Inclusive stencils should include the boundary")
 
     def _test_get_attackers(self):
         game = self.make_turn_0_map()
@@ -256,6 +428,400 @@ class BasicTests(unittest.TestCase):
         game.game_map.add_unit("DF", [14,14], 1)
         self.assertEqual(3, len(game.get_attackers([13,13], 0)), "We should be in danger from 3 places")
 
+    def test_threat_map(self):
+        game = self.make_turn_0_map()
+        self.assertEqual(0, game.get_threat([13, 13]), "Are we being threatened by a ghost?")
+        game.game_map.add_unit("DF", [12, 14], 1)
+        game.game_map.add_unit("DF", [15, 15], 1)
+        game.game_map.add_unit("EF", [13, 15], 1)
+        game.game_map.add_unit("DF", [13, 12], 0)
+        for location in [[13, 13], [12, 12], [14, 13], [16, 12], [10, 14]]:
+            expected = sum(unit.damage_i for unit in game.get_attackers(location, 0))
+            self.assertEqual(expected, game.get_threat(location), "Threat at {} should match get_attackers".format(location))
+
+        game.attempt_upgrade([13, 12])
+        game.game_map[15, 15][0].upgrade()
+        game.game_map.sync_location([15, 15])
+        self.assertEqual(20, game.get_threat([13, 13]), "Upgraded range and damage should be used")
+        self.assertEqual(15, game.get_threat([13, 14], 1), "The enemy should be threatened by our upgraded turret")
+        path = [[13, 13], [13, 12], [14, 12]]
+        self.assertEqual(sum(game.get_threat(location) for location in path), game.get_path_threat(path), "Path threat should sum the tiles")
+
+    def test_shield_map(self):
+        config = json.loads(json.dumps(self.make_turn_0_map().config))
+        config["unitInformation"][1].update({"shieldRange": 3, "shieldPerUnit": 2, "shieldBonusPerY": 0.5, "upgrade": {"shieldRange": 5}})
+        game = GameState(config, self.make_turn_0_map().serialized_string)
+        game.suppress_warnings(True)
+        game.game_map.add_unit("EF", [13, 5], 0)
+        game.game_map.add_unit("EF", [5, 10], 0)
+        game.game_map.add_unit("EF", [13, 22], 1)
+
+        self.assertEqual(4.5, game.get_path_shield([[13, 3], [13, 4], [12, 4]]), "A support should shield a unit once")
+        self.assertEqual(11.5, game.get_path_shield([[13, 3], [6, 10]]))
+        self.assertEqual(0, game.get_path_shield([[13, 3], [6, 10]], 1), "Enemy supports should not shield our units")
+        self.assertEqual(2 + 0.5 * 5, game.get_path_shield([[13, 20]], 1), "The Y bonus should count from the enemy's edge")
+        self.assertEqual(0, game.get_path_shield([[13, 0]]))
+        game.game_map[13, 5][0].upgrade()
+        game.game_map.sync_location([13, 5])
+        self.assertEqual(4.5, game.get_path_shield([[13, 0]]), "Upgraded range should be used")
+
+        paths = game.find_paths_from_edges(0)
+        self.assertEqual([game.get_path_shield(path) if path else None for path in paths.paths], game.get_path_shields(paths))
+
+    def location_of(self, unit):
+        return [unit.x, unit.y]
+
+    def test_get_targets(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 12], 0)
+        game.game_map.add_unit("PI", [13, 10], 0)
+        game.game_map.add_unit("FF", [13, 14], 1)
+        game.game_map.add_unit("PI", [14, 13], 1)
+        game.game_map.add_unit("PI", [12, 13], 1)
+        turret = game.game_map[13, 12][0]
+        self.assertEqual([12, 13], self.location_of(game.get_target(turret)), "Ties should go to the unit furthest from the center")
+        game.game_map[12, 13][0].health = 10
+        game.game_map[14, 13][0].health = 5
+        self.assertEqual([14, 13], self.location_of(game.get_target(turret)), "Lower health should come before the x position")
+        self.assertEqual([13, 10], self.location_of(game.get_target(game.game_map[14, 13][0])), "Mobile units should come before structures")
+
+        targets = game.get_targets()
+        self.assertEqual(4, len(targets), "Walls do not attack")
+        for attacker, target in targets:
+            self.assertIs(game.get_target(attacker), target)
+        game.game_map.remove_unit([13, 10])
+        self.assertEqual([13, 12], self.location_of(game.get_target(game.game_map[14, 13][0])), "Targets should follow changes to the map")
+
+    def test_simulate_action_phase(self):
+        game = self.make_turn_0_map()
+        simulator = ActionSimulator(game)
+        result = simulator.simulate([("PI", 13, 0)] * 3)
+        self.assertEqual([3, 0], result.breaches, "Scouts should breach an empty board")
+        self.assertEqual(["breach"] * 3, result.outcomes, "Every scout should breach")
+        self.assertEqual(3, result.health_damage[1], "Each breach should damage the enemy")
+
+        for x in range(7, 21):
+            game.game_map.add_unit("FF", [x, 6], 1)
+        result = simulator.simulate([("PI", 13, 0)] * 2)
+        self.assertEqual(["self_destruct"] * 2, result.outcomes, "Trapped scouts should self destruct")
+        self.assertGreater(result.structure_damage[1], 90, "Both blasts and the scouts attacks should damage the walls")
+        self.assertEqual([], game._deploy_stack, "Simulating should not change the game state")
+        self.assertEqual(75, game.game_map.structure_health[game.game_map.get_index([19, 6])], "Simulating should not damage the real map")
+
+        game = self.make_turn_0_map()
+        for x in range(14, 28):
+            game.game_map.add_unit("DF", [x, 14], 1)
+        result = ActionSimulator(game).simulate([("PI", 13, 0)] * 2)
+        self.assertEqual(["destroyed"] * 2, result.outcomes, "Scouts should not survive a line of turrets")
+
+    def test_simulate_invalid_deploys(self):
+        game = self.make_turn_0_map()
+        game.diagnostics = Diagnostics()
+        game.game_map.add_unit("FF", [13, 0], 0)
+        result = ActionSimulator(game).simulate([("PI", 13, 0), ("PI", 14, 0), ("PI", 30, 0)])
+        self.assertEqual(["invalid", "breach", "invalid"], result.outcomes, "Only the deploy on a free tile should enter the board")
+        self.assertEqual([1, 0], result.breaches, "Skipped deploys should not breach")
+        self.assertEqual(0, result.remaining_health[0], "Skipped deploys should have no health")
+        self.assertEqual(1, game.diagnostics.counts[SPAWN_BLOCKED], "A deploy onto a structure should be reported")
+        self.assertEqual(1, game.diagnostics.counts[SPAWN_INVALID_LOCATION], "A deploy out of bounds should be reported")
+
+    def test_simulate_many(self):
+        game = self.make_turn_0_map()
+        for x in range(14, 28):
+            game.game_map.add_unit("DF", [x, 14], 1)
+        plans = [[("PI", 13, 0)] * 3, [("EI", 13, 0)] * 3, [("PI", 3, 10)]]
+        results = game.simulate_deploys(plans)
+        single = ActionSimulator(game)
+        for plan, result in zip(plans, results):
+            self.assertEqual(single.simulate(plan).outcomes, result.outcomes, "Batched plans should match single simulations")
+        pooled = game.simulate_deploys(plans, processes=2)
+        self.assertEqual([result.outcomes for result in results], [result.outcomes for result in pooled], "Pooled plans should match")
+        shutdown_pool()
+        shutdown_pool()
+        pooled = game.simulate_deploys(plans, processes=2)
+        self.assertEqual([result.outcomes for result in results], [result.outcomes for result in pooled], "A new pool should start after a shutdown")
+        shutdown_pool()
+
+    def test_turn_budget(self):
+        game = self.make_turn_0_map()
+        game.attempt_spawn("DF", [13, 13])
+        output = io.StringIO()
+        errors = io.StringIO()
+        util.flush_debug()
+        stdout, sys.stdout = sys.stdout, output
+        stderr, sys.stderr = sys.stderr, errors
+        try:
+            budget = TurnBudget(0.05, 1, margin=0.01)
+            budget.set_fallback(game)
+            budget.start()
+            time.sleep(0.2)
+            game.submit_turn()
+            budget.finish()
+            util.flush_debug()
+        finally:
+            sys.stdout = stdout
+            sys.stderr = stderr
+        self.assertTrue(budget.timed_out, "The watchdog should submit at the deadline")
+        self.assertEqual(output.getvalue(), '[["DF", 13, 13]]\n[]\n', "The turn should be submitted exactly once")
+        self.assertIn("Turn deadline reached", errors.getvalue(), "The watchdog should say it submitted the fallback")
+
+        budget = TurnBudget(5, 10, margin=0.25)
+        deadline = budget.deadline
+        game._build_stack = [("FF", x, 13) for x in range(28)] * 200
+        budget.set_fallback(game)
+        self.assertGreater(budget.serialize_time, 0, "Serializing the fallback should be timed")
+        self.assertEqual(deadline - budget.serialize_time, budget.deadline, "The serializing time should be kept in reserve")
+
+    def test_default_on_turn(self):
+        output = io.StringIO()
+        stdout, sys.stdout = sys.stdout, output
+        try:
+            AlgoCore().on_turn("{}")
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(output.getvalue(), "[]\n[]\n", "Outside the game loop an empty turn should be sent directly")
+
+    def test_anytime_search(self):
+        best, score = anytime_search(range(5), lambda n: -abs(n - 3), TurnBudget(10, 10))
+        self.assertEqual((best, score), (3, 0))
+        best, score = anytime_search(range(5), lambda n: n, TurnBudget(0, 10))
+        self.assertEqual((best, score), (None, None), "Nothing should be evaluated after the deadline")
+
+    def test_action_frame(self):
+        game = self.make_turn_0_map()
+        frame_string = """{"turnInfo":[1,4,17],"events":{"breach":[[[3,10],1.0,3,"12",2]],"death":[[[5,8],0,"3",1,true]],"spawn": [ ],"damage":[]}}"""
+        self.assertEqual((1, 4, 17), parse_turn_info(frame_string))
+        self.assertTrue(has_events(frame_string, "breach"))
+        self.assertFalse(has_events(frame_string, "spawn"), "Empty event lists should be detected without decoding")
+        frame = ActionFrame(game.config, frame_string)
+        self.assertEqual(([3, 10], "PI", 1), (frame.breaches[0].location, frame.breaches[0].unit_type, frame.breaches[0].player_index))
+        self.assertEqual(("FF", 0, True), (frame.deaths[0].unit_type, frame.deaths[0].player_index, frame.deaths[0].removed_by_owner))
+        self.assertEqual([], frame.spawns)
+
+    def test_transport(self):
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b'{"turnInfo":[1,0,0]}\n{"turnInfo":[1,0,1]}\n')
+        os.close(write_fd)
+        stdin, sys.stdin = sys.stdin, os.fdopen(read_fd)
+        try:
+            self.assertEqual('{"turnInfo":[1,0,0]}\n', util.get_command(), "Lines read in one chunk should be split")
+            self.assertEqual('{"turnInfo":[1,0,1]}\n', util.get_command())
+        finally:
+            sys.stdin.close()
+            sys.stdin = stdin
+
+        errors = io.StringIO()
+        stderr, sys.stderr = sys.stderr, errors
+        try:
+            util.set_debug_level(0)
+            util.debug_write("hidden")
+            util.set_debug_level(1)
+            util.debug_write("shown")
+            util.flush_debug()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual("shown\n", errors.getvalue(), "Messages above the debug level should be dropped")
+
+        output = io.BytesIO()
+        wrapper = io.TextIOWrapper(output, encoding="utf-8")
+        stdout, sys.stdout = sys.stdout, wrapper
+        try:
+            sys.stdout.write("printed\n")
+            util.send_commands("[]", "[]")
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(b"printed\n[]\n[]\n", output.getvalue(), "Commands should come after text printed before them")
+        wrapper.detach()
+
+    def test_diagnostics(self):
+        class Unprintable:
+            def __format__(self, spec):
+                raise AssertionError("Dropped warnings should not be formatted")
+
+        diagnostics = Diagnostics(limit_per_turn=2)
+        errors = io.StringIO()
+        stderr, sys.stderr = sys.stderr, errors
+        try:
+            diagnostics.report(SPAWN_BLOCKED, "Blocked at {}", [1, 2])
+            diagnostics.report(SPAWN_BLOCKED, "Blocked at {}", [2, 2])
+            for _ in range(10):
+                diagnostics.report(SPAWN_BLOCKED, "Blocked at {}", Unprintable())
+            diagnostics.report(OUT_OF_BOUNDS, "Out of bounds {}", Unprintable(), show=False)
+            self.assertEqual("spawn_blocked x12 (2 shown)", diagnostics.summary(), "Suppressed warnings should be left out of the summary")
+            diagnostics.end_turn()
+            for _ in range(5):
+                diagnostics.report(SPAWN_BLOCKED, "Blocked at {}", Unprintable(), show=False)
+            self.assertEqual(5, diagnostics.suppressed[SPAWN_BLOCKED])
+            diagnostics.end_turn()
+            util.flush_debug()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual("Blocked at [1, 2]\nBlocked at [2, 2]\nWarnings this turn: spawn_blocked x12 (2 shown)\n", errors.getvalue(), 
+                         "A turn with only suppressed warnings should print nothing")
+        self.assertEqual({}, diagnostics.counts, "Counts should restart every turn")
+        self.assertEqual(17, diagnostics.totals[SPAWN_BLOCKED])
+        self.assertEqual(1, diagnostics.totals[OUT_OF_BOUNDS], "Suppressed warnings should still be counted")
+
+    def test_speculation_cancel(self):
+        game = self.make_turn_0_map()
+
+        class SlowAlgo(AlgoCore):
+            def speculate(self, game_state):
+                game_state.warn("Speculative warning", code=OUT_OF_BOUNDS)
+                started = time.perf_counter()
+                while not self.speculation_cancelled() and time.perf_counter() - started < 2:
+                    time.sleep(0.001)
+                return game_state.diagnostics.counts
+
+        algo = SlowAlgo()
+        algo.config = game.config
+        algo._AlgoCore__start_speculation(game.serialized_string, 0)
+        future = algo._speculating[1]
+        algo._AlgoCore__take_speculation(1)
+        started = time.perf_counter()
+        self.assertEqual({OUT_OF_BOUNDS: 1}, future.result()[1], "Speculative warnings should be counted apart")
+        self.assertLess(time.perf_counter() - started, 1, "The speculation should stop once the turn arrives")
+        self.assertIsNone(algo.speculative_state)
+        self.assertNotIn(OUT_OF_BOUNDS, DIAGNOSTICS.counts)
+        self.assertFalse(algo.speculation_cancelled(), "Only a speculation can be cancelled")
+
+        algo._AlgoCore__start_speculation(game.serialized_string, 1)
+        future = algo._speculating[1]
+        algo._AlgoCore__start_speculation(game.serialized_string, 1)
+        self.assertIs(future, algo._speculating[1], "Only one speculation should start per turn")
+        algo._AlgoCore__take_speculation(2)
+        future.result()
+        algo._speculator.shutdown()
+
+    def test_bulk_spawn(self):
+        game = self.make_turn_0_map()
+        row = [[x, 13] for x in range(28)]
+        self.assertEqual(25, game.attempt_spawn("FF", row + [[3, 20], [5, 13]]), "Spawning should stop at what we can afford")
+        self.assertEqual(0, game.get_resource(0), "Every SP should be spent")
+        self.assertEqual([["FF", x, 13] for x in range(25)], [list(command) for command in game._build_stack])
+        edge = game.game_map.get_edge_mask()
+        self.assertTrue(edge[game.game_map.get_index([0, 13])] & (1 << game.game_map.BOTTOM_LEFT))
+        self.assertFalse(edge[game.game_map.get_index([1, 13])])
+        self.assertEqual(5, game.attempt_spawn("PI", [(13, 0), [1, 13], [14, 0]], 3), "Mobile units should stack on edge tiles")
+
+    def test_geometry(self):
+        game = self.make_turn_0_map()
+        self.assertEqual(420, len(geometry.LOCATIONS), "There should be 420 playable tiles")
+        for number, (x, y) in enumerate(geometry.LOCATIONS):
+            self.assertEqual(number, geometry.CELL_NUMBERS[geometry.get_index([x, y])])
+        self.assertFalse(game.game_map.in_arena_bounds([0, 0]))
+        self.assertTrue(game.game_map.in_arena_bounds([13.5, 0]), "Non integer locations should still use the diamond arithmetic")
+        self.assertEqual(210, sum(geometry.BOTTOM_HALF_MASK), "Each player should own half the board")
+        self.assertEqual((13 * 28 + 1, 14 * 28 + 0), geometry.NEIGHBORS[13 * 28 + 0], "[13, 0] should only neighbor [13, 1] then [14, 0]")
+
+    def test_range_kernels(self):
+        game = self.make_turn_0_map()
+        for radius in [0, 1, 1.5, 2.5, 3.5, 4.5]:
+            for tolerance, inclusive in [(0, False), (0, True), (0.01, False)]:
+                squared = geometry.squared_range(radius, tolerance, inclusive)
+                expected = max(d for d in range(-1, 100) if d == -1 or math.sqrt(d) < radius + tolerance or (inclusive and math.sqrt(d) == radius + tolerance))
+                self.assertEqual(expected, squared, "Squared ranges should match the float comparison for radius {}".format(radius))
+        self.assertEqual(5.0, game.game_map.distance_between_locations([10, 10], [13, 14]))
+        self.assertEqual(0.5, game.game_map.distance_between_locations([13.5, 0], [13, 0]), "Non integer locations should still work")
+
+        tiles = geometry.tiles_in_range([[13, 0], [3, 10]], 1, 0.01)
+        self.assertEqual({13 * 28, 13 * 28 + 1, 14 * 28, 3 * 28 + 10, 3 * 28 + 11, 4 * 28 + 10}, tiles, "Only tiles on the board should be returned")
+        self.assertEqual({13 * 28}, geometry.tiles_in_range([[13, 0]], 1), "The range should be exclusive by default")
+        for radius, tolerance in [(2.5, 0.01), (3.5, 0), (4.5, 0.01)]:
+            stencil = game.game_map.get_range_stencil(radius, tolerance)
+            shells = geometry.get_range_shells(radius, tolerance)
+            self.assertEqual(sorted(map(tuple, stencil)), sorted(offset for _, offsets in shells for offset in offsets), "Shells should hold the stencil")
+            self.assertEqual({(13 + dx) * 28 + 13 + dy for dx, dy in stencil}, geometry.tiles_in_range([[13, 13]], radius, tolerance), 
+                             "Tiles in range should follow the stencil")
+        self.assertEqual({13 * 28, 13 * 28 + 1, 14 * 28}, geometry.tiles_in_range([[13, 0]], 1, 0, True))
+
+        game.game_map.add_unit("DF", [13, 12], 1)
+        game.game_map.add_unit("DF", [13, 9], 1)
+        game.game_map.add_unit("PI", [13, 15], 1)
+        self.assertEqual([[13, 9], [13, 12]], [[unit.x, unit.y] for unit in game.get_attackers([13, 11], 0)])
+        self.assertEqual([[13, 12], [13, 15]], [[unit.x, unit.y] for unit in game.get_attackers([14, 14], 0)], "Mobile units in range attack too")
+
+    def test_iterators(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        self.assertEqual(420 * 420, sum(1 for _ in game_map for _ in game_map), "Iterating over the map should be reentrant")
+        self.assertEqual([], list(game_map.occupied_locations()))
+        game_map.add_unit("DF", [13, 10], 1)
+        game_map.add_unit("FF", [3, 10], 1)
+        game_map.add_unit("DF", [20, 8], 0)
+        game_map.add_unit("PI", [14, 0], 0)
+        self.assertEqual([[14, 0], [20, 8], [3, 10], [13, 10]], list(game_map.occupied_locations()), "Occupied tiles should be in board order")
+        self.assertEqual([[3, 10], [13, 10]], list(game_map.structure_locations(1)))
+        self.assertEqual([[13, 10]], list(game_map.structure_locations(1, "DF")))
+        self.assertEqual([[14, 0]], list(game_map.type_locations("PI", 0)))
+        game_map.remove_unit([13, 10])
+        self.assertEqual([[3, 10]], list(game_map.structure_locations(1)), "Removed units should leave the index")
+        self.assertEqual([[20, 8], [3, 10]], list(game_map.copy().structure_locations()))
+
+    def test_count_units(self):
+        game = self.make_turn_0_map()
+        for x in range(0, 8):
+            game.game_map.add_unit("DF", [x, 14], 1)
+        game.game_map.add_unit("FF", [22, 15], 1)
+        game.game_map.add_unit("PI", [13, 27], 1)
+        game.game_map.add_unit("DF", [13, 5], 0)
+        self.assertEqual(8, game.count_units(1, "DF", (0, 7), (14, 17)))
+        self.assertEqual(4, game.count_units(1, x_range=(4, 13), y_range=(14, 14)), "Rectangles should be inclusive")
+        self.assertEqual(9, game.count_units(1, stationary=True))
+        self.assertEqual(0, game.count_units(1, x_range=(-5, -1)))
+        self.assertEqual({"DF": 8, "FF": 1, "PI": 1}, game.get_unit_counts(1))
+        game.game_map.remove_unit([0, 14])
+        self.assertEqual(7, game.count_units(1, "DF", (0, 7), (14, 17)), "Counts should follow changes to the map")
+
+    def test_turn_history(self):
+        game = self.make_turn_0_map()
+        history = TurnHistory(max_turns=3)
+        predictor = EnemyPredictor(game.config, history)
+
+        def state(turn, enemy_walls, enemy_MP, upgraded=()):
+            p2_units = [[[x, y, 60, ""] for x, y in enemy_walls], [], [], [], [], [], [], [[x, y, 60, ""] for x, y in upgraded]]
+            return {"turnInfo": [0, turn, -1], "p1Stats": [30, 10, 5, 0], "p2Stats": [30, 10, enemy_MP, 0],
+                    "p1Units": [[[13, 0, 60, ""]], [], [], [], [], [], [], []], "p2Units": p2_units}
+
+        history.record(state(0, [[3, 14]], 10))
+        history.record(state(1, [[3, 14], [4, 14]], 12.5, upgraded=[[3, 14]]))
+        record = history.record(state(2, [[4, 14]], 5 + 2.5 * 0.75))
+        self.assertEqual(((3 * 28 + 14, 0, 1, 1), ), record.removed)
+        self.assertEqual((), record.added)
+        self.assertEqual({3 * 28 + 14: (0, 1, 1), 4 * 28 + 14: (0, 1, 0), 13 * 28: (0, 0, 0)}, history.get_structures(1))
+        self.assertEqual(2, len(history.get_structures(2)), "Older turns should be rebuilt from the changes")
+
+        self.assertEqual([3, 14], predictor.predict_structures(history)[0][0], "The destroyed wall should be expected back")
+        self.assertAlmostEqual(4, predictor.predict_mp_spend(10), 5, "The opponent spent 0% then 80% of their MP")
+
+        history.record(state(3, [[4, 14]], 10))
+        self.assertEqual(3, len(history.records), "Only max_turns records should be kept")
+        self.assertIsNone(history.get_structures(3))
+
+    def test_resource_schedule(self):
+        game = self.make_turn_0_map()
+        schedule = ResourceSchedule.for_config(game.config)
+        self.assertIs(schedule, ResourceSchedule.for_config(game.config), "The schedule should be built once per config")
+        self.assertEqual((5, 5), schedule.income(0))
+        self.assertEqual((7, 5), schedule.income(25))
+        self.assertEqual([150, 155, 160], [schedule.cap(9), schedule.cap(10), schedule.cap(20)])
+        self.assertEqual(schedule.cap(1000), ResourceSchedule(game.config, turns=2000).cap(1000), "Turns past the table should match")
+        self.assertEqual(230, game.project_future_MP(1, current_MP=300), "MP should not be capped by default")
+        self.assertEqual(150, schedule.project_MP(300, 0, 1, capped=True), "Capped projections should not go over the cap")
+        self.assertEqual(30, schedule.project_SP(20, 0, 2))
+
+        with self.assertRaises(ValueError):
+            EnemyPredictor(game.config, TurnHistory(), decay=0)
+        predictor = EnemyPredictor(game.config, TurnHistory())
+        forecaster = AttackForecaster(schedule, predictor)
+        self.assertIsNone(forecaster.predict_attack(10, 5))
+        predictor.spends.extend([(10, 0.1), (20, 0.9), (10, 0.0), (22, 1.0)])
+        self.assertEqual(21, forecaster.attack_MP())
+        self.assertEqual((0, 25), forecaster.predict_attack(25, 5))
+        turns, MP = forecaster.predict_attack(12, 35)
+        self.assertEqual(MP, schedule.project_MP(12, 35, turns, 0.05))
+        self.assertTrue(turns > 1 and MP >= 21 > schedule.project_MP(12, 35, turns - 1, 0.05), "The attack should be the first turn with enough MP")
+
     def test_print_unit(self):
         game = self.make_turn_0_map()
 
@@ -264,6 +830,24 @@ class BasicTests(unittest.TestCase):
         expected_string = "Enemy FF, health: 75.0 location: [14, 13] removal:  upgrade: False "
         self.assertEqual(got_string, expected_string, "Expected {} from print_unit test got {} ".format(expected_string, got_string))
 
+    def test_unit_stats(self):
+        game = self.make_turn_0_map()
+        first = GameUnit("DF", game.config, 0, None, 3, 12)
+        second = GameUnit("DF", game.config, 1, 45, 4, 12)
+        self.assertFalse(hasattr(first, "__dict__"), "Units should not carry an instance dict")
+        self.assertEqual(90, first.health, "Units should start at full health")
+        self.assertEqual(45, second.health, "Units should keep the health they are given")
+        self.assertEqual(2.5, first.attackRange, "Units should read their type's range")
+
+        first.upgrade()
+        self.assertEqual(3.5, first.attackRange, "Upgrades should increase the range")
+        self.assertEqual([6.0, 0], first.cost, "Upgrade costs should be added to the base cost")
+        self.assertEqual(2.5, second.attackRange, "Upgrading one unit should not affect another")
+
+        second.damage_i = 100
+        self.assertEqual(100, second.damage_i, "Stats should be assignable")
+        self.assertEqual(5, GameUnit("DF", game.config).damage_i, "Assigning a stat should not affect other units")
+
     def test_future_MP(self):
         game = self.make_turn_0_map()
 
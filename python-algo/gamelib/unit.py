@@ -1,3 +1,6 @@
+import operator
+
+
 def is_stationary(unit_type, structure_types):
     """
         Args:
@@ -9,9 +12,112 @@ def is_stationary(unit_type, structure_types):
     return unit_type in structure_types
 
 
+_STAT_NAMES = ("stationary", "speed", "damage_f", "damage_i", "attackRange", "shieldRange",
+               "max_health", "shieldPerUnit", "shieldBonusPerY", "cost")
+
+class UnitStats:
+    """The static stats of a unit type, shared by every unit of that type
+
+    Attributes :
+        * unit_type (string): The unit type these stats belong to
+        * config (JSON): Contains information about the game
+        * upgraded (bool): Whether these are the stats of an upgraded unit
+        * upgraded_stats (:obj: UnitStats): The stats this unit type has once upgraded, None if these already are
+        * stationary, speed, damage_f, damage_i, attackRange, shieldRange, max_health, shieldPerUnit, shieldBonusPerY, cost: See GameUnit
+
+    """
+    __slots__ = ("unit_type", "config", "upgraded", "upgraded_stats", "upgrade_config") + _STAT_NAMES
+
+    def __init__(self, unit_type, config, type_config):
+        self.unit_type = unit_type
+        self.config = config
+        self.upgraded = False
+        self.upgraded_stats = None
+        self.upgrade_config = type_config.get("upgrade", {})
+        self.stationary = type_config.get("unitCategory") == 0
+        self.speed = type_config.get("speed", 0)
+        self.damage_f = type_config.get("attackDamageTower", 0)
+        self.damage_i = type_config.get("attackDamageWalker", 0)
+        self.attackRange = type_config.get("attackRange", 0)
+        self.shieldRange = type_config.get("shieldRange", 0)
+        self.max_health = type_config.get("startHealth", 0)
+        self.shieldPerUnit = type_config.get("shieldPerUnit", 0)
+        self.shieldBonusPerY = type_config.get("shieldBonusPerY", 0)
+        self.cost = (type_config.get("cost1", 0), type_config.get("cost2", 0))
+
+    def copy(self):
+        """Returns a copy of these stats that can be changed without affecting other units
+        """
+        stats = UnitStats.__new__(UnitStats)
+        for name in UnitStats.__slots__:
+            setattr(stats, name, getattr(self, name))
+        return stats
+
+    def apply_upgrade(self):
+        """Returns the stats after applying this unit type's upgrade config to these stats
+        """
+        upgrade = self.upgrade_config
+        stats = self.copy()
+        stats.upgraded = True
+        stats.upgraded_stats = None
+        stats.speed = upgrade.get("speed", self.speed)
+        stats.damage_f = upgrade.get("attackDamageTower", self.damage_f)
+        stats.damage_i = upgrade.get("attackDamageWalker", self.damage_i)
+        stats.attackRange = upgrade.get("attackRange", self.attackRange)
+        stats.shieldRange = upgrade.get("shieldRange", self.shieldRange)
+        stats.max_health = upgrade.get("startHealth", self.max_health)
+        stats.shieldPerUnit = upgrade.get("shieldPerUnit", self.shieldPerUnit)
+        stats.shieldBonusPerY = upgrade.get("shieldBonusPerY", self.shieldBonusPerY)
+        stats.cost = (upgrade.get("cost1", 0) + self.cost[0], upgrade.get("cost2", 0) + self.cost[1])
+        return stats
+
+
+_TYPE_TABLE = [None, None]
+
+def get_unit_type_table(config):
+    """Builds the stats shared by every unit of each type, once per config
+
+        Args:
+            config: The game config
+
+        Returns:
+            A dict mapping each unit type shorthand to its base UnitStats. 
+            The upgraded stats are available as upgraded_stats on each of them.
+    """
+    if _TYPE_TABLE[0] is config:
+        return _TYPE_TABLE[1]
+
+    table = {}
+    for type_config in config["unitInformation"]:
+        if "shorthand" not in type_config:
+            continue
+        stats = UnitStats(type_config["shorthand"], config, type_config)
+        stats.upgraded_stats = stats.apply_upgrade()
+        table[type_config["shorthand"]] = stats
+    _TYPE_TABLE[0] = config
+    _TYPE_TABLE[1] = table
+    return table
+
+
+def _stat_property(name):
+    def set_stat(self, value):
+        # Copy on write, the stats are shared with every other unit of this type
+        stats = self._stats.copy()
+        setattr(stats, name, value)
+        stats.upgraded_stats = None
+        self._stats = stats
+
+    # attrgetter resolves "_stats.<name>" in C, reads cost no Python level call
+    return property(operator.attrgetter("_stats." + name), set_stat)
+
+
 class GameUnit:
     """Holds information about a Unit. 
 
+    Units only store their position, owner, health and flags. Their other stats are shared 
+    by every unit of the same type and upgrade state, and are resolved once per config.
+    Assigning to a stat gives the unit its own copy of the stats.
+
     Attributes :
         * unit_type (string): This unit's type
         * config (JSON): Contains information about the game
@@ -32,49 +138,63 @@ class GameUnit:
         * upgraded (boolean): If this unit is upgraded
 
     """
+    __slots__ = ("unit_type", "player_index", "pending_removal", "upgraded", "x", "y", "health", "_stats")
+
     def __init__(self, unit_type, config, player_index=None, health=None, x=-1, y=-1):
         """ Initialize unit variables using args passed
 
         """
         self.unit_type = unit_type
-        self.config = config
         self.player_index = player_index
         self.pending_removal = False
         self.upgraded = False
         self.x = x
         self.y = y
-        self.__serialize_type()
-        self.health = self.max_health if not health else health
+        self._stats = get_unit_type_table(config)[unit_type]
+        self.health = self._stats.max_health if not health else health
 
-    def __serialize_type(self):
-        from .game_state import STRUCTURE_TYPES, UNIT_TYPE_TO_INDEX, SUPPORT
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]]
-        self.stationary = type_config["unitCategory"] == 0
-        self.speed = type_config.get("speed", 0)
-        self.damage_f = type_config.get("attackDamageTower", 0)
-        self.damage_i = type_config.get("attackDamageWalker", 0)
-        self.attackRange = type_config.get("attackRange", 0)
-        self.shieldRange = type_config.get("shieldRange", 0)
-        self.max_health = type_config.get("startHealth", 0)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", 0)
-        self.shieldBonusPerY = type_config.get("shieldBonusPerY", 0)
-        self.cost = [type_config.get("cost1", 0), type_config.get("cost2", 0)]
+    config = property(lambda self: self._stats.config)
+    stationary = _stat_property("stationary")
+    speed = _stat_property("speed")
+    damage_f = _stat_property("damage_f")
+    damage_i = _stat_property("damage_i")
+    attackRange = _stat_property("attackRange")
+    shieldRange = _stat_property("shieldRange")
+    max_health = _stat_property("max_health")
+    shieldPerUnit = _stat_property("shieldPerUnit")
+    shieldBonusPerY = _stat_property("shieldBonusPerY")
+
+    @property
+    def cost(self):
+        return list(self._stats.cost)
 
+    @cost.setter
+    def cost(self, value):
+        stats = self._stats.copy()
+        stats.cost = tuple(value)
+        stats.upgraded_stats = None
+        self._stats = stats
 
     def upgrade(self):
-        from .game_state import UNIT_TYPE_TO_INDEX
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]].get("upgrade", {})
-        self.speed = type_config.get("speed", self.speed)
-        self.damage_f = type_config.get("attackDamageTower", self.damage_f)
-        self.damage_i = type_config.get("attackDamageWalker", self.damage_i)
-        self.attackRange = type_config.get("attackRange", self.attackRange)
-        self.shieldRange = type_config.get("shieldRange", self.shieldRange)
-        self.max_health = type_config.get("startHealth", self.max_health)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", self.shieldPerUnit)
-        self.shieldBonusPerY = type_config.get("shieldBonusPerY", self.shieldBonusPerY)
-        self.cost = [type_config.get("cost1", 0) + self.cost[0], type_config.get("cost2", 0) + self.cost[1]]
+        if self._stats.upgraded_stats is not None:
+            self._stats = self._stats.upgraded_stats
+        else:
+            self._stats = self._stats.apply_upgrade()
         self.upgraded = True
 
+    def copy(self):
+        """Returns a copy of this unit that shares its stats
+        """
+        unit = GameUnit.__new__(GameUnit)
+        unit.unit_type = self.unit_type
+        unit.player_index = self.player_index
+        unit.pending_removal = self.pending_removal
+        unit.upgraded = self.upgraded
+        unit.x = self.x
+        unit.y = self.y
+        unit.health = self.health
+        unit._stats = self._stats
+        return unit
 
     def __toString(self):
         owner = "Friendly" if self.player_index == 0 else "Enemy"
@@ -1,41 +1,183 @@
+import atexit
+import io
+import json
+import os
 import sys
+import threading
+import time
 
+try:
+    # Optional, much faster json decoding when available
+    import orjson as _fast_json
+except ImportError:
+    try:
+        import ujson as _fast_json
+    except ImportError:
+        _fast_json = None
 
 BANNER_TEXT = "---------------- Starting Your Algo --------------------"
 
+READ_CHUNK_SIZE = 1 << 16
+DEBUG_FLUSH_SIZE = 1 << 14
+DEBUG_FLUSH_INTERVAL = 0.5
+
+_input_buffer = bytearray()
+_debug_lines = []
+_debug_state = {"level": 1, "size": 0, "flushed_at": time.perf_counter()}
+_debug_lock = threading.Lock()
+# (string, decoded state) of the last decode_state call
+_last_state = [None]
+
+
+def _read_line():
+    """Returns the next line of stdin as bytes, reading it in large chunks. Returns b"" at the end of the input.
+
+    """
+    try:
+        fileno = sys.stdin.fileno()
+    except (AttributeError, ValueError, io.UnsupportedOperation):
+        # Not a real file, such as a replaced sys.stdin
+        line = sys.stdin.readline()
+        return line.encode() if isinstance(line, str) else line
+
+    end = _input_buffer.find(b"\n")
+    while end == -1:
+        chunk = os.read(fileno, READ_CHUNK_SIZE)
+        if not chunk:
+            line = bytes(_input_buffer)
+            del _input_buffer[:]
+            return line
+        start = len(_input_buffer)
+        _input_buffer.extend(chunk)
+        end = _input_buffer.find(b"\n", start)
+    line = bytes(_input_buffer[:end + 1])
+    del _input_buffer[:end + 1]
+    return line
+
 
 def get_command():
     """Gets input from stdin
 
+    Stdin is read in chunks of READ_CHUNK_SIZE bytes and split on newlines. 
+    Pending debug output is flushed first, since the algo is about to wait.
+
     """
+    flush_debug()
     try:
-        ret = sys.stdin.readline()
+        ret = _read_line()
     except EOFError:
         # Game parent process terminated so exit
         debug_write("Got EOF, parent game process must have died, exiting for cleanup")
+        flush_debug()
         exit()
-    if ret == "":
+    if not ret:
         # Happens if parent game process dies, so exit for cleanup, 
         # Don't change or starter-algo process won't exit even though the game has closed
         debug_write("Got EOF, parent game process must have died, exiting for cleanup")
+        flush_debug()
         exit()
-    return ret
+    return ret.decode()
 
 def send_command(cmd):
     """Sends your turn to standard output.
     Should usually only be called by 'GameState.submit_turn()'
 
     """
-    sys.stdout.write(cmd.strip() + "\n")
+    send_commands(cmd)
+
+def send_commands(*cmds):
+    """Sends several lines to standard output in a single write, such as the build and deploy lines of a turn
+
+    Args:
+        cmds: The lines to send, without newlines
+
+    """
+    data = "".join(cmd.strip() + "\n" for cmd in cmds)
+    out = getattr(sys.stdout, "buffer", None)
+    if out is None:
+        sys.stdout.write(data)
+    else:
+        # Text printed earlier is still in the text layer, send it first to keep the order
+        sys.stdout.flush()
+        out.write(data.encode())
     sys.stdout.flush()
+    flush_debug()
 
-def debug_write(*msg):
+def set_debug_level(level):
+    """Sets which messages debug_write prints
+
+    Args:
+        level: Messages with a level above this one are dropped. 0 only keeps errors, 1 (the default) 
+            keeps the usual messages and warnings, 2 or more keeps detailed messages too
+
+    """
+    _debug_state["level"] = level
+
+def debug_write(*msg, level=1):
     """Prints a message to the games debug output
 
+    Messages are buffered, and written once DEBUG_FLUSH_SIZE characters are pending, 
+    DEBUG_FLUSH_INTERVAL seconds have passed since the last write, or the algo waits for or sends a turn.
+
     Args:
         msg: The message to output
+        level: How detailed the message is, see set_debug_level
 
     """
+    if level > _debug_state["level"]:
+        return
     #Printing to STDERR is okay and printed out by the game but doesn't effect turns.
-    sys.stderr.write(", ".join(map(str, msg)).strip() + "\n")
-    sys.stderr.flush()
+    line = ", ".join(map(str, msg)).strip() + "\n"
+    with _debug_lock:
+        _debug_lines.append(line)
+        _debug_state["size"] += len(line)
+        if (_debug_state["size"] < DEBUG_FLUSH_SIZE 
+                and time.perf_counter() - _debug_state["flushed_at"] < DEBUG_FLUSH_INTERVAL):
+            return
+    flush_debug()
+
+def flush_debug():
+    """Writes any buffered debug output to stderr
+
+    """
+    with _debug_lock:
+        _debug_state["flushed_at"] = time.perf_counter()
+        if not _debug_lines:
+            return
+        data = "".join(_debug_lines)
+        del _debug_lines[:]
+        _debug_state["size"] = 0
+        sys.stderr.write(data)
+        sys.stderr.flush()
+
+atexit.register(flush_debug)
+
+def json_loads(string):
+    """Decodes a json string sent by the game engine
+
+    Uses orjson or ujson when one of them is installed, and the standard json module otherwise.
+
+    Args:
+        string: The json string to decode
+
+    """
+    if _fast_json is not None:
+        return _fast_json.loads(string)
+    return json.loads(string)
+
+def decode_state(string):
+    """Decodes a game state string, reusing the result of the previous call if it was given the same string object
+
+    AlgoCore decodes each turn's state before on_turn, so a GameState built from the string on_turn receives 
+    does not decode it again. The result is shared, do not modify it.
+
+    Args:
+        string: The json string to decode
+
+    """
+    last = _last_state[0]
+    if last is not None and last[0] is string:
+        return last[1]
+    state = json_loads(string)
+    _last_state[0] = (string, state)
+    return state
@@ -195,6 +195,7 @@ try:
 	import random
 	import warnings
 	import argparse
+	import importlib.util
 	import subprocess
 	import multiprocessing as mp
 except ImportError as e:
@@ -226,6 +227,13 @@ except ImportError:
 			sys.exit()
 
 
+# geometry.py imports nothing from gamelib, so it is loaded on its own rather than with the whole package
+_geometry_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'python-algo', 'gamelib', 'geometry.py')
+_geometry_spec = importlib.util.spec_from_file_location('geometry', _geometry_path)
+geometry = importlib.util.module_from_spec(_geometry_spec)
+_geometry_spec.loader.exec_module(geometry)
+
+
 global FILTER, ENCRYPTOR, DESTRUCTOR, PING, EMP, SCRAMBLER, MAX_HP, GET_VERTS, SPEED, BLIT
 FILTER = 0     # wall
 ENCRYPTOR = 1  # support
@@ -1090,7 +1098,7 @@ class Graph:
 		p = PatchCollection(refs, color='lightgreen')
 		self.board_ax.add_collection(p)
 
-	# should look familiar... :)
+	# the board geometry is shared with the starter algo, see python-algo/gamelib/geometry.py
 	def in_arena_bounds(self, location):
 		"""Checks if the given location is inside the diamond shaped game board.
 
@@ -1101,30 +1109,10 @@ class Graph:
 			True if the location is on the board, False otherwise
 		
 		"""
-		x, y = location
-		full_board = 28
-		half_board = 14
-
-		row_size = y + 1
-		startx = half_board - row_size
-		endx = startx + (2 * row_size) - 1
-		top_half_check = (y < half_board and x >= startx and x <= endx)
-
-		row_size = (full_board - 1 - y) + 1
-		startx = half_board - row_size
-		endx = startx + (2 * row_size) - 1
-		bottom_half_check = (y >= half_board and x >= startx and x <= endx)
-
-		return bottom_half_check or top_half_check
+		return geometry.in_arena_bounds(location)
 
-	# should look familiar... :)
 	def __empty_grid(self):
-		grid = []
-		for x in range(28):
-			for y in range(28):
-				if self.in_arena_bounds((x,y)):
-					grid.append((x,y))
-		return grid
+		return sorted(geometry.LOCATIONS)
 
 
 # a simple data storage class to hold the data for a single frame